@@ -0,0 +1,246 @@
+"""Benchmark suite for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Synthetic cabspotting files ('lat lon busy time' lines, the newest point first) are generated
+for several scales, the stages of the pipeline run on them with provider.LocalProvider instead
+of a navigation provider. Time, throughput (dataset points per second) and peak memory of each stage
+and of the end-to-end run are saved and compared with a stored baseline to catch regressions.
+
+Usage:
+    python benchmark.py --scales 10x1000 50x5000 --save-baseline
+    python benchmark.py --scales 10x1000 50x5000   # exit code 1 if a stage is slower than the baseline
+
+License: MIT
+"""
+
+import dsparse
+import enrich
+import iowork
+import pipeline
+import poiindex
+import provider
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def generate_trace(filename, points=1000, busy_ratio=0.5, interval=60, jitter=10, trip_points=30,
+                   center=(37.7749, -122.4194), speed=8.3, seed=0):
+    """write synthetic trace of one cab in cabspotting format
+        busy_ratio: share of points when the cab is busy, trip_points: mean number of points of a busy or free run
+        interval, jitter: seconds between points and max random deviation of it"""
+
+    rng = np.random.default_rng(seed)
+    steps = np.maximum(interval + rng.integers(-jitter, jitter + 1, points), 1)
+    times = 1211018404 + np.cumsum(steps)
+
+    # random walk with a heading that turns slowly, kept in ~10 km around the center
+    heading = np.cumsum(rng.normal(0, 0.3, points))
+    distance = steps * speed * rng.uniform(0.2, 1.0, points)
+    lat = center[0] + np.cumsum(distance * np.cos(heading)) / 111320.0
+    lon = center[1] + np.cumsum(distance * np.sin(heading)) / (111320.0 * np.cos(np.radians(center[0])))
+    reach = 10000 / 111320.0
+    lat = center[0] + reach - np.abs((lat - center[0] + reach) % (4 * reach) - 2 * reach) # reflect from the borders
+    lon = center[1] + reach - np.abs((lon - center[1] + reach) % (4 * reach) - 2 * reach)
+
+    # alternating busy and free runs with geometric lengths
+    busy = np.zeros(points, dtype=np.int64)
+    state = rng.random() < busy_ratio
+    i = 0
+    while i < points:
+        mean = trip_points * (busy_ratio if state else 1 - busy_ratio) * 2
+        length = rng.geometric(1 / max(mean, 1))
+        busy[i:i + length] = state
+        i += length
+        state = not state
+
+    with open(filename, 'w') as file_object:
+        for k in range(points - 1, -1, -1): # cabspotting files start with the newest point
+            file_object.write('{:.5f} {:.5f} {} {}\n'.format(lat[k], lon[k], busy[k], times[k]))
+
+
+def generate_dataset(directory, cabs=10, points=1000, busy_ratio=0.5, interval=60, jitter=10, seed=0):
+    """write 'new_<cab>.txt' files of synthetic cabs, return their paths"""
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    files = []
+    for cab in range(cabs):
+        filename = os.path.join(directory, 'new_cab{:04d}.txt'.format(cab))
+        generate_trace(filename, points, busy_ratio, interval, jitter, seed=seed * 100003 + cab)
+        files.append(filename)
+
+    return files
+
+
+def reset_state():
+    """forget POIs and popular times of previous runs, so each run does the same work"""
+
+    poiindex.default_index.clear()
+    if enrich.default_memo is not None:
+        enrich.default_memo.clear()
+
+
+def measure(func, make_args, repeat=3):
+    """best time of 'repeat' runs of func(*make_args()) and peak memory allocated by one run
+    make_args() prepares fresh input of each run, its time is not counted"""
+
+    seconds = []
+    for _ in range(repeat):
+        args = make_args()
+        reset_state()
+        start_time = time.perf_counter()
+        value = func(*args)
+        seconds.append(time.perf_counter() - start_time)
+    args = make_args()
+    reset_state()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(seconds), peak, value
+
+
+def get_windows(files, time_interval):
+    traces = [dsparse.parse_trace(filename) for filename in files]
+    busy = [dsparse.get_busy_directions(trace) for trace in traces]
+
+    return [dsparse.get_coor_between(directions, time_interval) for directions in busy if directions]
+
+
+def get_routes(files, time_interval, tracking_interval, max_routes):
+    """in time routes of LocalProvider between the first and the last points of windows"""
+
+    main = pipeline.get_main()
+
+    routes = []
+    for windows in get_windows(files, time_interval):
+        for direction in dsparse.cut_directions(windows, len(windows), time_interval / 60, tracking_interval) or []:
+            origin = '{},{}'.format(direction['path'][0]['lat'], direction['path'][0]['lon'])
+            destination = '{},{}'.format(direction['path'][-1]['lat'], direction['path'][-1]['lon'])
+            found = main.in_time_directions(main.get_directions(origin, destination), tracking_interval)
+            if found:
+                found[0]['filename'] = direction['path'][0].get('filename', 'benchmark')
+                routes.extend(main.decode_polylines(found))
+            if len(routes) >= max_routes:
+                return routes[:max_routes]
+
+    return routes
+
+
+def run_scale(files, tracking_interval=1800, time_interval=600, max_radius=1000, place_type=('restaurant',),
+              max_routes=50, repeat=3):
+    """time stages of the pipeline on files, return {stage: {'seconds', 'points_per_second', 'peak_bytes', 'items'}}"""
+
+    main = pipeline.get_main()
+
+    points = sum(len(dsparse.parse_trace(filename)) for filename in files)
+    place_type = list(place_type)
+    routes = get_routes(files, time_interval, tracking_interval, max_routes)
+    if routes:
+        waypoints = main.get_waypoints_for_poi(main.get_near_poi_polylines(copy.deepcopy(routes), max_radius,
+                                                                           place_type=place_type))
+
+    stages = [
+        ('sort_file', lambda: [dsparse.sort_file(f) for f in files], lambda: ()),
+        ('parse_trace', lambda: [dsparse.parse_trace(f) for f in files], lambda: ()),
+        ('segmentation', lambda traces: [dsparse.segment_trace(t, busy_only=True) for t in traces],
+         lambda: ([dsparse.parse_trace(f) for f in files],)),
+        ('get_coor_between', lambda busy: [dsparse.get_coor_between(d, time_interval) for d in busy],
+         lambda: ([d for d in (dsparse.get_busy_directions(dsparse.parse_trace(f)) for f in files) if d],)),
+        ('polyline_encode', lambda windows: [dsparse.encode_dataset_polyline(w) for w in windows],
+         lambda: (get_windows(files, time_interval),)),
+        ('poi_lookup', lambda directions: main.get_near_poi_polylines(directions, max_radius, place_type=place_type),
+         lambda: (copy.deepcopy(routes),)),
+        ('potential_visit_poi', lambda directions: main.potential_visit_poi(directions, tracking_interval),
+         lambda: (copy.deepcopy(waypoints),)),
+        ('end_to_end', lambda: pipeline.run(files, tracking_interval, time_interval, place_type=place_type), lambda: ()),
+    ]
+    if not routes: # POI stages need at least one in time route
+        stages = [stage for stage in stages if stage[0] not in ('poi_lookup', 'potential_visit_poi')]
+    results = {}
+    for name, func, make_args in stages:
+        seconds, peak, value = measure(func, make_args, repeat)
+        results[name] = {'seconds': seconds, 'points_per_second': points / seconds if seconds else 0.0,
+                         'peak_bytes': peak, 'items': len(value) if hasattr(value, '__len__') else value}
+
+    return {'points': points, 'routes': len(routes), 'stages': results}
+
+
+def run(scales, directory='temp/benchmark', repeat=3, **params):
+    """generate datasets of scales [(cabs, points per cab), ...] and time stages on each of them"""
+
+    provider.set_provider(provider.LocalProvider(), cache=False) # no network and no response cache between runs
+    report = {}
+    with pipeline.no_persistence(), contextlib.redirect_stdout(io.StringIO()): # stages print progress messages
+        for cabs, points in scales:
+            scale = '{}x{}'.format(cabs, points)
+            files = generate_dataset(os.path.join(directory, scale), cabs, points)
+            report[scale] = run_scale(files, repeat=repeat, **params)
+
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """[(scale, stage, baseline seconds, seconds)] of stages that are slower than the baseline by more than tolerance"""
+
+    regressions = []
+    for scale, data in report.items():
+        for name, stats in data['stages'].items():
+            base = baseline.get(scale, {}).get('stages', {}).get(name)
+            if base and stats['seconds'] > base['seconds'] * (1 + tolerance):
+                regressions.append((scale, name, base['seconds'], stats['seconds']))
+
+    return regressions
+
+
+def print_report(report):
+    for scale, data in report.items():
+        print("\nScale {}: {} points, {} routes".format(scale, data['points'], data['routes']))
+        print("{:<20} {:>10} {:>14} {:>12}".format('stage', 'seconds', 'points/s', 'peak MB'))
+        for name, stats in data['stages'].items():
+            print("{:<20} {:>10.4f} {:>14.0f} {:>12.2f}".format(name, stats['seconds'], stats['points_per_second'],
+                                                                 stats['peak_bytes'] / 1024**2))
+
+
+def parse_scale(text):
+    cabs, points = text.lower().split('x')
+    return int(cabs), int(points)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of CSPrivacy stages on synthetic cabspotting data")
+    parser.add_argument('--scales', nargs='+', type=parse_scale, default=[(5, 500), (20, 2000)],
+                        help="scales in 'cabs x points per cab' format, e.g. 10x1000")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each stage, the best time is used")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="baseline file")
+    parser.add_argument('--save-baseline', action='store_true', help="save results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown relative to the baseline")
+    args = parser.parse_args()
+
+    report = run(args.scales, repeat=args.repeat)
+    print_report(report)
+    iowork.save_as_json(report, 'benchmark')
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=1)
+        print("\nBaseline saved to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for scale, name, base, seconds in regressions:
+            print("REGRESSION! {} at scale {}: {:.4f} s, baseline {:.4f} s".format(name, scale, seconds, base))
+        if regressions:
+            exit(1)
+        print("\nNo regressions against", args.baseline)
@@ -8,12 +8,16 @@ Author: Andrey Shorov, ashxz47@gmail.com
 License: MIT
 """
 
+import instrument
 import iowork
+import polycodec
+import stagecache
 
-import polyline
 import os
 import time
 
+import numpy as np
+
 
 def get_data(filename, directory='data'):
     """get data from disk"""
@@ -30,6 +34,84 @@ def sort_rule(elem):
     return elem['time']
 
 
+class Trace:
+    """sorted columns of one cabspotting trace file
+    lat, lon: float64, busy: bool, time: int64 epoch seconds"""
+
+    __slots__ = ('lat', 'lon', 'busy', 'time', 'filename')
+
+    def __init__(self, lat, lon, busy, time, filename='unknown_filename'):
+        self.lat = lat
+        self.lon = lon
+        self.busy = busy
+        self.time = time
+        self.filename = filename
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, index):
+        """slice or index array returns a trace, integer index returns a row in sort_file() format,
+        lat and lon of the row are the shortest repr of the float, trailing zeros of the file are not kept"""
+
+        if isinstance(index, (slice, np.ndarray)): # slice returns a view, index array returns a copy
+            return Trace(self.lat[index], self.lon[index], self.busy[index], self.time[index], self.filename)
+        if index < 0:
+            index += len(self)
+        row = {
+            'lat': repr(float(self.lat[index])),
+            'lon': repr(float(self.lon[index])),
+            'busy': '1' if self.busy[index] else '0',
+            'time': str(int(self.time[index]))
+        }
+        if index == 0:
+            row['filename'] = self.filename
+        return row
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def coordinates(self):
+        """(n, 2) array of lat/lon pairs"""
+
+        return np.column_stack((self.lat, self.lon))
+
+    def rows(self, start=0, end=None):
+        """materialize rows in sort_file() format"""
+
+        return [self[i] for i in range(start, len(self) if end is None else end)]
+
+
+@instrument.stage()
+@stagecache.cached('load_trace')
+def load_trace(filename):
+    """parse file into typed columns and sort them by the numeric time, the result is cached"""
+
+    return parse_trace(filename)
+
+
+def parse_trace(filename):
+    """parse file into typed columns and sort them by the numeric time"""
+
+    with open(filename, 'r') as file_object:
+        columns = np.loadtxt(file_object, dtype=np.float64, ndmin=2)
+    if columns.size == 0:
+        columns = np.empty((0, 4), dtype=np.float64)
+    order = np.argsort(columns[:, 3], kind='stable')
+    columns = columns[order]
+    trace = Trace(np.ascontiguousarray(columns[:, 0]),
+                  np.ascontiguousarray(columns[:, 1]),
+                  columns[:, 2] != 0,
+                  columns[:, 3].astype(np.int64),
+                  os.path.basename(filename).rsplit('.', 1)[0]) # get only filename
+    print("Trace of {} points loaded and sorted by the time".format(len(trace)))
+
+    return trace
+
+
+@instrument.stage()
+@stagecache.cached('sort_file')
 def sort_file(filename):
     """sort file data by the time"""
 
@@ -55,46 +137,65 @@ def sort_file(filename):
     return data
 
 
+def get_time_windows(times, time_interval, max_points=61):
+    """pick the first point of each time_interval window with binary search over sorted times
+    Window k of a path covers (start + k*time_interval, start + (k+1)*time_interval), points exactly on
+    a window boundary are not taken, as in the old time_gap loop.
+    A new path starts when a window has no points (a gap in the data) or the path has max_points points,
+    the first point after the window starts it unless it lies on the boundary of the window.
+    return list of index arrays, one per path"""
+
+    times = np.asarray(times, dtype=np.int64)
+    windows = []
+    if len(times) == 0:
+        return windows
+    steps = np.arange(1, max_points + 1, dtype=np.int64) * time_interval
+    last = len(times) - 1
+    start = 0
+    while start <= last:
+        bounds = times[start] + steps
+        first = np.searchsorted(times, bounds, side='right') # first point of each window
+        hit = (first <= last) & (times[np.minimum(first, last)] < bounds + time_interval)
+        hit[-1] = False # path is full
+        taken = int(np.argmin(hit)) # windows before the first empty window
+        windows.append(np.concatenate(([start], first[:taken])))
+        start = int(first[taken]) # the first point after the gap starts a new path
+        if start <= last and times[start] == bounds[taken] + time_interval: # points on the boundary are skipped
+            start = int(np.searchsorted(times, times[start], side='right'))
+
+    return windows
+
+
+def sweep_time_windows(times, time_intervals, max_points=61):
+    """get_time_windows() for several time intervals of the same times"""
+
+    times = np.asarray(times, dtype=np.int64)
+    
+    return {interval: get_time_windows(times, interval, max_points) for interval in time_intervals}
+
+
+def get_times(path):
+    """time column of Trace or path rows as int64 array"""
+
+    if isinstance(path, Trace):
+        return path.time
+    return np.fromiter((int(line['time']) for line in path), dtype=np.int64, count=len(path))
+
+
+@instrument.stage()
+@stagecache.cached('get_coor_between', version=2)
 def get_coor_between(data, time_interval):
     """get coordinates from file return only coordinates in X seconds time interval"""
 
     if not data:
         return
-    path = []
     directions = []
-    time_gap = 1
-    orig_poly = {}
     for direct in data:
-        if len(path) > 1:
-            list_arg = {'path':path, 'original_polyline':{'points': orig_poly['points']}}
-            directions.append(list_arg)
-        path = []
-        last_time = '0'
-        for line in direct['path']:   
-            if last_time == '0':
-                last_time = line['time']
-                path.append(line)
-                orig_poly = {'points': direct['overview_polyline']['points']}
-                time_gap = 1
-            if (int(line['time']) - int(last_time) > time_interval*time_gap):  # if time of the line is more than time_interval
-                if (int(line['time']) - int(last_time) < time_interval*(time_gap+1)): # but still not exceeds time_interval+gap
-                    if time_gap >= 61:
-                        time_gap = 1
-                        last_time = line['time']
-                        list_arg = {'path':path, 'original_polyline':{'points': orig_poly['points']}}
-                        directions.append(list_arg)
-                        path = []
-                        path.append(line)
-                        continue
-                    path.append(line)
-                    time_gap += 1
-                elif (int(line['time']) - int(last_time) > time_interval*(time_gap+1)):
-                    time_gap = 1
-                    last_time = line['time']
-                    list_arg = {'path':path, 'original_polyline':{'points': orig_poly['points']}}
-                    directions.append(list_arg) 
-                    path = []
-                    path.append(line)
+        orig_poly = {'points': direct['overview_polyline']['points']}
+        for window in get_time_windows(get_times(direct['path']), time_interval):
+            if len(window) > 1: # one point is not a direction
+                path = [direct['path'][i] for i in window]
+                directions.append({'path': path, 'original_polyline': orig_poly})
     directions = encode_dataset_polyline(directions) # encode overview polyline for each direction
     try:
         directions[0]['path'][0]['filename'] = data[0]['path'][0]['filename']
@@ -106,28 +207,73 @@ def get_coor_between(data, time_interval):
     return directions
 
 
+def get_busy_column(data):
+    """busy column of Trace or sort_file() rows as bool array"""
+
+    if isinstance(data, Trace):
+        return data.busy
+    return np.fromiter((line['busy'] == '1' for line in data), dtype=bool, count=len(data))
+
+
+def get_busy_runs(busy):
+    """[start, end) index ranges of runs with the same busy value (run-length boundaries via diff)"""
+
+    busy = np.asarray(busy, dtype=np.int8)
+    if len(busy) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    bounds = np.flatnonzero(np.diff(busy)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(busy)]))
+
+    return np.column_stack((starts, ends)).astype(np.int64)
+
+
+def segment_trace(data, split_by=0, busy_only=False):
+    """get [start, end) index ranges of directions without copying any point
+        split_by: 0 - only busy or only free times paths, 1...n - get path contains number of lines
+        busy_only: keep only busy paths (used with split_by=0)
+    The last busy or free path is still in progress at the end of the data, so it is not returned."""
+
+    if split_by < 0:
+        raise ValueError("split_by parameter is negative")
+    if split_by > 0:
+        starts = np.arange(0, len(data) - split_by + 1, split_by, dtype=np.int64)
+        return np.column_stack((starts, starts + split_by))
+    
+    busy = get_busy_column(data)
+    ranges = get_busy_runs(busy)
+    ranges = ranges[ranges[:, 1] < len(busy)] # drop the path that is not finished
+    if busy_only:
+        ranges = ranges[busy[ranges[:, 0]]]
+    
+    return ranges
+
+
+def iter_trips(data, ranges):
+    """lazily yield trips of segment_trace() ranges: Trace views or lists of rows"""
+
+    for start, end in ranges:
+        yield data[int(start):int(end)]
+
+
+def get_paths(data, ranges):
+    """materialize segment_trace() ranges in {'path': rows} format"""
+
+    if isinstance(data, Trace):
+        return [{'path': data.rows(int(start), int(end))} for start, end in ranges]
+    return [{'path': path} for path in iter_trips(data, ranges)]
+
+
+@instrument.stage()
+@stagecache.cached('get_busy_directions')
 def get_busy_directions(data):
     """get directions only for busy times and convert them to ACSPrivacy format"""
 
     if not data:
         return
-    path = []
-    directions = []
-    last_busy = '0'
-
-    for line in data:
-        if line['busy'] == '1':
-            if last_busy == '0':
-                last_busy = '1'
-            path.append(line)
-            continue
-        if line['busy'] == '0':
-            if last_busy == '1':
-                directions.append({'path':path})
-                path = []
-                last_busy = '0'
+    directions = get_paths(data, segment_trace(data, busy_only=True))
     
-    if len(directions) <= 1 and len(directions[0]['path']) <= 1:
+    if not directions or (len(directions) == 1 and len(directions[0]['path']) <= 1):
         return
     directions[0]['path'][0]['filename'] = data[0]['filename']
     directions = encode_dataset_polyline(directions) # get polyline for original path
@@ -137,42 +283,20 @@ def get_busy_directions(data):
     return directions
 
 
+@instrument.stage()
+@stagecache.cached('get_all_directions')
 def get_all_directions(data, split_by=0):
     """get directions for busy and not busy times and convert them to CSPrivacy format
         split_by: 0 - only busy or only free times paths, 1...n - get path contains number of lines"""
 
     if not data:
         return
-    path = []
-    directions = []
-    
-    if split_by == 0:
-        last_busy = '0'
-        for line in data:
-            if line['busy'] == '1':
-                if last_busy == '0':
-                    directions.append({'path':path})
-                    path = []
-                    last_busy = '1'
-                path.append(line)
-                continue
-            if line['busy'] == '0':
-                if last_busy == '1':
-                    directions.append({'path':path})
-                    path = []
-                    last_busy = '0'
-                path.append(line)
-    elif split_by > 0: 
-        for i, line in enumerate(data):
-            path.append(line)
-            if i == split_by:
-                directions.append({'path':path})
-                path = []
-                split_by += split_by
-    else:
+    if split_by < 0:
         print("split_by parameter is negative. Exiting...")
         exit(1)
-
+    directions = get_paths(data, segment_trace(data, split_by=split_by))
+    if not directions:
+        return
 
     directions[0]['path'][0]['filename'] = data[0]['filename']
     directions = encode_dataset_polyline(directions) # get polyline for original path
@@ -182,18 +306,16 @@ def get_all_directions(data, split_by=0):
     return directions
 
 
+@instrument.stage()
 def encode_dataset_polyline(data):
     """get coordinates and encode polyline"""
     
-    coordinates = ()
-    directions = []
-    for directions in data:
-        direct_poly = []
-        for line in directions['path']:
-            coordinates = (float(line['lat']), float(line['lon']))
-            direct_poly.append(coordinates)
+    lengths = [len(directions['path']) for directions in data]
+    coordinates = np.fromiter((float(line[key]) for directions in data for line in directions['path'] for key in ('lat', 'lon')), 
+                              dtype=np.float64, count=2*sum(lengths))
+    for directions, points in zip(data, polycodec.encode_arrays(coordinates, lengths, 5)):
         # add polyline in format of 'main.decodePolylines(directions)'
-        directions.update({'overview_polyline': {'points': polyline.encode(direct_poly, 5)}}) 
+        directions.update({'overview_polyline': {'points': points}}) 
    
     try:
         data[0]['path'][0]['filename']
@@ -209,6 +331,7 @@ def encode_dataset_polyline(data):
     return data
 
 
+@instrument.stage()
 def cut_directions(directions, direct_num, minutes_interval, tracking_interval):
     """cut number of directions while testing"""
     
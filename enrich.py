@@ -0,0 +1,146 @@
+"""Concurrent popular times enrichment of POIs for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Popular times of each place_id are requested once per run with bounded concurrency,
+results are kept in a memo and reused for the same place in other directions.
+A run is the block of run_memo(), outside of it places are deduplicated only within one call.
+The memo keeps at most 'max_size' places, least recently used places are dropped.
+
+Usage:
+    with enrich.run_memo():
+        ... # stages that call enrich.enrich_places()
+
+License: MIT
+"""
+
+import instrument
+import provider
+
+import asyncio
+import collections
+import contextlib
+import time
+
+
+FIELDS = ('rating', 'rating_n', 'time_spent', 'populartimes')
+
+
+class Memo:
+    """popular times fields by place_id, least recently used places are dropped above max_size"""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.fields = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, place_id):
+        return place_id in self.fields
+
+    def __getitem__(self, place_id):
+        self.fields.move_to_end(place_id)
+        return self.fields[place_id]
+
+    def __setitem__(self, place_id, fields):
+        self.fields[place_id] = fields
+        self.fields.move_to_end(place_id)
+        while len(self.fields) > self.max_size:
+            self.fields.popitem(last=False)
+
+    def clear(self):
+        self.fields.clear()
+
+
+class ProviderBackend:
+    """popular times of the current navigation provider, blocking requests run in threads"""
+
+    async def get(self, place_id):
+        return await asyncio.to_thread(provider.get_provider().popular_times, place_id)
+
+
+class FakeBackend:
+    """local stand-in with 'latency' seconds delay of each request, to measure throughput without network"""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.source = provider.LocalProvider()
+        self.calls = 0
+
+    async def get(self, place_id):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.source.popular_times(place_id)
+
+
+def get_fields(pop_times_res):
+    """fields added to a place, time spent is converted from minutes to seconds"""
+
+    pop_times_fields = dict()
+    for field in FIELDS:
+        pop_times_fields[field] = pop_times_res.get(field, -1)
+    if pop_times_fields['time_spent'] != -1:
+        pop_times_fields['time_spent'] = [pop_times_fields['time_spent'][0] * 60, pop_times_fields['time_spent'][1] * 60]
+
+    return pop_times_fields
+
+
+async def fetch_all(place_ids, backend, memo, concurrency):
+    """request popular times of place_ids, at most 'concurrency' requests at once, results are put to memo (dict or Memo)"""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(place_id):
+        async with semaphore:
+            try:
+                memo[place_id] = get_fields(await backend.get(place_id))
+            except Exception as err:
+                print("WARNING! Popular times of {} are not available: {!r}".format(place_id, err))
+                memo[place_id] = get_fields({})
+
+    await asyncio.gather(*(fetch(place_id) for place_id in place_ids))
+
+
+def enrich_places(places, backend=None, concurrency=16, memo=None):
+    """add popular times and time spend to places (list of place dicts)
+        memo: Memo of places requested before, by default the memo of the run (run_memo())"""
+
+    if backend is None:
+        backend = ProviderBackend()
+    if memo is None:
+        memo = default_memo if default_memo is not None else {}
+    fields = {} # fields of places of this call, they are not dropped from the memo while places are updated
+    place_ids = []
+    for place_id in dict.fromkeys(place['place_id'] for place in places):
+        if place_id in memo:
+            fields[place_id] = memo[place_id]
+        else:
+            place_ids.append(place_id)
+    start_time = time.time()
+    if place_ids:
+        asyncio.run(fetch_all(place_ids, backend, fields, concurrency))
+        for place_id in place_ids:
+            memo[place_id] = fields[place_id]
+    for place in places:
+        place.update(fields[place['place_id']])
+    instrument.count('popular_times_requests', len(place_ids))
+    print("Popular times of {} places requested in {:.2f} seconds, {} places reused".format(
+        len(place_ids), time.time() - start_time, len(places) - len(place_ids)))
+
+    return places
+
+
+default_memo = None # Memo of the run, see run_memo()
+
+
+@contextlib.contextmanager
+def run_memo(memo=None):
+    """popular times requested inside the block are reused only inside it"""
+
+    global default_memo
+    previous = default_memo
+    default_memo = memo if memo is not None else Memo()
+    try:
+        yield default_memo
+    finally:
+        default_memo = previous
@@ -0,0 +1,154 @@
+"""Streaming export of polylines for map visualization of CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Rows of polylines (dsparse.get_for_json() format) are written to 'var name=[...];' files
+in one pass without building the JSON string in memory. Large fleets can be written
+as shards of at most 'chunk_size' rows of each cab with an index file, so the map
+visualization script loads only the shards it needs.
+
+Usage:
+    export.write_js(export.iter_polylines(directions), 'direct600', plain_name='direct_600')
+    export.write_shards([(cab, [([start, end], row), ...]), ...], 'direct600')  # direct600_index.json + shards
+
+License: MIT
+"""
+
+import json
+import os
+
+
+def iter_polylines(directions):
+    """rows of dsparse.get_for_json() one by one: polylines of the provider's directions and the original path"""
+
+    for direct in directions:
+        new_line = [line['overview_polyline']['points'] for line in direct]
+        new_line.append(direct[-1]['real_path']['original_polyline']['points']) # last polyline is original data set path
+        yield new_line
+
+
+class ArrayWriter:
+    """write items of a JSON array to a file one by one, the file appears under its name when it is complete"""
+
+    def __init__(self, path, prefix='', suffix=''):
+        self.path = path
+        self.file = open(path + '.part', 'w', encoding='utf-8')
+        self.file.write(prefix + '[')
+        self.suffix = suffix
+        self.count = 0
+
+    def write(self, item):
+        if self.count:
+            self.file.write(', ')
+        self.file.write(json.dumps(item))
+        self.count += 1
+
+    def close(self):
+        self.file.write(']' + self.suffix)
+        self.file.close()
+        os.replace(self.path + '.part', self.path)
+
+
+class JSWriter:
+    """'var var_name=[...];' file 'var_name.json' for map visualization script and plain JSON file 'plain_name.json'
+    if plain_name is given, rows are written one by one"""
+
+    def __init__(self, var_name, directory='output', plain_name=None):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.var_name = var_name
+        self.directory = directory
+        self.writers = [ArrayWriter(os.path.join(directory, var_name + '.json'), 'var ' + var_name + '=', ';\n')]
+        if plain_name is not None:
+            self.writers.append(ArrayWriter(os.path.join(directory, plain_name + '.json')))
+
+    def write(self, row):
+        for writer in self.writers:
+            writer.write(row)
+
+    def close(self):
+        """complete the files, return number of rows"""
+
+        for writer in self.writers:
+            writer.close()
+        print("Data saved to", self.var_name + ".json in " + self.directory + " directory")
+
+        return self.writers[0].count
+
+
+def write_js(rows, var_name, directory='output', plain_name=None):
+    """write rows to 'var_name.json' as 'var var_name=[...];' for map visualization script,
+    and to 'plain_name.json' as plain JSON if plain_name is given, return number of rows"""
+
+    writer = JSWriter(var_name, directory, plain_name)
+    for row in rows:
+        writer.write(row)
+
+    return writer.close()
+
+
+class ShardWriter:
+    """rows of each cab in shards of at most chunk_size rows and index of the shards in 'directory/var_name'
+    Each shard 'var_name_<cab>_<n>.json' defines 'var var_name_<cab>_<n>=[...];',
+    the index 'var_name_index.json' defines 'var var_name_index=[{file, var, cab, count, time_range}, ...];'"""
+
+    def __init__(self, var_name, directory='output', chunk_size=1000):
+        self.var_name = var_name
+        self.directory = os.path.join(directory, var_name)
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.chunk_size = chunk_size
+        self.index = []
+        self.writer = None
+        self.cab = None
+        self.shard_var = None
+        self.times = []
+
+    def write(self, cab, row, time_range=None):
+        """add row of the cab, time_range: [start, end] epoch seconds of the row or None"""
+
+        if self.writer is None or cab != self.cab or self.writer.count == self.chunk_size:
+            self.close_shard()
+            self.cab = cab
+            self.shard_var = '{}_{}_{}'.format(self.var_name, get_var_name(cab), len(self.index))
+            self.writer = ArrayWriter(os.path.join(self.directory, self.shard_var + '.json'), 'var ' + self.shard_var + '=', ';\n')
+        self.writer.write(row)
+        if time_range is not None:
+            self.times.extend(time_range)
+
+    def close_shard(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.index.append({'file': self.shard_var + '.json', 'var': self.shard_var, 'cab': self.cab, 'count': self.writer.count,
+                           'time_range': [min(self.times), max(self.times)] if self.times else None})
+        self.writer = None
+        self.times = []
+
+    def close(self):
+        """complete the last shard and write the index, return the index"""
+
+        self.close_shard()
+        with open(os.path.join(self.directory, self.var_name + '_index.json'), 'w', encoding='utf-8') as index_file:
+            index_file.write('var ' + self.var_name + '_index=' + json.dumps(self.index) + ';\n')
+        print("{} shards of {} rows saved to {} directory".format(len(self.index), sum(item['count'] for item in self.index),
+                                                                 self.directory))
+
+        return self.index
+
+
+def write_shards(groups, var_name, directory='output', chunk_size=1000):
+    """write rows of each cab to shards of at most chunk_size rows and index of the shards, see ShardWriter
+        groups: (cab, items) pairs, items are (time_range, row) pairs, time_range is [start, end] epoch seconds or None"""
+
+    writer = ShardWriter(var_name, directory, chunk_size)
+    for cab, items in groups:
+        for time_range, row in items:
+            writer.write(cab, row, time_range)
+
+    return writer.close()
+
+
+def get_var_name(text):
+    """text usable as a part of JS variable name"""
+
+    return ''.join(char if char.isalnum() else '_' for char in str(text))
@@ -0,0 +1,103 @@
+"""Geometry helpers for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+A POI can be visited in the free time of a direction only if it is inside the detour ellipse:
+d(origin, POI) + d(POI, destination) <= MAX_SPEED * (min_duration + free_time - time_spent).
+
+License: MIT
+"""
+
+import numpy as np
+
+
+EARTH_RADIUS = 6371008.8 # mean Earth radius, meters
+MAX_SPEED = 33.4 # assumed upper bound of the average speed of a vehicle on a route, meters per second (120 km/h)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """great-circle distance in meters, works with scalars and arrays"""
+
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_location(location):
+    """'lat,lon' string, (lat, lon) pair or {'lat': lat, 'lng': lon} dict to (lat, lon) floats"""
+
+    if isinstance(location, dict):
+        return float(location['lat']), float(location.get('lng', location.get('lon')))
+    if isinstance(location, str):
+        lat, lon = location.split(',')
+        return float(lat), float(lon)
+    lat, lon = location
+
+    return float(lat), float(lon)
+
+
+def cumulative_distance(coordinates):
+    """distance in meters from the first point to each point of (n, 2) lat/lon array"""
+
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    distance = np.zeros(len(coordinates))
+    if len(coordinates) > 1:
+        steps = haversine(coordinates[:-1, 0], coordinates[:-1, 1], coordinates[1:, 0], coordinates[1:, 1])
+        distance[1:] = np.cumsum(steps)
+
+    return distance
+
+
+def get_query_spacing(max_radius, corridor=None):
+    """distance between centers of query circles of max_radius that cover a corridor of 'corridor' meters
+    on each side of the route, by default a half of max_radius"""
+
+    if corridor is None:
+        corridor = max_radius / 2
+    corridor = min(corridor, max_radius)
+
+    return 2 * np.sqrt(max_radius**2 - corridor**2)
+
+
+def sample_route(coordinates, spacing, decimals=6):
+    """(n, 2) lat/lon points 'spacing' meters apart along the route, the first and the last points included
+    points between route vertices are interpolated linearly on the segment, rounded to 'decimals'"""
+
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    distance = cumulative_distance(coordinates)
+    if len(distance) == 0 or spacing <= 0:
+        return coordinates
+    targets = np.append(np.arange(0, distance[-1], spacing), distance[-1])
+    if len(targets) > 1 and targets[-1] == targets[-2]: # the last point is a target already
+        targets = targets[:-1]
+    points = np.column_stack((np.interp(targets, distance, coordinates[:, 0]), np.interp(targets, distance, coordinates[:, 1])))
+
+    return np.round(points, decimals)
+
+
+def detour_length(origin, destination, points):
+    """straight-line length in meters of origin -> point -> destination for each point of (n, 2) lat/lon array"""
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    return (haversine(origin[0], origin[1], points[:, 0], points[:, 1]) +
+            haversine(points[:, 0], points[:, 1], destination[0], destination[1]))
+
+
+def in_ellipse(origin, destination, points, length):
+    """mask of points inside the detour ellipse with foci at origin and destination and major axis 'length' (meters),
+    length can be an array with a value for each point"""
+
+    return detour_length(origin, destination, points) <= length
+
+
+def ellipse_area(origin, destination, length):
+    """area in square meters of the ellipse with foci at origin and destination and major axis 'length' (meters),
+    0 if the foci are further apart than length"""
+
+    a = length / 2
+    c = haversine(origin[0], origin[1], destination[0], destination[1]) / 2
+    if a <= c:
+        return 0.0
+
+    return float(np.pi * a * np.sqrt(a**2 - c**2))
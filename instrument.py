@@ -0,0 +1,273 @@
+"""Per-stage instrumentation for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Records call counts, inclusive and self time, latency percentiles and processed items of each stage,
+and event counters (provider calls, cache hits, ...) of the whole run and of the stage they happened in.
+The summary is exported to JSON and Prometheus text format, any stage can be profiled with cProfile.
+
+Usage:
+    @instrument.stage()
+    def some_stage(data): ...
+
+    instrument.profile_stage('some_stage')  # optional
+    ...
+    instrument.save()  # output/metrics.json, output/metrics.prom, output/profile_some_stage.prof
+
+License: MIT
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+
+MAX_SAMPLES = 10000 # latencies kept for percentiles of each stage
+
+# running stages, a context variable is copied to asyncio tasks and asyncio.to_thread() workers,
+# so their events are counted in the stage that started them
+_stack = contextvars.ContextVar('stage_stack', default=())
+# only one cProfile profiler can be active in the process (Python 3.12+ raises otherwise)
+_profiling = threading.Lock()
+
+
+class StageStats:
+    __slots__ = ('calls', 'total', 'self_time', 'items', 'samples', 'events')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.self_time = 0.0
+        self.items = 0
+        self.samples = []
+        self.events = {}
+
+    def add_sample(self, latency):
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(latency)
+        else: # reservoir sampling keeps uniform sample of all calls
+            i = random.randrange(self.calls)
+            if i < MAX_SAMPLES:
+                self.samples[i] = latency
+
+
+class Recorder:
+    """stage statistics and event counters of a run"""
+
+    def __init__(self):
+        self.stages = {}
+        self.events = {}
+        self.profiled = set()
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.verbose = False
+
+    def get_stack(self):
+        """(stage name, intervals of nested stages) of running stages, the last one is the current stage"""
+
+        return _stack.get()
+
+    def record(self, name, latency, child_time, items):
+        with self.lock:
+            stats = self.stages.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.total += latency
+            stats.self_time += max(latency - child_time, 0.0)
+            stats.items += items
+            stats.add_sample(latency)
+
+    def count(self, event, value=1):
+        """count event of the run and of the stage that is running"""
+
+        stack = self.get_stack()
+        with self.lock:
+            self.events[event] = self.events.get(event, 0) + value
+            if stack:
+                events = self.stages.setdefault(stack[-1][0], StageStats()).events
+                events[event] = events.get(event, 0) + value
+
+    def summary(self):
+        """machine-readable summary of the run"""
+
+        with self.lock:
+            stages = {}
+            for name, stats in sorted(self.stages.items()):
+                samples = np.array(stats.samples) if stats.samples else np.zeros(1)
+                p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+                stages[name] = {'calls': stats.calls, 'total_seconds': stats.total, 'self_seconds': stats.self_time,
+                                'p50_seconds': float(p50), 'p90_seconds': float(p90), 'p99_seconds': float(p99),
+                                'max_seconds': float(samples.max()), 'items': stats.items, 'events': dict(stats.events)}
+
+            return {'stages': stages, 'events': dict(self.events)}
+
+    def snapshot(self):
+        """raw statistics to merge them in another process"""
+
+        with self.lock:
+            return {'stages': {name: {slot: getattr(stats, slot) for slot in StageStats.__slots__}
+                               for name, stats in self.stages.items()},
+                    'events': dict(self.events)}
+
+    def merge(self, snapshot):
+        """add statistics of snapshot() of other recorder"""
+
+        with self.lock:
+            for name, values in snapshot['stages'].items():
+                stats = self.stages.setdefault(name, StageStats())
+                stats.calls += values['calls']
+                stats.total += values['total']
+                stats.self_time += values['self_time']
+                stats.items += values['items']
+                stats.samples = (stats.samples + values['samples'])[:MAX_SAMPLES]
+                for event, value in values['events'].items():
+                    stats.events[event] = stats.events.get(event, 0) + value
+            for event, value in snapshot['events'].items():
+                self.events[event] = self.events.get(event, 0) + value
+
+
+recorder = Recorder()
+
+
+def stage(name=None):
+    """record calls of the decorated function as a stage"""
+
+    def decorator(inner_func):
+        stage_name = name or inner_func.__name__
+
+        @functools.wraps(inner_func)
+        def wrapper_stage(*args, **kwargs):
+            rec = recorder
+            parents = rec.get_stack()
+            item = [stage_name, []] # (start, end) of nested stages, they can run concurrently in threads
+            token = _stack.set(parents + (item,))
+            # a profiled stage called while another one is profiled is a part of the outer profile
+            profiling = stage_name in rec.profiled and _profiling.acquire(blocking=False)
+            start_time = time.perf_counter()
+            try:
+                if profiling:
+                    value = rec.profiles.setdefault(stage_name, cProfile.Profile()).runcall(inner_func, *args, **kwargs)
+                else:
+                    value = inner_func(*args, **kwargs)
+            finally:
+                end_time = time.perf_counter()
+                latency = end_time - start_time
+                if profiling:
+                    _profiling.release()
+                _stack.reset(token)
+                child_time = get_covered(item[1])
+                if parents:
+                    with rec.lock:
+                        parents[-1][1].append((start_time, end_time))
+            try:
+                items = len(value)
+            except TypeError:
+                items = 0
+            rec.record(stage_name, latency, child_time, items)
+            if rec.verbose and not parents:
+                print(f"Runtime of {stage_name!r} function = {latency:.4f} seconds\n")
+            return value
+
+        return wrapper_stage
+
+    return decorator
+
+
+def get_covered(intervals):
+    """wall time covered by (start, end) intervals, overlapping parts are counted once"""
+
+    covered = 0.0
+    last_end = float('-inf')
+    for start, end in sorted(intervals):
+        if end > last_end:
+            covered += end - max(start, last_end)
+            last_end = end
+
+    return covered
+
+
+def count(event, value=1):
+    recorder.count(event, value)
+
+
+def profile_stage(name):
+    """profile calls of the stage with cProfile"""
+
+    recorder.profiled.add(name)
+
+
+@contextlib.contextmanager
+def recording():
+    """record to a new recorder inside the block, e.g. in a worker process"""
+
+    global recorder
+    previous = recorder
+    recorder = Recorder()
+    recorder.profiled = set(previous.profiled)
+    try:
+        yield recorder
+    finally:
+        recorder = previous
+
+
+def summary():
+    return recorder.summary()
+
+
+def to_prometheus(data=None, prefix='csprivacy'):
+    """summary in Prometheus text exposition format"""
+
+    if data is None:
+        data = summary()
+    lines = []
+    metrics = [('stage_calls_total', 'counter', 'Number of stage calls', 'calls'),
+               ('stage_seconds_total', 'counter', 'Total time of stage calls including nested stages', 'total_seconds'),
+               ('stage_self_seconds_total', 'counter', 'Total time of stage calls excluding nested stages', 'self_seconds'),
+               ('stage_items_total', 'counter', 'Number of items returned by stage calls', 'items')]
+    for metric, kind, text, field in metrics:
+        lines.append('# HELP {}_{} {}'.format(prefix, metric, text))
+        lines.append('# TYPE {}_{} {}'.format(prefix, metric, kind))
+        for name, stats in data['stages'].items():
+            lines.append('{}_{}{{stage="{}"}} {}'.format(prefix, metric, name, stats[field]))
+    lines.append('# HELP {}_stage_latency_seconds Latency of stage calls'.format(prefix))
+    lines.append('# TYPE {}_stage_latency_seconds summary'.format(prefix))
+    for name, stats in data['stages'].items():
+        for quantile in ('50', '90', '99'):
+            lines.append('{}_stage_latency_seconds{{stage="{}",quantile="0.{}"}} {}'.format(
+                prefix, name, quantile, stats['p{}_seconds'.format(quantile)]))
+        lines.append('{}_stage_latency_seconds_sum{{stage="{}"}} {}'.format(prefix, name, stats['total_seconds']))
+        lines.append('{}_stage_latency_seconds_count{{stage="{}"}} {}'.format(prefix, name, stats['calls']))
+    lines.append('# HELP {}_events_total Events of the run: provider calls, cache hits, ...'.format(prefix))
+    lines.append('# TYPE {}_events_total counter'.format(prefix))
+    for event, value in sorted(data['events'].items()):
+        lines.append('{}_events_total{{event="{}"}} {}'.format(prefix, event, value))
+    lines.append('# HELP {}_stage_events_total Events of the run counted in the stage they happened in'.format(prefix))
+    lines.append('# TYPE {}_stage_events_total counter'.format(prefix))
+    for name, stats in data['stages'].items():
+        for event, value in sorted(stats['events'].items()):
+            lines.append('{}_stage_events_total{{stage="{}",event="{}"}} {}'.format(prefix, name, event, value))
+
+    return '\n'.join(lines) + '\n'
+
+
+def save(filename='metrics', directory='output'):
+    """save summary as JSON and Prometheus text, and cProfile statistics of profiled stages"""
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    data = summary()
+    with open(os.path.join(directory, filename + '.json'), 'w') as json_file:
+        json.dump(data, json_file, indent=1)
+    with open(os.path.join(directory, filename + '.prom'), 'w') as text_file:
+        text_file.write(to_prometheus(data))
+    for name, profile in recorder.profiles.items():
+        profile.dump_stats(os.path.join(directory, 'profile_{}.prof'.format(name)))
+    print("Metrics saved to", filename + ".json and", filename + ".prom in " + directory + " directory")
+
+    return data
@@ -9,6 +9,9 @@ import os
 import pickle
 import json
 
+import report
+import stagecache
+
 
 def read_all_files(directory='data/cabspottingdata'):
     """read files in dataset for further processing"""
@@ -16,22 +19,21 @@ def read_all_files(directory='data/cabspottingdata'):
     file_list = []
     for root, _dirs, files in os.walk(directory):
         for file in files:
-            if 'new_' and '.txt' in file:
-                file_list.append(os.path.join(root, file))
-            elif 'new_' and '.temp' in file:
+            if file.startswith('new_') and file.endswith('.txt'): # temp data in the same tree is not a trace file
                 file_list.append(os.path.join(root, file))
     
     return file_list # return epfl/mobility files found in root directory
 
 
+save_temp = True # set to False to skip saving temp data of all stages
+
+
 def save_temp_data(data, filename, directory='temp'):
     """save temp data to disk"""
 
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    with open(directory + '/'+ filename + '.temp', 'wb') as f:
-        pickle.dump(data, f)
-        f.close()
+    if not save_temp:
+        return
+    stagecache.write_atomic(data, directory + '/'+ filename + '.temp')
     print("Data saved to", filename + ".temp in working directory")
 
 
@@ -84,51 +86,9 @@ def get_text_data(filename, directory='output', extension='.txt'):
 
 
 def print_data(directions):
-    """Extract data to print"""
-
-    direction_out = ''
-    for i in range(len(directions)):
-        direction_out += "Direction {}\n".format(i)
-        direction_out += "Distance: {} ({})\n".format(directions[i]['legs'][0]['distance']['value'], 
-                                                        directions[i]['legs'][0]['distance']['text'])
-        direction_out += "Navigation's duration: {} ({})\n".format(directions[i]['legs'][0]['duration']['value'], 
-                                                                directions[i]['legs'][0]['duration']['text'])
-        direction_out += "Min duration: {}\n".format(directions[i]['min_duration'])
-        direction_out += "Max free time: {}\n".format(directions[i]['overview_free_time'])
-        try:
-            direction_out += "Downloaded POI types: {}\n".format(directions[0]['place_type'])
-        except:
-            direction_out += "Downloaded POI types: Not specified\n"
-        try:
-            direction_out += "Selected POI types: {}\n\n".format(directions[0]['filtered_poi'])
-        except:
-            direction_out += "Selected POI types: Not specified\n"
-        direction_out += "No stop probability is: {}\n".format(round(directions[i]['entropy_data']['no_stop_prob'], 2))
-        direction_out += "Weighed stop probability is: {}\n".format(round(directions[i]['entropy_data']['weighed_no_stop'], 2))
-        try:
-            direction_out += "Amount of potential POIs: {}\n".format(len(directions[i]['all_destinations']))
-        except KeyError:
-            direction_out += "No of potential POIs are presented\n"
-        for prob in range(len(directions[i]['entropy_data']['normal_prob'])):
-            directions[i]['entropy_data']['normal_prob'][prob] = round(directions[i]['entropy_data']['normal_prob'][prob],3)
-        direction_out += "Normalized probabilities of visit POI: {}\n".format(directions[i]['entropy_data']['normal_prob'])
-        direction_out += "Ellipse area: {}\n".format(directions[i]['ellipse_area'][i])
-        direction_out += "Entropy: {:.2f}\n\n".format(directions[i]['entropy_data']['direction_entropy'])
-
-        direction_out += "In detail:\n"
-        try:
-            for j in range(len(directions[i]['all_destinations'])):
-                direction_out += "POI[{}], probability of visit: {:.1f}%\n".format(j, directions[i]['normal_prob'][j] * 100)
-        except KeyError:
-            direction_out +="No of potential POIs are presented\n"
-        direction_out += "\n\n"
-    tracking = directions[0]['tracking_interval']
-    start_addr = directions[0]['legs'][0]['start_address']
-    end_addr = directions[0]['legs'][0]['end_address']
-    output = "Route has {} directions\nStart address: {}\nEnd address: {}\nTracking interval: {:.0f}\n\n{}".format(len(directions),         
-                                                                                                start_addr, end_addr, tracking, direction_out)
-
-    save_as_text(output, filename="output_{}_{:.0f}".format(directions[0]['filename'], directions[0]['tracking_interval']))
+    """save text report of directions, see report.write_report()"""
+
+    report.write_report(directions)
     print("Output file is created")
     
-    return True
\ No newline at end of file
+    return True
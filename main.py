@@ -7,33 +7,39 @@ Licence: MIT
 """
 import iowork
 import dsparse
+import enrich
+import export
+import geo
+import instrument
+import manifest
+import model
+import poiindex
+import poitable
+import polycodec
+import provider
+import routing
+import scoring
+import stagecache
+import tracestore
 
 
 import polyline
+import contextlib
+import os
+import pickle
 import time
-import functools
-import populartimes
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
 
 import numpy as np
-import scipy as sp
-from scipy import stats
 import matplotlib.pyplot as plt
 
 
 def run_time(inner_func):
-    """Show the runtime of the decorated function"""
+    """Record calls and runtime of the decorated function as a stage, see instrument.summary()"""
 
-    @functools.wraps(inner_func)
-    def wrapper_timer(*args, **kwargs):
-        start_time = time.time()    
-        value = inner_func(*args, **kwargs)
-        end_time = time.time()      
-        run_time = end_time - start_time    
-        print(f"Runtime of {inner_func.__name__!r} function = {run_time:.4f} seconds\n")
-        return value
-
-    return wrapper_timer
+    return instrument.stage(inner_func.__name__)(inner_func)
 
 
 @run_time
@@ -45,14 +51,14 @@ def get_directions(origin_addr, destination_addr, waypoints_list=None, filename=
     destination_addr = str(destination_addr)
     
     if waypoints_list is not None:
-        directions = direction(origin_addr, destination_addr, waypoints=waypoints_list)
+        directions = provider.get_provider().directions(origin_addr, destination_addr, waypoints=waypoints_list)
     else:
-        directions = direction(origin_addr, destination_addr)
+        directions = provider.get_provider().directions(origin_addr, destination_addr)
     
     print("Direction received")
     if first_run:
         if not filename:
-            directions[0]['filename'] = str(round(get_time)) # creating filename extension of temporary data
+            directions[0]['filename'] = str(round(time.time())) # creating filename extension of temporary data
             filename = directions[0]['filename']
         else:
             directions[0]['filename'] = filename
@@ -70,26 +76,16 @@ def in_time_directions(directions, tracking_interval):
 
     available_directions = []
     tracking_interval = round(tracking_interval)
+    if not directions:
+        print("No in time directions were found")
+        return available_directions
+    durations, min_durations = get_durations(directions)
     for i in range(len(directions)):
-        duration = 0
-        min_duration = 0
-        if len(directions[i]['legs']) == 1:     # do if there is no waypoints
-                directions[i]['duration'] = directions[i]['legs'][0]['duration']
-                min_duration = in_time_direction_probablity(directions[i]['legs'][0]['duration']) # min duration returned by lognorm dist
-                directions[i]['min_duration'] = min_duration # save min duration
-                if min_duration < tracking_interval:
-                    directions[i]['overview_free_time'] = tracking_interval - min_duration 
-                    available_directions.append(directions[i])
-        else:   # do if there are waypoints
-            for j in range(len(directions[i]['legs'])):
-                duration += directions[i]['legs'][j]['duration'] # sum of min durations of legs
-            directions[i]['duration'] = duration                                       
-            for j in range(len(directions[i]['legs'])):
-                min_duration += in_time_direction_probablity(directions[i]['legs'][j]['duration']) # sum of min durations of legs
-            directions[i]['min_duration'] = min_duration   
-            if min_duration < tracking_interval:
-                directions[i]['overview_free_time'] = tracking_interval - min_duration
-                available_directions.append(directions[i])
+        directions[i]['duration'] = int(durations[i])
+        directions[i]['min_duration'] = int(min_durations[i]) # min duration returned by lognorm dist
+        if min_durations[i] < tracking_interval:
+            directions[i]['overview_free_time'] = tracking_interval - int(min_durations[i])
+            available_directions.append(directions[i])
         
     if len(available_directions) > 0:
         print("The number of intime directions:", len(available_directions))
@@ -99,19 +95,37 @@ def in_time_directions(directions, tracking_interval):
     return available_directions
 
 
+def get_durations(directions):
+    """durations and min durations (sums of legs) of directions as arrays"""
+
+    if not directions:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    legs = np.array([len(direction['legs']) for direction in directions])
+    leg_durations = np.array([get_value(leg['duration']) for direction in directions for leg in direction['legs']])
+    bounds = np.cumsum(legs) - legs
+    durations = np.add.reduceat(leg_durations, bounds) # sum of durations of legs
+    min_durations = np.add.reduceat(scoring.get_min_duration(leg_durations), bounds) # sum of min durations of legs
+
+    return durations, min_durations
+
+
+def get_value(field):
+    """return value of provider ({'value': value, 'text': text}) or plain field"""
+
+    if isinstance(field, dict):
+        return field['value']
+    return field
+
+
 def in_time_direction_probablity(duration):
     """return minimal time needed a vehicle to run a path by any navigation provider 
     with help of lognorm distribution"""
 
-    mean_ln = np.log(duration)
-    std_ln = 0.41 # regarding the paper std_nostop is ln
-    mln_3std = mean_ln-3*std_ln
-    min_duration = np.exp(mln_3std)
-    
-    return int(min_duration)
+    return int(scoring.get_min_duration(duration))
 
 
 @run_time
+@stagecache.cached('get_directions_for_ds', version=2, uses_provider=True)
 def get_directions_for_ds(exist_directions, tracking_interval):
     """get from any navigation provider to compare the directions with data set"""
 
@@ -129,11 +143,11 @@ def get_directions_for_ds(exist_directions, tracking_interval):
         # get only coordinates when the tracking point (tracking interval) 
         # for coor_num in range(0, len(line['path']), time_interval):
         while coor_num <= len(line['path']):
-            # after run, get start address
-            """if coor_num == 0:
-                start_addr = reverse_geocode(latitude=[line['path'][coor_num]['lat'], longitude=line['path'][coor_num]['lon']])
+            # after run, get start address; providers route by 'lat,lon' coordinates, so no reverse geocoding is needed
+            if coor_num == 0:
+                start_addr = get_address(line['path'][coor_num])
             else:       
-                end_addr = reverse_geocode(latitude=[line['path'][coor_num]['lat'], longitude=line['path'][coor_num]['lon']])"""
+                end_addr = get_address(line['path'][coor_num])
 
             # if we have start and end addresses get directions
             if start_addr and end_addr:
@@ -146,7 +160,8 @@ def get_directions_for_ds(exist_directions, tracking_interval):
                         if len(line['polyline_coordinates']) > coor_num: # delete exist real path and encode new polyline related to direction by any navigation provider 
                             new_real_path['real_coordinates'] = line['polyline_coordinates'][:coor_num+1]
                             new_real_path.update({'overview_polyline': polyline.encode(new_real_path['real_coordinates'],5)})
-                            new_real_path.update({'original_polyline': line['original_polyline']['points']}) 
+                            new_real_path.update({'original_polyline': {'points': line['original_polyline']['points']}}) # the format of export.iter_polylines()
+                            new_real_path['time_range'] = [int(line['path'][0]['time']), int(line['path'][coor_num]['time'])]
                     direct['real_path'] = new_real_path      # add the real path to direction for comparison 
                     direct['direction_time'] = coor_num      # save the tracking interval for direction
                 start_addr = end_addr # for the next direction, the start address is equal to the end address of the previous direction
@@ -178,53 +193,55 @@ def get_directions_for_ds(exist_directions, tracking_interval):
     return directions
 
 
+def get_address(point):
+    """'lat,lon' address of a data set point, accepted by any navigation provider as origin or destination"""
+
+    return '{},{}'.format(point['lat'], point['lon'])
+
+
+def get_points(overview_polyline):
+    """return encoded points of provider ('points') or data set ({'points': 'points'}) polyline"""
+
+    if isinstance(overview_polyline, dict):
+        return overview_polyline['points']
+    return overview_polyline
+
+
+def decode_points(overview_polylines):
+    """decode polylines at once, return lists of (lat, lon) tuples as polyline.decode() does"""
+
+    coordinates = polycodec.decode_many([get_points(points) for points in overview_polylines])
+
+    return [list(map(tuple, polyline_coordinates.tolist())) for polyline_coordinates in coordinates]
+
+
 @run_time
 def decode_polylines(directions, path_num=None):
     """!!!Potential function!!!
     get coordinates from polylines"""
 
     if path_num: # decode and return only direction specified in 'path_num' parameter
-        directions[path_num]['polyline_coordinates'] = polyline.decode(directions[path_num]['overview_polyline']) 
+        directions[path_num]['polyline_coordinates'] = decode_points([directions[path_num]['overview_polyline']])[0]
         new_list = []
         new_list.append(directions[path_num])
         directions = new_list
         print("Polyline of direction[{}] is decoded successfully".format(path_num)) 
     elif not path_num:
-        for direction in directions:
-            direction['polyline_coordinates'] = polyline.decode(direction['overview_polyline']) 
+        coordinates = decode_points([direction['overview_polyline'] for direction in directions])
+        for direction, polyline_coordinates in zip(directions, coordinates):
+            direction['polyline_coordinates'] = polyline_coordinates
         print("Polylines decoded successfully")
     
     return directions
 
 
-def pop_times(place_id):
-    """Get rating, time spend with help of any navigation provider"""
-
-    place_id = str(place_id)
-    pop_times = populartimes(place_id)
-    
-    return pop_times
-
-
 @run_time
 def add_popular_times(places):
     """!!!Potential function!!!
     add popular times and time spend to polyline_coor_POI list"""
     
     print("Adding popular times and time spend to polyline_coor_POI list")
-    for i in range(len(places['results'])): 
-        pop_times_res = pop_times(places['results'][i]['place_id'])
-        pop_times_fields = dict()
-        d_items = list(['rating', 'rating_n', 'time_spent'])
-        for j in d_items:
-            pop_times_fields[j] = pop_times_res.get(j, -1)
-            
-        if pop_times_fields['time_spent'] != -1:
-            pop_times_fields['time_spent'][0] = pop_times_fields['time_spent'][0] * 60
-            pop_times_fields['time_spent'][1] = pop_times_fields['time_spent'][1] * 60
-        
-        places['results'][i].update(pop_times_fields)
- 
+    enrich.enrich_places(places['results']) # each place_id is requested once per run
     print("Popular times were added to the places")
     
     return places
@@ -236,66 +253,38 @@ def get_near_poi(location, max_radius, place_type=None, add_popular=True):
     
     print("Get near POIs from coordinates")
     
-    places = near_places(location = location, radius=max_radius, type=place_type)
-    all_results = []
-    all_results.extend(places['results'])                                               
-    places['results'] = all_results 
-    if add_popular:
-        places = add_popular_times(places)   # request popular times for all places
-    print(len(places['results']), "POIs are available")
-
+    places = poiindex.default_index.get_near_poi(location, max_radius, place_type, provider.get_provider().near_places)
     if len(places['results']) > 0: 
         print(len(places['results']), "POIs are available")
         if add_popular:
             places = add_popular_times(places)   # request popular times for all places
-        else:
-            print("No POIs are available") 
+    else:
+        print("No POIs are available") 
     
     return places
 
 
 @run_time
-def get_near_poi_polylines(directions, max_radius, filename='', place_type=[], add_popular=True, distance_between=0.020):
+@stagecache.cached('get_near_poi_polylines', version=2, uses_provider=True)
+def get_near_poi_polylines(directions, max_radius, filename='', place_type=[], add_popular=True, spacing=None):
     """!!!Potential function!!!
-    get POIs for polyline coordinates (polyline points)"""
+    get POIs for polyline coordinates (polyline points)
+        spacing: meters between polyline points used to get POIs, by default it is derived from max_radius"""
 
     print("Get POI for polyline coordinates")
+    if spacing is None:
+        spacing = geo.get_query_spacing(max_radius)
     for i in range(len(directions)): 
         directions[i]['polyline_coor_POI'] = []
-        next_j = 0
-        for j in range(len(directions[i]['polyline_coordinates'])):
-            location = str(directions[i]['polyline_coordinates'][j][0]) + ',' + str(directions[i]['polyline_coordinates'][j][1])
-            coordinates = directions[i]['polyline_coordinates'][j]
-            if j == 0:
-                places = []
-                if place_type:
-                    for place in place_type:
-                        result = get_near_poi(location, max_radius, place, add_popular=add_popular)
-                        places.extend(result['results'])
-                elif not place_type:
-                    result = get_near_poi(location, max_radius, add_popular=add_popular)
-                    places.extend(result['results'])
-                directions[i]['polyline_coor_POI'].append([tuple(coordinates)]+[places])
-
-            distance_lat = directions[i]['polyline_coordinates'][next_j][0] - directions[i]['polyline_coordinates'][j][0]
-            distance_lon = directions[i]['polyline_coordinates'][next_j][1] - directions[i]['polyline_coordinates'][j][1]
-            
-            distance_lat = abs(distance_lat)
-            distance_lat = round(distance_lat, 6)
-
-            distance_lon = abs(distance_lon)
-            distance_lon = round(distance_lon, 6)
-            
-            if distance_lat > distance_between or distance_lon > distance_between: # distance between POIs by default 0.020
-                next_j = j
-                places = []
-                for place in place_type:
-                    result = get_near_poi(location, max_radius, place, add_popular=add_popular)
-                    places.extend(result['results'])
-                if not place_type:
-                    result = get_near_poi(location, max_radius, add_popular=add_popular)
-                    places.extend(result['results'])
-                directions[i]['polyline_coor_POI'].append([tuple(coordinates)]+[places])
+        for point in geo.sample_route(directions[i]['polyline_coordinates'], spacing).tolist():
+            location = str(point[0]) + ',' + str(point[1])
+            places = {}
+            for place in (place_type or [None]):
+                result = get_near_poi(location, max_radius, place, add_popular=False) # popular times are added below at once
+                places.update((poi['place_id'], poi) for poi in result['results']) # the same POI can have several types
+            directions[i]['polyline_coor_POI'].append([tuple(point)]+[list(places.values())])
+    if add_popular:
+        add_popular_times({'results': [poi for direction in directions for point in direction['polyline_coor_POI'] for poi in point[1]]})
     if place_type:
         directions[0]['place_type'] = place_type # add downloaded place types for report
     if not filename:
@@ -307,7 +296,8 @@ def get_near_poi_polylines(directions, max_radius, filename='', place_type=[], a
         directions[0]['filename'] = filename
         print("WARNING! Filename extension was changed to:", filename)
     iowork.save_temp_data(directions, 'nearbyPOIs_' + filename)
-    print("Nearby POIs are downloaded")
+    print("Nearby POIs are downloaded, {} of {} queries answered from POI index".format(poiindex.default_index.hits, 
+                                                                                          poiindex.default_index.queries))
 
     return directions
 
@@ -326,10 +316,14 @@ def get_poi_by_type(poi_list, poi_type):
 
 
 @run_time
-def get_waypoints_for_poi(directions, poi_type=None, filename=''):
+@stagecache.cached('get_waypoints_for_poi', version=3, uses_provider=True)
+def get_waypoints_for_poi(directions, poi_type=None, filename='', poi_table=None, max_speed=geo.MAX_SPEED):
     """!!!Potential function!!!
-    select (filter) potential waypoints from obtained list of POIs with help of get_poi_by_type(), 
-    remove all unnecessary data. Add only POIs that have "time_spent" info and are in free time intertval"""
+    select (filter) potential waypoints from obtained list of POIs with help of type bitmasks (model.Candidates.has_type()), 
+    remove all unnecessary data. Add only POIs that have "time_spent" info and are in free time intertval
+    and inside the detour ellipse of the direction (get_detour_bound()), so POIs that can't be reached in free time are not routed
+        poi_table: poitable.POITable, if 'polyline_coor_POI' has place_ids instead of places (poitable.strip_places())
+        max_speed: meters per second bound of the detour ellipse, None to route all POIs in free time"""
     
     try:
         directions[0]['overview_free_time']
@@ -337,36 +331,49 @@ def get_waypoints_for_poi(directions, poi_type=None, filename=''):
         print("WARNING! No key \'overview_free_time\' is presented! Run the \'in_time_directions\' function before!\nExiting...")
         exit(1)
 
+    destination_lists = {}
+    in_time_count = 0
+    pruned_count = 0
     for i in range(len(directions)):
-        waypoint_list = []
         origin_addr = directions[i]['legs'][0]['start_address'] # update to directions without waypoints
-        if len(directions[i]['legs']) == 1:
-            destination_addr = directions[i]['legs'][0]['end_address'] # for directions without waypoints
-        else:
-            destination_addr = directions[i]['legs'][2]['end_address'] # for directions with waypoints NEED TEST
+        destination_addr = directions[i]['legs'][-1]['end_address'] # the last leg ends at destination also for directions with waypoints
         
-        for j in range(len(directions[i]['polyline_coor_POI'])):
-            for k in range(len(directions[i]['polyline_coor_POI'][j][1])):
-                if get_poi_by_type(directions[i]['polyline_coor_POI'][j][1][k]['types'], poi_type): # filter the existing POIs by elements in poi_type, if type is None return True
-                    try:
-                        if directions[i]['polyline_coor_POI'][j][1][k]['time_spent'] != -1: # add only POIs have "time_spent" information
-                            if directions[i]['polyline_coor_POI'][j][1][k]['time_spent'][0] < directions[i]['overview_free_time']:
-                                waypoint = directions[i]['polyline_coor_POI'][j][1][k]['place_id']
-                                name = directions[i]['polyline_coor_POI'][j][1][k]['name']
-                                types = directions[i]['polyline_coor_POI'][j][1][k]['types']
-                                time_spent = directions[i]['polyline_coor_POI'][j][1][k]['time_spent']
-                                populartimes = directions[i]['polyline_coor_POI'][j][1][k]['populartimes']
-                                rating_n = directions[i]['polyline_coor_POI'][j][1][k]['rating_n']
-                                waypoint_list.append(["place_id:" + waypoint, name, types, time_spent, populartimes, rating_n])
-                    except KeyError:
-                        print("\'time_spent\' parameter is not available because no popular times were added")
+        if poi_table is None:
+            candidates = model.Candidates.from_polyline_poi(directions[i]['polyline_coor_POI'])
+        else:
+            candidates = model.Candidates.from_table(poi_table, directions[i]['polyline_coor_POI'])
+        selected = candidates.has_type(poi_type) # filter the existing POIs by elements in poi_type, if type is None select all
+        if not candidates.enriched[selected].all():
+            print("\'time_spent\' parameter is not available because no popular times were added")
+        selected &= candidates.enriched & candidates.has_time_spent() # add only POIs have "time_spent" information
+        selected &= candidates.time_spent[:, 0] < directions[i]['overview_free_time']
+        if max_speed is not None:
+            origin = geo.parse_location(directions[i]['legs'][0]['start_location'])
+            destination = geo.parse_location(directions[i]['legs'][-1]['end_location'])
+            interval = directions[i]['min_duration'] + directions[i]['overview_free_time']
+            directions[i]['ellipse_area'] = round(geo.ellipse_area(origin, destination, get_detour_bound(interval, 0, max_speed)))
+            feasible = geo.in_ellipse(origin, destination, candidates.location,
+                                      get_detour_bound(interval, candidates.time_spent[:, 0], max_speed))
+            feasible |= np.isnan(candidates.location).any(axis=1) # POIs without location are not pruned
+            in_time_count += int(selected.sum())
+            pruned_count += int((selected & ~feasible).sum())
+            selected &= feasible
+        waypoint_list = candidates.to_waypoints(selected)
         if waypoint_list:
-            destination_wayp_list = [origin_addr, destination_addr, waypoint_list]
-            directions[i].update({'dest_wayp_list': destination_wayp_list})
-            destinations = get_destination_via_poi(destination_wayp_list)
-            directions[i].update({'all_destinations': destinations})
-            # directions_obtained = True
-            print("Potential in time waypoints were obtained for direction[{}]".format(i))
+            destination_lists[i] = [origin_addr, destination_addr, waypoint_list]
+            directions[i].update({'dest_wayp_list': destination_lists[i]})
+    
+    if max_speed is not None:
+        instrument.count('ellipse_candidates', in_time_count)
+        instrument.count('ellipse_pruned', pruned_count)
+        print("Detour ellipse pruned {} of {} in time POIs ({:.1%}), up to {} route requests saved".format(
+            pruned_count, in_time_count, pruned_count / in_time_count if in_time_count else 0.0, pruned_count))
+
+    # routes via POIs of all directions are requested at once, each unique route once
+    all_destinations = get_destinations_via_poi(list(destination_lists.values()))
+    for i, destinations in zip(destination_lists, all_destinations):
+        directions[i].update({'all_destinations': destinations})
+        print("Potential in time waypoints were obtained for direction[{}]".format(i))
     
     if poi_type:
         directions[0]['filtered_poi'] = poi_type # add filtered POI types for report
@@ -384,106 +391,95 @@ def get_waypoints_for_poi(directions, poi_type=None, filename=''):
 
 
 @run_time
+@stagecache.cached('get_destination_via_poi', uses_provider=True)
 def get_destination_via_poi (destination_list):
     """!!!Potential function!!!
     get all routes via POI for dest_wayp_list (get_waypoints_for_poi) list presentation"""
 
-    destination = []
-    for i in range(len(destination_list[2])):
-        destination.extend(get_directions(destination_list[0], destination_list[1], destination_list[2][i][0]))
-        destination[i]['name'] = destination_list[2][i][1]
-        destination[i]['time_spent'] = destination_list[2][i][3]
-        destination[i]['rating_n'] = destination_list[2][i][5]
-    
-    iowork.save_temp_data(destination,'potential_dest') 
+    return get_destinations_via_poi([destination_list])[0]
+
+
+def get_detour_bound(tracking_interval, time_spent, max_speed=geo.MAX_SPEED):
+    """major axis (meters) of the detour ellipse: max_speed * (min_duration + free_time - time_spent),
+    min_duration + free_time of an in time direction is its 'tracking_interval' (in_time_directions()),
+    time_spent can be an array with a value for each POI"""
+
+    return max_speed * (round(tracking_interval) - np.asarray(time_spent, dtype=np.float64))
+
+
+@run_time
+def get_destinations_via_poi(destination_lists, concurrency=16):
+    """get all routes via POI for several dest_wayp_list, routes are requested by routing.RoutePlanner:
+    a route that is the same for several POIs or directions is requested once"""
+
+    planner = routing.RoutePlanner(concurrency)
+    for origin_addr, destination_addr, waypoint_list in destination_lists:
+        for waypoint in waypoint_list:
+            planner.add(origin_addr, destination_addr, waypoint[0])
+    planner.run()
+
+    all_destinations = []
+    for destination_list in destination_lists:
+        destination = []
+        for waypoint in destination_list[2]:
+            routes = planner.get(destination_list[0], destination_list[1], waypoint[0])
+            for route in routes:
+                route['name'] = waypoint[1]
+                route['time_spent'] = waypoint[3]
+                route['rating_n'] = waypoint[5]
+                route['place_id'] = waypoint[0]
+            destination.extend(routes)
+        iowork.save_temp_data(destination,'potential_dest_' + stagecache.default_cache.key('potential_dest', (destination_list,))[:16])
+        all_destinations.append(destination)
     print("Potential directions via POI received")
     
-    return destination
+    return all_destinations
 
 
 @run_time
+@stagecache.cached('potential_visit_poi', version=2, uses_provider=True)
 def potential_visit_poi (directions, tracking_interval, filename='', add_no_stop=False):
-    """calculate probability to visit POIs and overall entropy"""
+    """calculate probability to visit POIs and overall entropy
+    all (direction, POI) pairs are scored at once by scoring.score_directions()"""
 
-    tracking_interval = tracking_interval/60
+    group = []
+    time_spent = []
+    rating_n = []
     for i in range(len(directions)): 
-        all_probab = []
-        duration = directions[i]['duration']/60
-        free_time = directions[i]['overview_free_time']/60
-        try:
-            directions[i]['all_destinations'] = in_time_directions(directions[i]['all_destinations'], tracking_interval*60)
-            for j in range(len(directions[i]['all_destinations'])):
-                minim = abs(directions[i]['all_destinations'][j]['time_spent'][0]/60) # we guess that Goolge min time spent equal to -2*sigma
-                maxim = abs(directions[i]['all_destinations'][j]['time_spent'][1]/60) # max time spent = 2*sigma
-                if minim == maxim: # in case if there is no time interval, artificially create it
-                    minim = minim/2
-                    maxim = 3*maxim/2
-                mean = np.mean([minim, maxim])
-                std = (maxim-minim)/4
-
-                # Z-score calc and finding of the potential probabl interval
-                # three sigma rule: m+s=68%, m+2s=95%, m+3s=99,7%
-                z = (free_time-mean)/std
-                if -1<=z<=1:
-                    probab = 0.341
-                elif -2<=z<-1 or 2>=z>1:
-                    probab = 0.136
-                elif -3<=z<-2 or 3>=z>2:
-                    probab =  0.021
-                else:
-                    probab = 0.0013
-                directions[i]['all_destinations'][j]['dist_data'] = ({'mean': mean, 'std': std, 'zscore': z, 'probab': probab})
-                
-                # rating addition: unweighted probabilities
-                if directions[i]['all_destinations'][j]['rating_n'] > 0:
-                    probab = probab * directions[i]['all_destinations'][j]['rating_n'] #CHECK IF ZERO
-                    all_probab.append(probab)
-
-            # add nostop_prob     
-            nostop_probab = no_stop_lognormal(duration, tracking_interval)
-            if add_no_stop:
-                all_probab.append(nostop_probab)
-                sum_all = sum(all_probab)
-                n_prob = []
-                for prob in all_probab[:-1]:
-                    n_prob.append(prob/sum_all)
-                    print("Weighed probability of visit a POI is: {}%".format(round(prob/sum_all * 100, 2)))
-                print("Weighed no stop probability is: {}%".format(round(nostop_probab/sum_all * 100, 2)))
-
-            elif not add_no_stop:
-                """find probability when no_stop doesn't participate in propotion""" 
-                stop_prob_weight = 1-nostop_probab
-                # find proportion to calc entropy * stop_prob_weight
-                sum_all = sum(all_probab)
-                n_prob = []
-                for prob in all_probab:
-                    n_prob.append(prob/sum_all * stop_prob_weight)
-                    print("Weighed probability of visit a POI is: {}%".format(round(prob/sum_all * 100, 2)))
-            
-            # check of input data correctness for entropy
-            test = sum(n_prob)
-            print("\nCheck. The sum of probabilities is: {}\n".format(test))
-
-            entropy = sp.stats.entropy(n_prob, base=2)
-            entropy_data = {'probabilities': all_probab, 'normal_prob': n_prob, 'direction_entropy': entropy, 
-                            'tracking_interval': tracking_interval, 'no_stop_prob': nostop_probab} # create dict to save entropy data
-            directions[i].update(entropy_data)
-            print("Direction[{}] entropy is: {}".format(i, entropy))
-        except:
-            nostop_probab = no_stop_lognormal(duration, tracking_interval)
-            all_probab.append(nostop_probab)
-            sum_all = sum(all_probab)
-            n_prob = []
-            for prob in all_probab[:-1]:
-                n_prob.append(prob/sum_all)
-                print("Weighed probability of visit a POI is: {}%".format(round(prob/sum_all * 100, 2)))
-            print("Weighed no stop probability is: {}%".format(round(nostop_probab/sum_all * 100, 2)))
-            entropy = sp.stats.entropy(n_prob, base=2)
-            entropy_data = {'probabilities': all_probab, 'normal_prob': n_prob, 'direction_entropy': entropy, 
-                            'tracking_interval': tracking_interval, 'no_stop_prob': nostop_probab} # create dict to save entropy data
-            directions[i].update(entropy_data)
-            print("Direction[{}] entropy is: {}".format(i, entropy))
+        if 'all_destinations' not in directions[i]:
             print("No potential destinations for direction[{}]".format(i))
+            continue
+        directions[i]['all_destinations'] = in_time_directions(directions[i]['all_destinations'], tracking_interval)
+        for destination in directions[i]['all_destinations']:
+            group.append(i)
+            time_spent.append(destination['time_spent'])
+            rating_n.append(destination['rating_n'])
+    time_spent = np.array(time_spent, dtype=np.float64).reshape(-1, 2)
+    free_time = [direction['overview_free_time'] for direction in directions]
+    duration = [direction['duration'] for direction in directions]
+    scores = scoring.score_directions(group, time_spent[:, 0], time_spent[:, 1], rating_n, free_time, duration, 
+                                      tracking_interval, add_no_stop=add_no_stop)
+
+    group = np.array(group, dtype=np.int64)
+    rated_group = group[scores['rated']]
+    weighted = scoring.split_by_group(scores['weighted'], rated_group, len(directions))
+    normal_prob = scoring.split_by_group(scores['normal_prob'], rated_group, len(directions))
+    destinations = [destination for i in range(len(directions)) for destination in directions[i].get('all_destinations', [])]
+    for j, destination in enumerate(destinations):
+        destination['dist_data'] = {'mean': scores['mean'][j], 'std': scores['std'][j], 
+                                    'zscore': scores['zscore'][j], 'probab': scores['probab'][j]}
+    tracking_interval = tracking_interval/60
+    for i in range(len(directions)):
+        all_probab = weighted[i].tolist()
+        nostop_probab = float(scores['no_stop_prob'][i])
+        if add_no_stop or 'all_destinations' not in directions[i]: # a direction without destinations only has no_stop
+            all_probab.append(nostop_probab)
+        entropy_data = {'probabilities': all_probab, 'normal_prob': normal_prob[i].tolist(), 
+                        'direction_entropy': float(scores['direction_entropy'][i]), 
+                        'tracking_interval': tracking_interval, 'no_stop_prob': nostop_probab} # create dict to save entropy data
+        directions[i].update(entropy_data)
+        directions[i]['entropy_data'] = dict(entropy_data, weighed_no_stop=float(scores['weighed_no_stop'][i]))
+        print("Direction[{}] entropy is: {}".format(i, entropy_data['direction_entropy']))
     
     if not filename:
         filename = directions[0]['filename']
@@ -496,14 +492,105 @@ def potential_visit_poi (directions, tracking_interval, filename='', add_no_stop
     return directions
 
 
+def score_cab_worker(directions, tracking_interval, poi_table, poi_type=None, add_no_stop=False):
+    """get_waypoints_for_poi() and potential_visit_poi() of one cab's directions, POIs are read from the shared table
+    the table a task unpickled maps the block again, the mapping is closed when the task is done"""
+
+    try:
+        directions = get_waypoints_for_poi(directions, poi_type, poi_table=poi_table)
+        return potential_visit_poi(directions, tracking_interval, add_no_stop=add_no_stop)
+    finally:
+        if not poi_table.owner:
+            poi_table.close()
+
+
+@run_time
+def score_cabs(cab_directions, tracking_interval, poi_type=None, add_no_stop=False, workers=None):
+    """entropy of directions of several cabs in parallel (cab_directions: list of directions after get_near_poi_polylines())
+    POIs of all cabs are put once to poitable.POITable in shared memory, workers get only place_ids of their cabs,
+    place dicts of 'polyline_coor_POI' of the returned directions are put back from cab_directions
+        workers: number of processes, None - number of CPUs"""
+
+    places = [place for directions in cab_directions for direction in directions 
+              for _point, point_places in direction.get('polyline_coor_POI', []) for place in point_places]
+    poi_table = poitable.POITable.create(places)
+    print("POI table of {} places is shared with workers".format(len(poi_table)))
+    stripped = [poitable.strip_places(directions) for directions in cab_directions]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    n = len(stripped)
+    try:
+        if workers > 1 and n > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, n)) as executor:
+                results = list(executor.map(score_cab_worker, stripped, [tracking_interval]*n, [poi_table]*n, 
+                                            [poi_type]*n, [add_no_stop]*n))
+        else:
+            results = [score_cab_worker(directions, tracking_interval, poi_table, poi_type, add_no_stop) for directions in stripped]
+    finally:
+        poi_table.close()
+        poi_table.unlink()
+
+    return [poitable.restore_places(directions, places) for directions in results]
+
+
+@run_time
+def sweep_tracking_intervals(directions, tracking_intervals, max_radius=1000, place_type=[], poi_type=None, add_no_stop=False,
+                             max_speed=geo.MAX_SPEED):
+    """calculate entropy of directions for several tracking intervals (seconds).
+    Routes and POIs are requested once for the longest interval, the shorter intervals have less free time,
+    so their directions and potential POIs are subsets of it, the detour ellipse is applied for each interval.
+    return table {tracking_interval: [row for each in time direction]}"""
+
+    tracking_intervals = sorted(set(tracking_intervals))
+    directions = in_time_directions(directions, tracking_intervals[-1])
+    if not directions:
+        return {interval: [] for interval in tracking_intervals}
+    directions = decode_polylines(directions)
+    directions = get_near_poi_polylines(directions, max_radius, place_type=place_type)
+    directions = get_waypoints_for_poi(directions, poi_type, max_speed=max_speed)
+
+    # shared data of all intervals
+    durations, min_durations = get_durations(directions)
+    destinations = [direction.get('all_destinations', []) for direction in directions]
+    group = np.repeat(np.arange(len(directions)), [len(item) for item in destinations])
+    destinations = [destination for item in destinations for destination in item]
+    time_spent = np.array([destination['time_spent'] for destination in destinations], dtype=np.float64).reshape(-1, 2)
+    rating_n = np.array([destination['rating_n'] for destination in destinations], dtype=np.float64)
+    _via_durations, via_min_durations = get_durations(destinations)
+    if max_speed is not None:
+        locations = {"place_id:" + place['place_id']: model.get_location(place) for direction in directions
+                     for _point, places in direction['polyline_coor_POI'] for place in places}
+        ends = np.array([geo.parse_location(direction['legs'][0]['start_location']) +
+                         geo.parse_location(direction['legs'][-1]['end_location']) for direction in directions]).reshape(-1, 4)
+        detour = geo.detour_length(ends[group, :2].T, ends[group, 2:].T,
+                                   [locations[destination['place_id']] for destination in destinations])
+
+    table = {}
+    for interval in tracking_intervals:
+        in_time = min_durations < round(interval)
+        free_time = np.where(in_time, round(interval) - min_durations, 0)
+        selected = in_time[group] & (time_spent[:, 0] < free_time[group]) & (via_min_durations < round(interval))
+        if max_speed is not None:
+            selected &= ~(detour > get_detour_bound(interval, time_spent[:, 0], max_speed)) # POIs without location are not pruned
+        scores = scoring.score_directions(group[selected], time_spent[selected, 0], time_spent[selected, 1], rating_n[selected],
+                                          free_time, durations, interval, add_no_stop=add_no_stop)
+        candidates = np.bincount(group[selected], minlength=len(directions))
+        table[interval] = [{'direction': i, 'tracking_interval': interval, 'duration': int(durations[i]),
+                            'min_duration': int(min_durations[i]), 'free_time': int(free_time[i]),
+                            'candidates': int(candidates[i]), 'no_stop_prob': float(scores['no_stop_prob'][i]),
+                            'weighed_no_stop': float(scores['weighed_no_stop'][i]),
+                            'direction_entropy': float(scores['direction_entropy'][i])} 
+                           for i in np.flatnonzero(in_time).tolist()]
+        print("Tracking interval {}: {} in time directions, {} potential POIs".format(interval, int(in_time.sum()), 
+                                                                                     int(selected.sum())))
+
+    return table
+
+
 def no_stop_lognormal(duration, tracking_interval):
     """ Return no stop probability based on the paper: Local Optimization Strategies in Urban Vehicular Mobility"""
     
-    mean_ln = np.log(duration)
-    std_ln = 0.41 # regarding the paper std_nostop is ln
-    
-    dist = sp.stats.lognorm(scale=np.exp(mean_ln), s=std_ln)
-    nostop_probab = dist.sf(tracking_interval) # Survival function (also defined as 1 - cdf)
+    nostop_probab = scoring.no_stop_probability(duration, tracking_interval) # Survival function (also defined as 1 - cdf)
     
     # show_plot(mean_ln, std_ln, 'lognormal')
     """ Confidence interval of three sigma rule: m+s=68%, m+2s=95%, m+3s=99,7%
@@ -526,8 +613,6 @@ def no_stop_lognormal(duration, tracking_interval):
         nostop_probab =  0.021
     else:
         nostop_probab = 0.0013 """
-   
-    print("No stop probability is:", nostop_probab)
     
     return nostop_probab
 
@@ -560,36 +645,143 @@ def convert_to(directions, direction_num=0):
     return new_directions
 
 
-def dsparse_run(tracking_interval):
-    """epfl/mobility dataset processing"""
+def dsparse_file_run(filename, tracking_interval, minutes_interval=10, store=None):
+    """epfl/mobility processing of one data set file:
+    sort -> busy trips -> time windows -> cut -> directions of any navigation provider
+        store: directory of tracestore, the trace is read from it instead of parsing the file"""
 
-    files = iowork.read_all_files()         # get all files in data sets' directory
-    for f in files:                         # for each file
-        directions = dsparse.sort_file(f)   # sort by the time attribute
-        
-        directions = dsparse.get_busy_directions(directions)        # get coordinates in when taxi is busy
-        if not directions:
-            continue
-        directions = dsparse.get_coor_between(directions, 600)      # get coordinates in X seconds time interval
+    directions = tracestore.load(filename, store)               # sort by the time attribute
+    directions = dsparse.get_busy_directions(directions)        # get coordinates in when taxi is busy
+    if not directions:
+        return []
+    directions = dsparse.get_coor_between(directions, minutes_interval*60) # get coordinates in X seconds time interval
+    directions = dsparse.cut_directions(directions, 10000, minutes_interval, tracking_interval)
+    if not directions:
+        return []
+    directions = decode_polylines(directions)
+    directions = get_directions_for_ds(directions, tracking_interval)
 
-        directions = dsparse.cut_directions(directions,10000,tracking_interval)
-        
-        directions = decode_polylines(iowork.get_temp_data('coor_between_new_abboip'),path_num=3)
-        directions = get_directions_for_ds(directions, tracking_interval)
-        iowork.save_temp_data(directions, 'direct_temp_{}'.format(tracking_interval))
-    
-        directions = dsparse.get_for_json(iowork.get_temp_data('direct_temp_{}'.format(tracking_interval)))
-        iowork.save_as_json(directions, 'direct_{}'.format(tracking_interval))
-        dsparse.add_to_json(iowork.get_text_data('direct_{}'.format(tracking_interval), extension='.json'), 
-                                                                    'direct{}'.format(tracking_interval))
     return directions
 
 
+def dsparse_file_worker(filename, tracking_interval, store=None):
+    """run dsparse_file_run() and return (filename, directions, error, provider stats, instrument snapshot) 
+    so that one bad file doesn't stop the whole run, error is the traceback of the failure"""
+
+    stats = provider.get_stats()
+    directions, error = None, None
+    with instrument.recording() as recorder:
+        try:
+            directions = dsparse_file_run(filename, tracking_interval, store=store)
+        except SystemExit as err: # exit() is called by some stages on bad data, the reason is printed by the stage
+            error = "exit({}) called by a stage, see the output of the file above".format(err.code)
+        except Exception:
+            error = traceback.format_exc()
+
+    return filename, directions, error, provider.subtract_stats(provider.get_stats(), stats), recorder.snapshot()
+
+
+def dsparse_run(tracking_interval, workers=1, store=None, incremental=False, shards=0):
+    """epfl/mobility dataset processing
+        workers: 1 - process files one by one, n - number of processes, None - number of CPUs
+        store: directory of tracestore, e.g. 'temp/traces', it is built on the first run and shared by workers
+        incremental: process only files that are new or changed since the previous run (see manifest.Manifest),
+            directions of other files are taken from the previous runs
+        shards: 0 - one output file, n - also save polylines of each cab in files of n directions with an index file
+    Directions of each file are saved to 'temp/direct_parts_<tracking_interval>/<cab>.temp' (see get_part_path()),
+    return polylines of directions (dsparse.get_for_json() format)"""
+
+    files = sorted(iowork.read_all_files())  # get all files in data sets' directory, sorted to keep output order stable
+    stage = 'direct_{}'.format(tracking_interval)
+    if incremental:
+        files_manifest = manifest.Manifest()
+        for filename in files_manifest.remove_missing(files):
+            remove_part(filename, tracking_interval)
+        pending = files_manifest.get_pending(files, stage)
+        print("{} of {} files are new or changed".format(len(pending), len(files)))
+    else:
+        pending = files
+    if store is not None:
+        tracestore.open_store(files, store) # only new or changed files are parsed and appended to the store
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    failed = []
+    stats = provider.new_stats()
+    with contextlib.ExitStack() as stack:
+        if workers > 1 and len(pending) > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=min(workers, len(pending))))
+            results = executor.map(dsparse_file_worker, pending, [tracking_interval]*len(pending), [store]*len(pending))
+        else:
+            results = (dsparse_file_worker(f, tracking_interval, store) for f in pending)
+        for filename, file_directions, error, file_stats, metrics in results: # results of each file are saved when they come
+            provider.add_stats(stats, file_stats)
+            instrument.recorder.merge(metrics)
+            if error is not None:
+                remove_part(filename, tracking_interval) # results of the previous version of the file
+                failed.append(filename)
+                instrument.count('failed_files')
+                print("WARNING! Processing of {} failed: {}".format(filename, error))
+                continue
+            stagecache.write_atomic(file_directions, get_part_path(filename, tracking_interval)) # saved also if save_temp is off
+            if incremental:
+                files_manifest.mark(filename, stage)
+    print("{} of {} files processed".format(len(pending) - len(failed), len(pending)))
+    if failed:
+        print("WARNING! Failed files: {}".format(', '.join(failed)))
+    provider.print_report(stats)
+    if incremental:
+        files_manifest.save()
+
+    # one pass over the parts in the order of files, only one file's directions are loaded at a time
+    rows = []
+    writer = export.JSWriter('direct{}'.format(tracking_interval), plain_name='direct_{}'.format(tracking_interval))
+    shard_writer = export.ShardWriter('direct{}'.format(tracking_interval), chunk_size=shards) if shards else None
+    for filename in files:
+        part = load_part(filename, tracking_interval)
+        for direct, row in zip(part, export.iter_polylines(part)):
+            writer.write(row)
+            if shard_writer is not None:
+                shard_writer.write(tracestore.get_cab(filename), row, direct[-1]['real_path'].get('time_range'))
+            rows.append(row)
+    writer.close()
+    if shard_writer is not None:
+        shard_writer.close()
+    instrument.save('metrics_direct_{}'.format(tracking_interval))
+
+    return rows
+
+
+def get_part_path(filename, tracking_interval, directory='temp'):
+    """path of saved directions of the data set file, see dsparse_run()"""
+
+    return os.path.join(directory, 'direct_parts_{}'.format(tracking_interval), tracestore.get_cab(filename) + '.temp')
+
+
+def load_part(filename, tracking_interval, directory='temp'):
+    """saved directions of the data set file, [] if the file has no saved directions"""
+
+    try:
+        with open(get_part_path(filename, tracking_interval, directory), 'rb') as part_file:
+            return pickle.load(part_file)
+    except FileNotFoundError:
+        return []
+
+
+def remove_part(filename, tracking_interval, directory='temp'):
+    try:
+        os.remove(get_part_path(filename, tracking_interval, directory))
+    except FileNotFoundError:
+        pass
+
+
 """Choose tracking interval in seconds"""
 tracking_interval = 600 # tracking interval is seconds when vehicle position send to the vehicle owner
 
 # Run epfl/mobility data set processing
-# directions = dsparse_run(tracking_interval)
+# directions = dsparse_run(tracking_interval, workers=None, store='temp/traces') # workers=None uses all CPUs, store keeps parsed traces
+# directions = dsparse_run(tracking_interval, incremental=True) # nightly runs: only new or changed files are processed
+# directions = dsparse_run(tracking_interval, shards=1000) # large fleets: output/direct600/ has files of 1000 directions of each cab
 
 """!!!Potential usage!!!"""
 """get Direction and save them to temp file (useful to reduce amount of requests)
@@ -601,8 +793,10 @@ Potential POIs can be found with help of 'get_near_poi_polylines' using paramete
 The function retrives potential POIs from any navigation provider. If list is empty (place_type=[]), 
 the function should retrive all types of POIs providing by any navigation provider.
 The POIs can be filtered during further processing with help of 'get_waypoints_for_poi' (format: ['poi_type1', 'poi_type2']).
+POIs outside the detour ellipse of a direction (max_speed * (min_duration + free_time - time_spent)) are not routed, see get_detour_bound().
 """
 #############################################
+# provider.set_provider(provider.LocalProvider()) # offline stand-in of a navigation provider, responses are cached in temp/
 # directions = get_directions("Kumpulan kampus, 00560 Helsinki", "Sello, Leppävaarankatu 3-9, 02600 Espoo", first_run=True)
 # directions = in_time_directions(directions, tracking_interval)
 # directions = decode_polylines(directions)
@@ -612,4 +806,11 @@ The POIs can be filtered during further processing with help of 'get_waypoints_f
 # iowork.save_as_json(directions, 'direct_entropy_data_'+ str(tracking_interval))
 # iowork.save_temp_data(directions, 'direct_entropy_data_'+ str(tracking_interval))
 # iowork.print_data(iowork.get_temp_data('direct_entropy_data_'+ str(tracking_interval)))
-#############################################
\ No newline at end of file
+# with report.Summary('summary_' + str(tracking_interval)) as summary: summary.add(directions) # CSV and .npz row for each direction
+# provider.print_report()
+# instrument.save() # runtime, calls and cache hits of each stage
+#############################################
+
+"""Sweep of tracking intervals (seconds): routes and POIs are requested once, 
+the function replaces the functions from 'in_time_directions' to 'potential_visit_poi' above"""
+# table = sweep_tracking_intervals(directions, [300, 600, 1200, 1800, 3600], max_radius=1000, place_type=['shopping_mall'])
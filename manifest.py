@@ -0,0 +1,110 @@
+"""Manifest of processed trace files for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+For each file the manifest keeps its size, modification time, sha256 of the content
+and the stages completed for it, so a run over a growing archive processes only new
+and changed files. The hash is computed only when size or mtime changed, a file that
+was touched but not changed keeps its completed stages. get_pending() remembers the state
+of each pending file and mark() saves that state, so a file that grows while it is processed
+is processed again by the next run.
+
+Usage:
+    files_manifest = manifest.Manifest()
+    todo = files_manifest.get_pending(files, 'direct_600')
+    ...
+    files_manifest.mark(filename, 'direct_600')
+    files_manifest.save()
+
+License: MIT
+"""
+
+import hashlib
+import json
+import os
+import time
+
+
+class Manifest:
+    """processed files and their completed stages, saved as JSON in 'path'"""
+
+    def __init__(self, path='temp/manifest.json'):
+        self.path = path
+        try:
+            with open(path, 'r') as manifest_file:
+                self.files = json.load(manifest_file)
+        except FileNotFoundError:
+            self.files = {}
+        self.pending = {} # filename -> entry of the file when get_pending() returned it
+
+    def check(self, filename):
+        """update the entry of the file, return True if the file is new or its content changed"""
+
+        stat = os.stat(filename)
+        entry = self.files.get(filename)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return False
+        digest = get_hash(filename)
+        changed = entry is None or entry['sha256'] != digest
+        if changed:
+            self.files[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest, 'stages': []}
+        else: # touched but not changed
+            entry.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+
+        return changed
+
+    def is_done(self, filename, stage):
+        self.check(filename)
+        return stage in self.files[filename]['stages']
+
+    def get_pending(self, files, stage):
+        """files that are new, changed or have no completed stage"""
+
+        pending = [filename for filename in files if not self.is_done(filename, stage)]
+        for filename in pending:
+            self.pending[filename] = dict(self.files[filename], stages=list(self.files[filename]['stages']))
+
+        return pending
+
+    def mark(self, filename, stage):
+        """mark the stage completed for the file as it was when get_pending() returned it,
+        files that were not returned by get_pending() are checked now"""
+
+        entry = self.pending.pop(filename, None)
+        if entry is None:
+            self.check(filename)
+            entry = self.files[filename]
+        if stage not in entry['stages']:
+            entry['stages'].append(stage)
+        entry['updated'] = round(time.time())
+        self.files[filename] = entry
+
+    def remove_missing(self, files):
+        """forget files that are not in the archive anymore, return them"""
+
+        files = set(files)
+        missing = [filename for filename in self.files if filename not in files]
+        for filename in missing:
+            del self.files[filename]
+
+        return missing
+
+    def save(self):
+        """save the manifest atomically"""
+
+        directory = os.path.dirname(self.path) or '.'
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path + '.part', 'w') as manifest_file:
+            json.dump(self.files, manifest_file, indent=1)
+        os.replace(self.path + '.part', self.path)
+
+
+def get_hash(filename, chunk_size=1024**2):
+    """sha256 of the file content"""
+
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file_object:
+        for chunk in iter(lambda: file_object.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
@@ -0,0 +1,244 @@
+"""Compact data model of CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+GPS points and trips are dsparse.Trace columns (a trip is a view of its cab's trace).
+Direction keeps its path as a Trace instead of a list of dicts of strings,
+Candidates keeps potential POIs of a route in columns instead of nested lists of place dicts,
+POI types are interned by TypeIndex into bits of a per-POI bitmask, so the type filter is one vectorized mask.
+Direction is converted to and from the dict format used by the stages and by JSON output.
+Candidates is built for each route from its 'polyline_coor_POI' dicts (or from poitable.POITable),
+the stages keep the dicts, the only output of Candidates is the waypoint list of the selected POIs (to_waypoints()).
+
+License: MIT
+"""
+
+import dsparse
+
+import numpy as np
+
+
+class Direction:
+    """direction of a trip: points of the path and encoded polylines of the path and of the whole trip"""
+
+    __slots__ = ('path', 'polyline', 'original_polyline')
+
+    def __init__(self, path, polyline=None, original_polyline=None):
+        self.path = path
+        self.polyline = polyline
+        self.original_polyline = original_polyline
+
+    def __len__(self):
+        return len(self.path)
+
+    def origin(self):
+        """'lat,lon' of the first point"""
+
+        return '{},{}'.format(*self.path.coordinates()[0].tolist())
+
+    def destination(self):
+        """'lat,lon' of the last point"""
+
+        return '{},{}'.format(*self.path.coordinates()[-1].tolist())
+
+    @classmethod
+    def from_dict(cls, direction):
+        """Direction of {'path': rows, 'overview_polyline': ..., 'original_polyline': ...} (dsparse.get_coor_between() format)"""
+
+        rows = direction['path']
+        path = dsparse.Trace(np.array([float(row['lat']) for row in rows]),
+                             np.array([float(row['lon']) for row in rows]),
+                             np.array([row['busy'] == '1' for row in rows], dtype=bool),
+                             np.array([int(row['time']) for row in rows], dtype=np.int64),
+                             rows[0].get('filename', 'unknown_filename') if rows else 'unknown_filename')
+
+        return cls(path, direction.get('overview_polyline', {}).get('points'),
+                   direction.get('original_polyline', {}).get('points'))
+
+    def to_dict(self):
+        direction = {'path': self.path.rows()}
+        if self.original_polyline is not None:
+            direction['original_polyline'] = {'points': self.original_polyline}
+        if self.polyline is not None:
+            direction['overview_polyline'] = {'points': self.polyline}
+
+        return direction
+
+
+class TypeIndex:
+    """POI types interned into integer ids, id is the bit of the type in (n, words) uint64 bitmasks
+    Bitmask of each distinct list of types is computed once and reused for all places that have the list."""
+
+    __slots__ = ('names', 'ids', 'masks')
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        self.masks = {} # tuple of types -> bitmask as int
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """id of the type, new types get the next id"""
+
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+
+        return self.ids[name]
+
+    def words(self):
+        return max(1, -(-len(self.names) // 64))
+
+    def get_mask(self, types):
+        """bitmask of the list of types as int, unknown types are added to the index"""
+
+        key = tuple(types)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = 0
+            for name in key:
+                mask |= 1 << self.add(name)
+            self.masks[key] = mask
+
+        return mask
+
+    def get_bits(self, types_lists):
+        """(n, words) bitmasks of n lists of types"""
+
+        masks = [self.get_mask(types) for types in types_lists]
+        words = self.words()
+        if words == 1:
+            return np.array(masks, dtype=np.uint64).reshape(-1, 1)
+
+        return np.array([[(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for word in range(words)] for mask in masks],
+                        dtype=np.uint64).reshape(-1, words)
+
+    def get_filter(self, poi_type, words=None):
+        """(words,) bitmask of poi_type, types that are not in the index match no POI"""
+
+        mask = 0
+        for name in poi_type:
+            if name in self.ids:
+                mask |= 1 << self.ids[name]
+
+        return np.array([(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for word in range(words or self.words())], dtype=np.uint64)
+
+
+default_types = TypeIndex() # types of places of the process, see Candidates.from_polyline_poi()
+
+
+class Candidates:
+    """potential POIs of a route in columns, one row for each POI found at each polyline point
+    time_spent: (n, 2) seconds, -1 if the place has no popular times
+    location: (n, 2) lat/lon of places, nan if the place has no location
+    type_bits: (n, words) bitmasks of types, bits are ids of type_index"""
+
+    __slots__ = ('place_id', 'name', 'types', 'time_spent', 'rating_n', 'populartimes', 'point', 'enriched',
+                 'location', 'type_bits', 'type_index')
+
+    def __init__(self, place_id, name, types, time_spent, rating_n, populartimes, point, enriched,
+                 location=None, type_bits=None, type_index=None):
+        self.place_id = place_id
+        self.name = name
+        self.types = types
+        if type_bits is None:
+            type_index = default_types
+            type_bits = type_index.get_bits(types)
+        if location is None:
+            location = np.full((len(place_id), 2), np.nan)
+        self.location = location
+        self.type_bits = type_bits
+        self.type_index = type_index
+        self.time_spent = time_spent
+        self.rating_n = rating_n
+        self.populartimes = populartimes
+        self.point = point         # index of the polyline point the POI was found at
+        self.enriched = enriched   # False if popular times were not added to the place
+
+    def __len__(self):
+        return len(self.place_id)
+
+    @classmethod
+    def from_polyline_poi(cls, polyline_coor_POI):
+        """Candidates of 'polyline_coor_POI' of a direction: [[(lat, lon), [place, ...]], ...]"""
+
+        places = [place for _point, point_places in polyline_coor_POI for place in point_places]
+        time_spent = np.full((len(places), 2), -1, dtype=np.float64)
+        known = [i for i, place in enumerate(places) if place.get('time_spent', -1) != -1]
+        if known:
+            time_spent[known] = [places[i]['time_spent'] for i in known]
+        types = [place.get('types', []) for place in places]
+
+        return cls([place['place_id'] for place in places],
+                   [place.get('name') for place in places],
+                   types,
+                   time_spent,
+                   np.array([place.get('rating_n', -1) for place in places], dtype=np.float64),
+                   [place.get('populartimes', -1) for place in places],
+                   np.repeat(np.arange(len(polyline_coor_POI)), [len(point_places) for _point, point_places in polyline_coor_POI]),
+                   np.array(['time_spent' in place for place in places], dtype=bool),
+                   get_locations(places), default_types.get_bits(types), default_types)
+
+    @classmethod
+    def from_table(cls, table, polyline_coor_POI):
+        """Candidates of 'polyline_coor_POI' with place_ids instead of places (poitable.strip_places()),
+        columns are gathered from poitable.POITable"""
+
+        place_ids = [place_id for _point, point_places in polyline_coor_POI for place_id in point_places]
+        rows = table.find(place_ids)
+        if (rows < 0).any():
+            raise KeyError("Places are not in POI table: {}".format([place_ids[i] for i in np.flatnonzero(rows < 0)]))
+        columns = table.columns
+
+        return cls(place_ids,
+                   [name.decode('utf-8') for name in columns['name'][rows]],
+                   [table.get_types(row) for row in rows.tolist()],
+                   columns['time_spent'][rows],
+                   columns['rating_n'][rows],
+                   [table.get_populartimes(row) for row in rows.tolist()],
+                   np.repeat(np.arange(len(polyline_coor_POI)), [len(point_places) for _point, point_places in polyline_coor_POI]),
+                   columns['enriched'][rows],
+                   columns['location'][rows], columns['type_bits'][rows], table.type_index)
+
+    def has_type(self, poi_type):
+        """mask of POIs that have any of poi_type, all POIs if poi_type is empty"""
+
+        if not poi_type:
+            return np.ones(len(self), dtype=bool)
+        type_filter = self.type_index.get_filter(poi_type, self.type_bits.shape[1])
+
+        return (self.type_bits & type_filter).any(axis=1)
+
+    def has_time_spent(self):
+        return self.time_spent[:, 0] != -1
+
+    def to_waypoints(self, mask):
+        """waypoint_list of get_waypoints_for_poi(): [place_id, name, types, time_spent, populartimes, rating_n] of selected POIs"""
+
+        return [["place_id:" + self.place_id[i], self.name[i], self.types[i], [get_number(value) for value in self.time_spent[i]],
+                 self.populartimes[i], get_number(self.rating_n[i])] for i in np.flatnonzero(mask).tolist()]
+
+
+def get_location(place):
+    """[lat, lon] of the place, nan if the place has no location"""
+
+    location = place.get('geometry', {}).get('location', {})
+    return [location.get('lat', np.nan), location.get('lng', np.nan)]
+
+
+def get_locations(places):
+    """(n, 2) lat/lon of places, nan if the place has no location"""
+
+    locations = [place.get('geometry', {}).get('location', {}) for place in places]
+
+    return np.column_stack((np.array([location.get('lat', np.nan) for location in locations], dtype=np.float64),
+                            np.array([location.get('lng', np.nan) for location in locations], dtype=np.float64)))
+
+
+def get_number(value):
+    """int if the float has no fraction, as it is in provider responses"""
+
+    return int(value) if float(value).is_integer() else float(value)
@@ -0,0 +1,223 @@
+"""Streaming pipeline from trace files to entropy for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Stages are generators over traces, trips, time windows and directions, so only the items
+that are processed at the moment are held in memory. Nothing is saved to disk
+unless a checkpoint() stage is added to the stream.
+
+Usage:
+    stream = iter_traces(iowork.read_all_files())
+    stream = iter_trips(stream)
+    stream = iter_windows(stream, 600)
+    stream = iter_directions(stream)
+    stream = checkpoint(stream, 'windows_600')
+    for direction in stream: ... # model.Direction, direction.to_dict() is in dsparse.get_coor_between() format
+
+License: MIT
+"""
+
+import dsparse
+import enrich
+import export
+import instrument
+import iowork
+import model
+import poiindex
+import polycodec
+import report
+import stagecache
+import tracestore
+
+import contextlib
+import itertools
+import os
+import pickle
+
+import numpy as np
+
+
+def iter_traces(files, store=None):
+    """yield Trace of each file, from tracestore in 'store' directory if it has the file"""
+
+    for filename in files:
+        if store is None:
+            yield dsparse.parse_trace(filename)
+        else:
+            yield tracestore.load(filename, store)
+
+
+def iter_trips(traces, busy_only=True, split_by=0):
+    """yield trips of each trace as Trace views, see dsparse.segment_trace()"""
+
+    for trace in traces:
+        yield from dsparse.iter_trips(trace, dsparse.segment_trace(trace, split_by=split_by, busy_only=busy_only))
+
+
+def iter_windows(trips, time_interval, max_points=61):
+    """yield (trip, window) pairs, window is a Trace of points in time_interval seconds, see dsparse.get_time_windows()"""
+
+    for trip in trips:
+        for window in dsparse.get_time_windows(trip.time, time_interval, max_points):
+            if len(window) > 1: # one point is not a direction
+                yield trip, trip[window]
+
+
+def iter_directions(windows, batch_size=256):
+    """yield model.Direction of each window, polylines are encoded in batches of windows"""
+
+    batch = []
+    for item in windows:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield from encode_batch(batch)
+            batch = []
+    if batch:
+        yield from encode_batch(batch)
+
+
+def encode_batch(batch):
+    """directions of (trip, window) pairs, polyline of each trip is encoded once"""
+
+    trips = list({id(trip): trip for trip, _window in batch}.values())
+    trip_points = dict(zip((id(trip) for trip in trips),
+                           polycodec.encode_arrays(np.concatenate([trip.coordinates() for trip in trips]),
+                                                   [len(trip) for trip in trips])))
+    window_points = polycodec.encode_arrays(np.concatenate([window.coordinates() for _trip, window in batch]),
+                                            [len(window) for _trip, window in batch])
+    for (trip, window), points in zip(batch, window_points):
+        yield model.Direction(window, points, trip_points[id(trip)])
+
+
+def iter_cut(directions, minutes_interval, tracking_interval, direct_num=None):
+    """yield only directions that continuos more than tracking_interval, see dsparse.cut_directions()"""
+
+    lines = tracking_interval / 60 / minutes_interval
+    num_added = 0
+    for direction in directions:
+        if len(direction) > lines:
+            yield direction
+            num_added += 1
+            if num_added == direct_num:
+                return
+
+
+def get_main():
+    """main module, it imports plotting libraries, so it is loaded only when its stages are called"""
+
+    import main
+
+    return main
+
+
+def iter_entropy(directions, tracking_interval, max_radius=1000, place_type=[], poi_type=None, add_no_stop=False):
+    """yield entropy data of each direction: routes of any navigation provider between the first and
+    the last points of direction's path with probabilities of visit POIs, see main.potential_visit_poi()"""
+
+    main = get_main()
+
+    for direction in directions:
+        routes = main.get_directions(direction.origin(), direction.destination())
+        routes = main.in_time_directions(routes, tracking_interval)
+        if not routes:
+            continue
+        routes = main.decode_polylines(routes)
+        routes = main.get_near_poi_polylines(routes, max_radius, place_type=place_type)
+        routes = main.get_waypoints_for_poi(routes, poi_type)
+        routes = main.potential_visit_poi(routes, tracking_interval, add_no_stop=add_no_stop)
+        for route in routes:
+            route['real_path'] = direction.to_dict()
+        yield routes
+
+
+def checkpoint(stream, name, directory='temp'):
+    """save each item of the stream to 'name.stream' file while passing it further"""
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, name + '.stream')
+    with open(path + '.part', 'wb') as f:
+        for item in stream:
+            pickle.dump(item, f, protocol=4)
+            yield item
+    os.replace(path + '.part', path)
+    print("Stream saved to", name + ".stream in working directory")
+
+
+def read_checkpoint(name, directory='temp'):
+    """yield items saved by checkpoint()"""
+
+    with open(os.path.join(directory, name + '.stream'), 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+@contextlib.contextmanager
+def no_persistence():
+    """disable temp data and stage cache of the stages called inside"""
+
+    save_temp, cache_enabled = iowork.save_temp, stagecache.default_cache.enabled
+    iowork.save_temp, stagecache.default_cache.enabled = False, False
+    try:
+        yield
+    finally:
+        iowork.save_temp, stagecache.default_cache.enabled = save_temp, cache_enabled
+
+
+def stream_entropy(files, tracking_interval, time_interval=600, checkpoints=(), store=None, **entropy_params):
+    """compose stages from trace files to entropy data
+        checkpoints: names of stages to save: 'directions', 'entropy'
+        store: directory of tracestore to read traces from"""
+
+    stream = iter_directions(iter_windows(iter_trips(iter_traces(files, store)), time_interval))
+    stream = iter_cut(stream, time_interval / 60, tracking_interval)
+    if 'directions' in checkpoints:
+        stream = checkpoint(stream, 'directions_{}'.format(time_interval))
+    stream = iter_entropy(stream, tracking_interval, **entropy_params)
+    if 'entropy' in checkpoints:
+        stream = checkpoint(stream, 'entropy_{}'.format(tracking_interval))
+
+    return stream
+
+
+def iter_cab_rows(stream):
+    """(cab, items) groups of entropy stream for export.write_shards(), items are ([start, end] time, polylines) pairs"""
+
+    def get_cab(routes):
+        return routes[0]['real_path']['path'][0].get('filename', 'unknown_filename')
+
+    for cab, group in itertools.groupby(stream, key=get_cab):
+        yield cab, (([int(routes[0]['real_path']['path'][0]['time']), int(routes[0]['real_path']['path'][-1]['time'])], row)
+                    for routes in group for row in export.iter_polylines([routes]))
+
+
+def run(files, tracking_interval, time_interval=600, checkpoints=(), store=None, shards=0, summary=None, **entropy_params):
+    """process files with bounded memory, return number of directions with entropy data
+        shards: 0 - no output, n - save polylines to files of n directions of each cab (see export.write_shards())
+        summary: name of report.Summary files with a row for each direction"""
+
+    count = 0
+
+    def counted(stream):
+        nonlocal count
+        for routes in stream:
+            count += len(routes)
+            if table is not None:
+                table.add(routes, cab=routes[0]['real_path']['path'][0].get('filename', 'unknown_filename'))
+            yield routes
+
+    # POIs are reused by directions of this run only, the summary is saved also if the stream fails
+    with no_persistence(), enrich.run_memo(), poiindex.run_index(), contextlib.ExitStack() as stack:
+        table = stack.enter_context(report.Summary(summary)) if summary else None
+        stream = counted(stream_entropy(files, tracking_interval, time_interval, checkpoints, store, **entropy_params))
+        if shards:
+            export.write_shards(iter_cab_rows(stream), 'entropy{}'.format(tracking_interval), chunk_size=shards)
+        else:
+            for _routes in stream:
+                pass
+    print("Entropy data of {} directions calculated".format(count))
+    instrument.save('metrics_stream_{}'.format(tracking_interval))
+
+    return count
@@ -0,0 +1,174 @@
+"""Local spatial index of POIs for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+POIs received from a navigation provider are merged by place_id and stored in grid cells.
+The index remembers which cells were fully covered by the circles already fetched for each place type,
+so a query whose circle lies in covered cells is answered without a request to the provider.
+Only complete responses cover cells: providers cap the number of results (Google Places returns
+at most 20 results per page and 60 in total), a truncated response may miss POIs of its circle.
+The index of a run is opened by run_index(), it is dropped with all its places after the run,
+and it is emptied when it has more than 'max_places' places, so a long run keeps bounded memory.
+
+Usage:
+    with poiindex.run_index():
+        ... # stages that call main.get_near_poi()
+
+License: MIT
+"""
+
+import geo
+import instrument
+
+import contextlib
+
+import numpy as np
+
+
+class POIIndex:
+    """grid index of POIs, 'cell_size' in meters
+        max_results: result cap of the provider, a response with so many results is treated as truncated
+        max_places: the index is emptied (places and coverage) when it has more places"""
+
+    def __init__(self, cell_size=100, max_results=60, max_places=200000):
+        self.cell_size = cell_size
+        self.max_results = max_results
+        self.max_places = max_places
+        self.step_lat = cell_size / 111320.0
+        self.step_lon = None # set by the first query, cells are square near its latitude
+        self.reset()
+        self.queries = 0
+        self.hits = 0
+
+    def reset(self):
+        """forget places and coverage, counters of queries are kept"""
+
+        self.places = {}   # place_id -> place
+        self.cells = {}    # (row, col) -> list of place_id
+        self.unlocated = {} # (row, col) of the query center -> list of place_id of places without location
+        self.covered = {}  # place type (None for all types) -> set of (row, col) fetched
+
+    def clear(self):
+        self.__init__(self.cell_size, self.max_results, self.max_places)
+
+    def get_cells(self, lat, lon, radius):
+        """rows, cols of cells that intersect the circle and mask of cells that are inside the circle"""
+
+        if self.step_lon is None:
+            self.step_lon = self.cell_size / (111320.0 * np.cos(np.radians(lat)))
+        reach_lat = radius / 111320.0
+        reach_lon = radius / (111320.0 * np.cos(np.radians(lat)))
+        rows = np.arange(np.floor((lat - reach_lat) / self.step_lat), np.floor((lat + reach_lat) / self.step_lat) + 1)
+        cols = np.arange(np.floor((lon - reach_lon) / self.step_lon), np.floor((lon + reach_lon) / self.step_lon) + 1)
+        rows, cols = np.meshgrid(rows.astype(np.int64), cols.astype(np.int64), indexing='ij')
+        rows, cols = rows.ravel(), cols.ravel()
+
+        south, north = rows * self.step_lat, (rows + 1) * self.step_lat
+        west, east = cols * self.step_lon, (cols + 1) * self.step_lon
+        nearest = geo.haversine(lat, lon, np.clip(lat, south, north), np.clip(lon, west, east))
+        farthest = np.maximum.reduce([geo.haversine(lat, lon, corner_lat, corner_lon)
+                                      for corner_lat in (south, north) for corner_lon in (west, east)])
+        touching = nearest <= radius
+
+        return rows[touching], cols[touching], farthest[touching] <= radius
+
+    def is_covered(self, lat, lon, radius, place_type=None):
+        """True if all POIs of the type in the circle were already fetched"""
+
+        rows, cols, _inside = self.get_cells(lat, lon, radius)
+        covered = self.covered.get(place_type, set())
+        covered_all = self.covered.get(None, set())
+
+        return all((row, col) in covered or (row, col) in covered_all for row, col in zip(rows.tolist(), cols.tolist()))
+
+    def add(self, places, lat, lon, radius, place_type=None, complete=True):
+        """add places fetched for the circle, return places merged by place_id
+            complete: False if the response was truncated, the cells of the circle are not marked covered"""
+
+        if len(self.places) + len(places) > self.max_places:
+            self.reset()
+        merged = []
+        for place in places:
+            known = self.places.get(place['place_id'])
+            if known is not None:
+                known.update(place)
+                merged.append(known)
+                continue
+            self.places[place['place_id']] = place
+            merged.append(place)
+            location = place.get('geometry', {}).get('location')
+            if location is not None:
+                self.cells.setdefault(self.to_cell(*geo.parse_location(location)), []).append(place['place_id'])
+            else: # returned by queries that touch the cell of the circle's center
+                self.unlocated.setdefault(self.to_cell(lat, lon), []).append(place['place_id'])
+        if complete:
+            rows, cols, inside = self.get_cells(lat, lon, radius)
+            self.covered.setdefault(place_type, set()).update(zip(rows[inside].tolist(), cols[inside].tolist()))
+
+        return merged
+
+    def query(self, lat, lon, radius, place_type=None):
+        """places of the type in the circle"""
+
+        rows, cols, _inside = self.get_cells(lat, lon, radius)
+        places = []
+        unlocated = {}
+        for cell in zip(rows.tolist(), cols.tolist()):
+            for place_id in self.cells.get(cell, ()):
+                place = self.places[place_id]
+                if place_type and place_type not in place.get('types', ()):
+                    continue
+                places.append(place)
+            for place_id in self.unlocated.get(cell, ()):
+                place = self.places[place_id]
+                if not place_type or place_type in place.get('types', ()):
+                    unlocated[place_id] = place
+        if places:
+            locations = np.array([geo.parse_location(place['geometry']['location']) for place in places])
+            inside = geo.haversine(lat, lon, locations[:, 0], locations[:, 1]) <= radius
+            places = [place for place, keep in zip(places, inside) if keep]
+
+        return places + list(unlocated.values())
+
+    def is_complete(self, response):
+        """False if the provider's response was truncated or failed"""
+
+        if response.get('next_page_token') or response.get('status', 'OK') not in ('OK', 'ZERO_RESULTS'):
+            return False
+        return self.max_results is None or len(response.get('results', [])) < self.max_results
+
+    def to_cell(self, lat, lon):
+        if self.step_lon is None:
+            self.step_lon = self.cell_size / (111320.0 * np.cos(np.radians(lat)))
+        return int(np.floor(lat / self.step_lat)), int(np.floor(lon / self.step_lon))
+
+    def get_near_poi(self, location, radius, place_type, fetch):
+        """return {'results': places} from the index if the circle is covered,
+        otherwise get them with fetch(location, radius, place_type) and add them to the index"""
+
+        lat, lon = geo.parse_location(location)
+        self.queries += 1
+        if self.is_covered(lat, lon, radius, place_type):
+            self.hits += 1
+            instrument.count('poi_index_hits')
+            return {'results': self.query(lat, lon, radius, place_type), 'status': 'OK'}
+        instrument.count('poi_index_misses')
+        places = fetch(location, radius, place_type)
+        places['results'] = self.add(places['results'], lat, lon, radius, place_type, self.is_complete(places))
+
+        return places
+
+
+default_index = POIIndex()
+
+
+@contextlib.contextmanager
+def run_index(index=None):
+    """POIs fetched inside the block are kept in a new index (or 'index') that is dropped after the block"""
+
+    global default_index
+    previous = default_index
+    default_index = index if index is not None else POIIndex(previous.cell_size, previous.max_results, previous.max_places)
+    try:
+        yield default_index
+    finally:
+        default_index = previous
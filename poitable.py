@@ -0,0 +1,189 @@
+"""Shared-memory table of enriched POIs for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Places (place_id, name, types, location, rating, time spent, popular times) are stored
+in fixed-width columns of one multiprocessing.shared_memory block, rows are sorted by place_id,
+so the id -> row index is a binary search over the place_id column. Types are also stored as bitmasks
+of model.TypeIndex ids of the table. A table sent to a worker
+process is pickled as the name and layout of the block only, the worker reads the columns zero-copy.
+The stage cache identifies a table by the digest of its content (get_cache_key()), not by the block name
+that is new in each run.
+
+Usage:
+    table = poitable.POITable.create(places)
+    directions = poitable.strip_places(directions)  # polyline_coor_POI keeps place_ids only
+    ... # executor.map(worker, cabs, [table]*len(cabs)), model.Candidates.from_table(table, polyline_coor_POI)
+    directions = poitable.restore_places(directions, places)
+    table.close()
+    table.unlink()
+
+License: MIT
+"""
+
+import hashlib
+from multiprocessing import shared_memory
+
+import model
+
+import numpy as np
+
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+class POITable:
+    """fixed-width columns of places in a shared memory block"""
+
+    def __init__(self, memory, layout, type_names=(), digest='', owner=False):
+        self.memory = memory
+        self.layout = layout  # [(column, dtype, shape, offset)]
+        self.digest = digest  # sha256 of the columns
+        self.type_index = model.TypeIndex(type_names)
+        self.owner = owner
+        self.columns = {column: np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+                        for column, dtype, shape, offset in layout}
+
+    def __len__(self):
+        return len(self.columns['place_id'])
+
+    def __getstate__(self): # only the name and layout of the block are sent to other processes
+        return {'name': self.memory.name, 'layout': self.layout, 'type_names': self.type_index.names, 'digest': self.digest}
+
+    def __setstate__(self, state):
+        # worker processes share the resource tracker of the creator, so the block is tracked once
+        self.__init__(shared_memory.SharedMemory(name=state['name']), state['layout'], state['type_names'],
+                      state['digest'])
+
+    @classmethod
+    def create(cls, places):
+        """table of places (dicts of enriched places, see enrich.enrich_places()), duplicated place_ids are stored once"""
+
+        places = sorted({place['place_id']: place for place in places}.values(), key=lambda place: place['place_id'])
+        n = len(places)
+        type_index = model.TypeIndex()
+        columns = {
+            'place_id': np.array([place['place_id'].encode('utf-8') for place in places], dtype=bytes),
+            'name': np.array([str(place.get('name', '')).encode('utf-8') for place in places], dtype=bytes),
+            'types': np.array([','.join(place.get('types', [])).encode('utf-8') for place in places], dtype=bytes),
+            'location': np.array([model.get_location(place) for place in places], dtype=np.float64).reshape(n, 2),
+            'rating': np.array([place.get('rating', -1) for place in places], dtype=np.float64),
+            'rating_n': np.array([place.get('rating_n', -1) for place in places], dtype=np.float64),
+            'time_spent': np.array([get_time_spent(place) for place in places], dtype=np.float64).reshape(n, 2),
+            'populartimes': np.array([get_populartimes(place) for place in places], dtype=np.int16).reshape(n, 7, 24),
+            'enriched': np.array(['time_spent' in place for place in places], dtype=bool),
+            'type_bits': type_index.get_bits([place.get('types', []) for place in places]),
+        }
+        layout = []
+        size = 0
+        digest = hashlib.sha256()
+        for column, values in columns.items():
+            if values.dtype.itemsize == 0: # empty strings
+                values = values.astype('S1')
+                columns[column] = values
+            layout.append((column, values.dtype.str, values.shape, size))
+            size += values.nbytes + (-values.nbytes % 8) # keep the next column aligned
+            digest.update('{}:{}:{}'.format(column, values.dtype.str, values.shape).encode('utf-8'))
+            digest.update(np.ascontiguousarray(values).data)
+        digest.update(','.join(type_index.names).encode('utf-8'))
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        table = cls(memory, layout, type_index.names, digest.hexdigest(), owner=True)
+        for column, values in columns.items():
+            table.columns[column][...] = values
+
+        return table
+
+    def get_cache_key(self):
+        """digest of the content, see stagecache.HashPickler"""
+
+        return self.digest
+
+    def find(self, place_ids):
+        """rows of place_ids, -1 for places that are not in the table"""
+
+        keys = np.array([str(place_id).encode('utf-8') for place_id in place_ids], dtype=bytes)
+        if len(self) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.columns['place_id'], keys), len(self) - 1)
+        found = self.columns['place_id'][rows] == keys
+
+        return np.where(found, rows, -1)
+
+    def get_types(self, row):
+        types = self.columns['types'][row].decode('utf-8')
+        return types.split(',') if types else []
+
+    def get_populartimes(self, row):
+        """popular times in populartimes library format, -1 if the place has no popular times"""
+
+        data = self.columns['populartimes'][row]
+        if data[0, 0] < 0:
+            return -1
+        return [{'name': day, 'data': data[i].tolist()} for i, day in enumerate(DAYS)]
+
+    def get_place(self, row):
+        """place dict of the row in enrich.enrich_places() format"""
+
+        place = {'place_id': self.columns['place_id'][row].decode('utf-8'), 'name': self.columns['name'][row].decode('utf-8'),
+                 'types': self.get_types(row),
+                 'geometry': {'location': {'lat': float(self.columns['location'][row, 0]),
+                                           'lng': float(self.columns['location'][row, 1])}}}
+        if self.columns['enriched'][row]:
+            time_spent = self.columns['time_spent'][row]
+            place.update({'rating': float(self.columns['rating'][row]), 'rating_n': int(self.columns['rating_n'][row]),
+                          'time_spent': -1 if time_spent[0] == -1 else time_spent.astype(np.int64).tolist(),
+                          'populartimes': self.get_populartimes(row)})
+
+        return place
+
+    def close(self):
+        self.columns = {}
+        self.memory.close()
+
+    def unlink(self):
+        """remove the block, called by the process that created the table"""
+
+        if self.owner:
+            self.memory.unlink()
+
+
+def get_time_spent(place):
+    time_spent = place.get('time_spent', -1)
+    return [-1, -1] if time_spent == -1 else time_spent
+
+
+def get_populartimes(place):
+    """(7, 24) array of popular times, -1 if the place has no popular times"""
+
+    data = np.full((7, 24), -1, dtype=np.int16)
+    populartimes = place.get('populartimes', -1)
+    if populartimes != -1:
+        for i, day in enumerate(populartimes[:7]):
+            data[i, :len(day['data'])] = day['data']
+
+    return data
+
+
+def strip_places(directions):
+    """directions with place_ids instead of place dicts in 'polyline_coor_POI', to send them to other processes"""
+
+    stripped = []
+    for direction in directions:
+        direction = dict(direction)
+        if 'polyline_coor_POI' in direction:
+            direction['polyline_coor_POI'] = [[point, [place['place_id'] for place in places]]
+                                              for point, places in direction['polyline_coor_POI']]
+        stripped.append(direction)
+
+    return stripped
+
+
+def restore_places(directions, places):
+    """directions with place dicts of places instead of place_ids in 'polyline_coor_POI', see strip_places()"""
+
+    places = {place['place_id']: place for place in places}
+    for direction in directions:
+        if 'polyline_coor_POI' in direction:
+            direction['polyline_coor_POI'] = [[point, [places[place_id] for place_id in place_ids]]
+                                              for point, place_ids in direction['polyline_coor_POI']]
+
+    return directions
@@ -0,0 +1,100 @@
+"""Batch encoding/decoding of polylines for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Encoded Polyline Algorithm Format done with NumPy array operations for many polylines at once.
+The output is the same as the output of 'polyline' package.
+
+License: MIT
+"""
+
+import numpy as np
+
+
+MAX_CHUNKS = 13 # 5-bit chunks of a 64-bit value
+
+
+def encode_arrays(coordinates, lengths, precision=5):
+    """encode (n, 2) array of lat/lon pairs of several polylines, 'lengths' is a number of points of each polyline
+    return list of encoded polylines"""
+
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if len(coordinates) == 0:
+        return [''] * len(lengths)
+
+    scaled = coordinates * int(10 ** precision)
+    values = np.copysign(np.floor(np.abs(scaled) + 0.5), scaled).astype(np.int64) # round half away from zero
+    deltas = np.empty_like(values)
+    deltas[0] = values[0]
+    deltas[1:] = values[1:] - values[:-1]
+    starts = np.cumsum(lengths) - lengths
+    starts = starts[lengths > 0]
+    deltas[starts] = values[starts] # first point of each polyline is encoded from zero
+
+    deltas = deltas.ravel()
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    shifts = np.arange(MAX_CHUNKS, dtype=np.int64) * 5
+    chunks = (zigzag[:, None] >> shifts) & 0x1f
+    counts = np.maximum(1, np.count_nonzero((zigzag[:, None] >> shifts) > 0, axis=1))
+    width = int(counts.max())
+    chunks = chunks[:, :width]
+    position = np.arange(width)
+    chunks[position < (counts - 1)[:, None]] |= 0x20 # continuation bit for all chunks but the last one
+    chars = (chunks[position < counts[:, None]] + 63).astype(np.uint8)
+
+    text = chars.tobytes().decode('ascii')
+    value_chars = np.concatenate(([0], np.cumsum(counts)))
+    bounds = value_chars[np.concatenate(([0], np.cumsum(lengths * 2)))]
+
+    return [text[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def encode_many(paths, precision=5):
+    """encode list of coordinate lists/arrays [(lat, lon), ...]"""
+
+    arrays = [np.asarray(path, dtype=np.float64).reshape(-1, 2) for path in paths]
+    lengths = [len(path) for path in arrays]
+    if not arrays:
+        return []
+
+    return encode_arrays(np.concatenate(arrays), lengths, precision)
+
+
+def decode_arrays(expressions, precision=5):
+    """decode list of encoded polylines
+    return (n, 2) array of lat/lon pairs of all polylines and number of points of each polyline"""
+
+    expressions = list(expressions)
+    buffer = np.frombuffer(''.join(expressions).encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    if len(buffer) == 0:
+        return np.empty((0, 2), dtype=np.float64), np.zeros(len(expressions), dtype=np.int64)
+
+    last = (buffer & 0x20) == 0 # the last chunk of each value
+    value_ends = np.flatnonzero(last)
+    value_starts = np.concatenate(([0], value_ends[:-1] + 1))
+    position = np.arange(len(buffer)) - np.repeat(value_starts, value_ends - value_starts + 1)
+    values = np.add.reduceat((buffer & 0x1f) << (5 * position), value_starts)
+    values = (values >> 1) ^ -(values & 1)
+
+    text_ends = np.cumsum([len(expression) for expression in expressions])
+    value_counts = np.diff(np.concatenate(([0], np.searchsorted(value_ends, text_ends - 1, side='right'))))
+    lengths = value_counts // 2
+
+    pairs = values.reshape(-1, 2)
+    totals = np.cumsum(pairs, axis=0)
+    starts = (np.cumsum(lengths) - lengths)[lengths > 0]
+    offsets = np.repeat(totals[starts] - pairs[starts], lengths[lengths > 0], axis=0) # sum of previous polylines
+    coordinates = (totals - offsets) / float(10 ** precision)
+
+    return coordinates, lengths
+
+
+def decode_many(expressions, precision=5):
+    """decode list of encoded polylines to list of (n, 2) arrays"""
+
+    expressions = list(expressions)
+    if not expressions:
+        return []
+    coordinates, lengths = decode_arrays(expressions, precision)
+
+    return np.split(coordinates, np.cumsum(lengths)[:-1])
@@ -0,0 +1,428 @@
+"""Navigation provider interface for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Provider - interface that any navigation provider should implement
+LocalProvider - deterministic stand-in that synthesizes routes and POIs, to run the pipeline offline
+CountedProvider - counts requests and latency of any provider, set_provider() always adds it
+CachedProvider - on-disk (SQLite) cache of responses of any provider
+
+License: MIT
+"""
+
+import geo
+import instrument
+import polycodec
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class Provider:
+    """!!!Potential class!!!
+    interface of any navigation provider, responses are in Google Maps format"""
+
+    name = 'provider'
+
+    def get_namespace(self):
+        """name and parameters of the provider that change its responses, cached responses are kept per namespace"""
+
+        return self.name
+
+    def directions(self, origin, destination, waypoints=None):
+        """list of routes from origin to destination via waypoints"""
+
+        raise NotImplementedError("No navigation provider is set, see provider.set_provider()")
+
+    def near_places(self, location, radius, place_type=None):
+        """{'results': [places]} in radius (meters) of location 'lat,lon'"""
+
+        raise NotImplementedError("No navigation provider is set, see provider.set_provider()")
+
+    def popular_times(self, place_id):
+        """dict with 'rating', 'rating_n', 'time_spent' (minutes) and 'populartimes' of the place"""
+
+        raise NotImplementedError("No navigation provider is set, see provider.set_provider()")
+
+
+class LocalProvider(Provider):
+    """deterministic stand-in of a navigation provider
+    Routes go along the grid (or straight line) between points, addresses that are not 'lat,lon'
+    are placed by their hash around 'center'. POIs are placed on a grid with 'poi_spacing' meters step."""
+
+    name = 'local'
+    place_types = ('restaurant', 'cafe', 'shopping_mall', 'store', 'gas_station', 'bank', 'gym', 'park')
+
+    def __init__(self, center=(37.7749, -122.4194), speed=8.3, geometry='grid', poi_spacing=250,
+                 point_step=200, latency=0.0):
+        self.center = center
+        self.speed = speed # meters per second
+        self.geometry = geometry
+        self.poi_spacing = poi_spacing
+        self.point_step = point_step # meters between points of the route polyline
+        self.latency = latency # seconds of artificial delay of each request
+
+    def get_namespace(self):
+        return json.dumps([self.name, list(self.center), self.speed, self.geometry, self.poi_spacing, self.point_step])
+
+    def geocode(self, address):
+        """(lat, lon) of 'lat,lon', 'place_id:local_lat_lon' or any address"""
+
+        address = str(address).strip()
+        if address.startswith('place_id:'):
+            address = address[len('place_id:'):]
+        if address.startswith('local_'):
+            _prefix, lat, lon = address.split('_')
+            return float(lat), float(lon)
+        try:
+            return geo.parse_location(address)
+        except ValueError:
+            digest = hashlib.sha256(address.encode('utf-8')).digest()
+            shift_lat = int.from_bytes(digest[:4], 'big') / 2**32 - 0.5
+            shift_lon = int.from_bytes(digest[4:8], 'big') / 2**32 - 0.5
+            return self.center[0] + shift_lat * 0.2, self.center[1] + shift_lon * 0.2
+
+    def get_leg(self, start, end, start_address, end_address):
+        """leg between two points with polyline coordinates"""
+
+        if self.geometry == 'grid':
+            corners = np.array([start, (end[0], start[1]), end])
+        else:
+            corners = np.array([start, end])
+        points = [corners[:1]]
+        distance = 0.0
+        for a, b in zip(corners[:-1], corners[1:]):
+            length = float(geo.haversine(a[0], a[1], b[0], b[1]))
+            distance += length
+            steps = max(1, int(np.ceil(length / self.point_step)))
+            fraction = np.arange(1, steps + 1)[:, None] / steps
+            points.append(a + (b - a) * fraction)
+        duration = int(round(distance / self.speed)) + 60 # a minute to start and to park
+        leg = {'distance': {'value': int(round(distance)), 'text': '{:.1f} km'.format(distance / 1000)},
+               'duration': {'value': duration, 'text': '{} mins'.format(round(duration / 60))},
+               'start_address': start_address, 'end_address': end_address,
+               'start_location': {'lat': start[0], 'lng': start[1]}, 'end_location': {'lat': end[0], 'lng': end[1]}}
+
+        return leg, np.concatenate(points)
+
+    def directions(self, origin, destination, waypoints=None):
+        self.wait()
+        addresses = [origin]
+        if waypoints:
+            addresses.extend(waypoints if isinstance(waypoints, (list, tuple)) else [waypoints])
+        addresses.append(destination)
+        locations = [self.geocode(address) for address in addresses]
+
+        legs = []
+        coordinates = []
+        for i in range(len(locations) - 1):
+            leg, points = self.get_leg(locations[i], locations[i+1], str(addresses[i]), str(addresses[i+1]))
+            legs.append(leg)
+            coordinates.append(points if i == 0 else points[1:])
+        points = polycodec.encode_many([np.concatenate(coordinates)])[0]
+
+        return [{'legs': legs, 'overview_polyline': {'points': points}, 'summary': self.name}]
+
+    def near_places(self, location, radius, place_type=None):
+        self.wait()
+        lat, lon = geo.parse_location(location)
+        step_lat = self.poi_spacing / 111320.0
+        step_lon = self.poi_spacing / (111320.0 * np.cos(np.radians(self.center[0]))) # the same grid for all queries
+        reach_lat = int(np.ceil(radius / self.poi_spacing))
+        reach_lon = int(np.ceil(radius / (step_lon * 111320.0 * np.cos(np.radians(lat)))))
+        row = np.arange(round(lat / step_lat) - reach_lat, round(lat / step_lat) + reach_lat + 1)
+        col = np.arange(round(lon / step_lon) - reach_lon, round(lon / step_lon) + reach_lon + 1)
+        grid_lat, grid_lon = np.meshgrid(np.round(row * step_lat, 5), np.round(col * step_lon, 5), indexing='ij')
+        grid_lat, grid_lon = grid_lat.ravel(), grid_lon.ravel()
+        inside = geo.haversine(lat, lon, grid_lat, grid_lon) <= radius
+
+        results = []
+        for poi_lat, poi_lon in zip(grid_lat[inside], grid_lon[inside]):
+            place_id = 'local_{:.5f}_{:.5f}'.format(poi_lat, poi_lon)
+            seed = self.get_seed(place_id)
+            types = [self.place_types[seed % len(self.place_types)], 'point_of_interest', 'establishment']
+            if place_type and place_type not in types:
+                continue
+            results.append({'place_id': place_id, 'name': 'POI {}'.format(seed % 100000), 'types': types,
+                            'geometry': {'location': {'lat': float(poi_lat), 'lng': float(poi_lon)}}})
+
+        return {'results': results, 'status': 'OK' if results else 'ZERO_RESULTS'}
+
+    def popular_times(self, place_id):
+        self.wait()
+        seed = self.get_seed(str(place_id))
+        result = {'id': place_id, 'rating': 3 + (seed % 21) / 10, 'rating_n': seed % 500}
+        if seed % 5: # some places don't have time spent information
+            low = 5 + seed % 60
+            result['time_spent'] = [low, low + (seed >> 8) % 60]
+            result['populartimes'] = [{'name': day, 'data': [(seed >> hour) % 100 for hour in range(24)]}
+                                      for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')]
+
+        return result
+
+    def get_seed(self, text):
+        return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+# the total size of responses is kept in the meta table by triggers, so eviction doesn't scan the table,
+# the index on 'accessed' gives least recently used responses first
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, size INTEGER, latency REAL, created REAL, accessed REAL);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+INSERT INTO meta SELECT 'size', (SELECT COALESCE(SUM(size), 0) FROM responses) WHERE NOT EXISTS (SELECT 1 FROM meta WHERE name = 'size');
+CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses
+    BEGIN UPDATE meta SET value = value + NEW.size WHERE name = 'size'; END;
+CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses
+    BEGIN UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'size'; END;
+CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses
+    BEGIN UPDATE meta SET value = value - OLD.size WHERE name = 'size'; END;
+"""
+
+
+class ResponseCache:
+    """SQLite cache of provider responses
+    Responses older than 'ttl' seconds are expired, least recently used responses are removed
+    when the size of responses exceeds 'max_bytes'."""
+
+    def __init__(self, path='temp/provider_cache.sqlite', ttl=30*24*3600, max_bytes=256*1024**2):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.connection = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self): # connection is opened again in other processes
+        state = self.__dict__.copy()
+        state['connection'] = None
+        state['pid'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.executescript(SCHEMA)
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, key):
+        """return (True, response, latency of the original request) or (False, None, 0)"""
+
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT value, latency, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return False, None, 0.0
+            now = time.time()
+            if self.ttl is not None and row[2] + self.ttl < now:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                connection.commit()
+                return False, None, 0.0
+            connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            connection.commit()
+
+        return True, json.loads(row[0]), row[1]
+
+    def put(self, key, value, latency):
+        value = json.dumps(value)
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+                               'value = excluded.value, size = excluded.size, latency = excluded.latency, '
+                               'created = excluded.created, accessed = excluded.accessed',
+                               (key, value, len(value), latency, now, now))
+            self.evict(connection)
+            connection.commit()
+
+    def evict(self, connection):
+        """remove least recently used responses until the cache fits to max_bytes"""
+
+        total = self.get_size(connection)
+        while total > self.max_bytes:
+            rows = connection.execute('SELECT key, size FROM responses ORDER BY accessed LIMIT 256').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                total -= size
+
+    def get_size(self, connection=None):
+        """size of responses in bytes, kept up to date by triggers of the responses table"""
+
+        connection = connection or self.connect()
+        return connection.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+
+class CountedProvider(Provider):
+    """provider that counts requests to 'provider' (stats and 'provider_calls' event of instrument)"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.name = provider.name
+        self.stats = new_stats()
+        self.stats_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['stats_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.stats_lock = threading.Lock()
+
+    def get_namespace(self):
+        return self.provider.get_namespace()
+
+    def request(self, method, params):
+        start_time = time.time()
+        response = getattr(self.provider, method)(*params)
+        self.count(misses=1, latency=time.time() - start_time)
+        instrument.count('provider_calls')
+        return response
+
+    def count(self, **values):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def directions(self, origin, destination, waypoints=None):
+        return self.request('directions', (origin, destination, waypoints))
+
+    def near_places(self, location, radius, place_type=None):
+        return self.request('near_places', (location, radius, place_type))
+
+    def popular_times(self, place_id):
+        return self.request('popular_times', (place_id,))
+
+
+class CachedProvider(CountedProvider):
+    """provider that returns cached responses of 'provider' for already requested parameters"""
+
+    def __init__(self, provider, cache=None):
+        super().__init__(provider)
+        self.cache = cache if cache is not None else ResponseCache()
+        self.name = 'cached_' + provider.name
+
+    def request(self, method, params):
+        key = get_request_key(self.provider.get_namespace(), method, params)
+        hit, response, latency = self.cache.get(key)
+        if hit:
+            self.count(hits=1, latency_saved=latency)
+            instrument.count('provider_cache_hits')
+            return response
+        start_time = time.time()
+        response = getattr(self.provider, method)(*params)
+        latency = time.time() - start_time
+        self.cache.put(key, response, latency)
+        self.count(misses=1, latency=latency)
+        instrument.count('provider_calls')
+        return response
+
+
+def normalize(value):
+    """normalize request parameter: strip addresses, round 'lat,lon' coordinates"""
+
+    if isinstance(value, str):
+        value = ' '.join(value.split())
+        try:
+            lat, lon = geo.parse_location(value)
+            return '{:.6f},{:.6f}'.format(lat, lon)
+        except ValueError:
+            return value
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+
+def get_request_key(namespace, method, params):
+    """hash of provider's namespace (Provider.get_namespace()) and normalized request parameters"""
+
+    text = json.dumps([namespace, method, normalize(list(params))], sort_keys=True)
+
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def new_stats():
+    return {'requests': 0, 'hits': 0, 'misses': 0, 'latency': 0.0, 'latency_saved': 0.0}
+
+
+_provider = Provider()
+
+
+def get_provider():
+    return _provider
+
+
+def set_provider(provider, cache=True, **cache_params):
+    """set provider used by the application, requests are counted by CountedProvider,
+    cache=True wraps it with CachedProvider"""
+
+    global _provider
+    if cache and not isinstance(provider, CachedProvider):
+        if isinstance(provider, CountedProvider):
+            provider = provider.provider
+        provider = CachedProvider(provider, ResponseCache(**cache_params))
+    elif not isinstance(provider, CountedProvider):
+        provider = CountedProvider(provider)
+    _provider = provider
+
+    return _provider
+
+
+def get_stats():
+    """copy of request counters of the current provider"""
+
+    stats = getattr(_provider, 'stats', None)
+    if stats is None:
+        return new_stats()
+    return dict(stats)
+
+
+def subtract_stats(after, before):
+    return {name: after[name] - before[name] for name in after}
+
+
+def add_stats(total, stats):
+    for name, value in stats.items():
+        total[name] = total.get(name, 0) + value
+    return total
+
+
+def print_report(stats=None):
+    """print cache hit rate and latency saved by the response cache"""
+
+    if stats is None:
+        stats = get_stats()
+    if not stats['requests']:
+        print("No requests to navigation provider")
+        return stats
+    print("Navigation provider requests: {}, cache hits: {} ({:.1f}%), latency: {:.2f} s, latency saved: {:.2f} s".format(
+        stats['requests'], stats['hits'], stats['hits'] / stats['requests'] * 100, stats['latency'], stats['latency_saved']))
+
+    return stats
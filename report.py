@@ -0,0 +1,137 @@
+"""Reports and tabular summary of entropy data for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+write_report() streams the text report of a route file section by section through a buffered file,
+directions are not changed. Summary collects one row per direction of all cabs and tracking intervals
+and saves it as CSV and as columns in .npz file, so fleet analytics doesn't need the pickled directions.
+
+Usage:
+    report.write_report(directions)                    # output/output_<filename>_<interval>.txt
+    summary = report.Summary('summary')
+    summary.add(directions, cab='new_abc')             # directions after main.potential_visit_poi()
+    summary.close()                                    # output/summary.csv, output/summary.npz
+
+License: MIT
+"""
+
+import csv
+import os
+
+import numpy as np
+
+
+BUFFER_SIZE = 1024**2
+
+COLUMNS = ('cab', 'start_time', 'tracking_interval', 'direction', 'duration', 'min_duration', 'free_time', 'candidates',
+           'direction_entropy', 'no_stop_prob', 'weighed_no_stop')
+
+
+def write_report(directions, filename=None, directory='output'):
+    """write text report of directions after main.potential_visit_poi(), return path of the report"""
+
+    tracking = directions[0]['tracking_interval']
+    if filename is None:
+        filename = "output_{}_{:.0f}".format(directions[0]['filename'], tracking)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, filename + '.txt')
+    with open(path, 'w', encoding='utf-8', buffering=BUFFER_SIZE) as text_file:
+        text_file.write("Route has {} directions\nStart address: {}\nEnd address: {}\nTracking interval: {:.0f}\n\n".format(
+            len(directions), directions[0]['legs'][0]['start_address'], directions[0]['legs'][0]['end_address'], tracking))
+        for i, direction in enumerate(directions):
+            text_file.write(get_section(i, direction, directions[0]))
+    print("Data saved to", filename + ".txt in " + directory + " directory")
+
+    return path
+
+
+def get_section(i, direction, first):
+    """report section of the direction, 'first' direction keeps the POI types of the route"""
+
+    entropy_data = direction['entropy_data']
+    normal_prob = entropy_data['normal_prob']
+    lines = ["Direction {}".format(i),
+             "Distance: {} ({})".format(direction['legs'][0]['distance']['value'], direction['legs'][0]['distance']['text']),
+             "Navigation's duration: {} ({})".format(direction['legs'][0]['duration']['value'],
+                                                     direction['legs'][0]['duration']['text']),
+             "Min duration: {}".format(direction['min_duration']),
+             "Max free time: {}".format(direction['overview_free_time']),
+             "Downloaded POI types: {}".format(first.get('place_type', 'Not specified')),
+             "Selected POI types: {}\n".format(first.get('filtered_poi', 'Not specified')),
+             "No stop probability is: {}".format(round(entropy_data['no_stop_prob'], 2)),
+             "Weighed stop probability is: {}".format(round(entropy_data['weighed_no_stop'], 2))]
+    if 'all_destinations' in direction:
+        lines.append("Amount of potential POIs: {}".format(len(direction['all_destinations'])))
+    else:
+        lines.append("No of potential POIs are presented")
+    lines.append("Normalized probabilities of visit POI: {}".format([round(prob, 3) for prob in normal_prob]))
+    if 'ellipse_area' in direction:
+        lines.append("Ellipse area: {}".format(direction['ellipse_area']))
+    lines.append("Entropy: {:.2f}\n".format(entropy_data['direction_entropy']))
+    lines.append("In detail:")
+    if normal_prob:
+        lines.extend("POI[{}], probability of visit: {:.1f}%".format(j, prob * 100) for j, prob in enumerate(normal_prob))
+    else:
+        lines.append("No of potential POIs are presented")
+
+    return '\n'.join(lines) + '\n\n\n'
+
+
+def get_rows(directions, cab=None):
+    """summary rows of directions after main.potential_visit_poi()"""
+
+    if cab is None:
+        cab = directions[0].get('filename', 'unknown_filename') if directions else 'unknown_filename'
+    rows = []
+    for i, direction in enumerate(directions):
+        entropy_data = direction.get('entropy_data', {})
+        path = direction.get('real_path', {}).get('path') # real path of pipeline.iter_entropy()
+        rows.append({'cab': cab, 'start_time': int(path[0]['time']) if path else 0,
+                     'tracking_interval': round(direction.get('tracking_interval', 0) * 60), 'direction': i,
+                     'duration': direction['duration'], 'min_duration': direction['min_duration'],
+                     'free_time': direction['overview_free_time'], 'candidates': len(direction.get('all_destinations', [])),
+                     'direction_entropy': entropy_data.get('direction_entropy', 0.0),
+                     'no_stop_prob': entropy_data.get('no_stop_prob', 0.0),
+                     'weighed_no_stop': entropy_data.get('weighed_no_stop', 0.0)})
+
+    return rows
+
+
+class Summary:
+    """one row per direction of all cabs and tracking intervals, saved to 'name.csv' while rows are added
+    and to 'name.npz' (one array for each column) by close()"""
+
+    def __init__(self, name='summary', directory='output'):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, name)
+        self.file = open(self.path + '.csv', 'w', newline='', encoding='utf-8', buffering=BUFFER_SIZE)
+        self.writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+        self.writer.writeheader()
+        self.columns = {column: [] for column in COLUMNS}
+
+    def add(self, directions, cab=None):
+        """add directions after main.potential_visit_poi()"""
+
+        self.add_rows(get_rows(directions, cab))
+
+    def add_rows(self, rows, cab=None):
+        """add rows of COLUMNS, e.g. rows of main.sweep_tracking_intervals() table"""
+
+        for row in rows:
+            row = {column: row.get(column, cab if column == 'cab' else 0) for column in COLUMNS}
+            self.writer.writerow(row)
+            for column in COLUMNS:
+                self.columns[column].append(row[column])
+
+    def close(self):
+        self.file.close()
+        np.savez(self.path + '.npz', **{column: np.array(values, dtype=str if column == 'cab' else None)
+                                       for column, values in self.columns.items()})
+        print("Summary of {} directions saved to {}.csv and {}.npz".format(len(self.columns['cab']), self.path, self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,73 @@
+"""Deduplicated concurrent routing for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Routes via POIs of all directions of a run are collected first, each unique
+(origin, destination, waypoint) request is sent to the navigation provider once
+with bounded concurrency, and every direction gets its own copy of the routes.
+
+Usage:
+    planner = routing.RoutePlanner()
+    planner.add(origin, destination, 'place_id:...')
+    planner.run()
+    routes = planner.get(origin, destination, 'place_id:...')
+
+License: MIT
+"""
+
+import instrument
+import provider
+
+import asyncio
+import copy
+import time
+
+
+class RoutePlanner:
+    """route requests of a run, unique requests are sent at most 'concurrency' at once"""
+
+    def __init__(self, concurrency=16):
+        self.concurrency = concurrency
+        self.requests = []  # (origin, destination, waypoint) in order of add()
+        self.routes = {}    # (origin, destination, waypoint) -> routes of the provider
+
+    def add(self, origin, destination, waypoint=None):
+        self.requests.append((str(origin), str(destination), waypoint))
+
+    def run(self):
+        """request routes that are not requested yet"""
+
+        unique = list(dict.fromkeys(request for request in self.requests if request not in self.routes))
+        start_time = time.time()
+        if unique:
+            asyncio.run(fetch_all(unique, self.routes, self.concurrency))
+        instrument.count('route_requests', len(unique))
+        instrument.count('route_requests_reused', len(self.requests) - len(unique))
+        print("Routes of {} requests received in {:.2f} seconds, {} duplicated requests reused".format(
+            len(unique), time.time() - start_time, len(self.requests) - len(unique)))
+        self.requests = []
+
+    def get(self, origin, destination, waypoint=None):
+        """copy of the routes, so directions that share a request don't share route dicts"""
+
+        return copy.deepcopy(self.routes[(str(origin), str(destination), waypoint)])
+
+
+async def fetch_all(requests, routes, concurrency):
+    """request routes of (origin, destination, waypoint) requests, at most 'concurrency' requests at once"""
+
+    semaphore = asyncio.Semaphore(concurrency)
+    navigation = provider.get_provider()
+
+    async def fetch(request):
+        origin, destination, waypoint = request
+        async with semaphore:
+            try:
+                if waypoint is None:
+                    routes[request] = await asyncio.to_thread(navigation.directions, origin, destination)
+                else:
+                    routes[request] = await asyncio.to_thread(navigation.directions, origin, destination, waypoints=waypoint)
+            except Exception as err:
+                print("WARNING! Route from {} to {} via {} is not available: {!r}".format(origin, destination, waypoint, err))
+                routes[request] = []
+
+    await asyncio.gather(*(fetch(request) for request in requests))
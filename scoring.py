@@ -0,0 +1,112 @@
+"""Batch scoring of potential POI visits for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+All (direction, candidate POI) pairs are scored at once with grouped array operations,
+the result is the same as potential_visit_poi() computes direction by direction.
+
+License: MIT
+"""
+
+import numpy as np
+from scipy import special
+
+
+STD_LN = 0.41 # regarding the paper std_nostop is ln
+
+
+def get_zscore_probab(z):
+    """probability of the z-score interval by three sigma rule: m+s=68%, m+2s=95%, m+3s=99,7%"""
+
+    z = np.abs(z)
+    probab = np.full(z.shape, 0.0013)
+    probab[z <= 3] = 0.021
+    probab[z <= 2] = 0.136
+    probab[z <= 1] = 0.341
+
+    return probab
+
+
+def no_stop_probability(duration, tracking_interval, std_ln=STD_LN):
+    """no stop probability: survival function of lognormal distribution with median 'duration' at 'tracking_interval'
+    closed form 0.5*erfc((ln(tracking_interval) - ln(duration)) / (std_ln*sqrt(2))), works with scalars and arrays"""
+
+    with np.errstate(divide='ignore'):
+        z = (np.log(tracking_interval) - np.log(duration)) / (std_ln * np.sqrt(2))
+
+    return 0.5 * special.erfc(z)
+
+
+def get_min_duration(duration, std_ln=STD_LN):
+    """minimal time needed a vehicle to run a path of 'duration': mean-3*std of lognormal distribution, 
+    truncated to seconds, works with scalars and arrays"""
+
+    min_duration = np.exp(np.log(duration) - 3*std_ln)
+
+    return np.asarray(min_duration).astype(np.int64)
+
+
+def group_entropy(probab, group, n_groups):
+    """entropy (base 2) of probabilities of each group, probabilities are normalized in the group"""
+
+    sums = np.bincount(group, weights=probab, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = probab / sums[group]
+        terms = np.where(p > 0, -p * np.log2(p), 0.0)
+
+    return np.bincount(group, weights=terms, minlength=n_groups)
+
+
+def score_directions(group, time_spent_min, time_spent_max, rating_n, free_time, duration, tracking_interval,
+                     add_no_stop=False):
+    """score candidate POIs of all directions
+        group, time_spent_min, time_spent_max, rating_n: arrays with a value for each candidate,
+            group is the index of candidate's direction, times are in seconds
+        free_time, duration: arrays with a value for each direction in seconds
+        tracking_interval: seconds, the same for all directions or an array
+    return dict of arrays: 'mean', 'std', 'zscore', 'probab', 'rated' for each candidate,
+    'normal_prob' for each rated candidate, 'no_stop_prob', 'weighed_no_stop', 'direction_entropy' for each direction"""
+
+    group = np.asarray(group, dtype=np.int64)
+    rating_n = np.asarray(rating_n, dtype=np.float64)
+    free_time = np.asarray(free_time, dtype=np.float64) / 60
+    duration = np.asarray(duration, dtype=np.float64) / 60
+    n_groups = len(free_time)
+
+    minim = np.abs(np.asarray(time_spent_min, dtype=np.float64)) / 60 # we guess that Goolge min time spent equal to -2*sigma
+    maxim = np.abs(np.asarray(time_spent_max, dtype=np.float64)) / 60 # max time spent = 2*sigma
+    same = minim == maxim # in case if there is no time interval, artificially create it
+    minim = np.where(same, minim / 2, minim)
+    maxim = np.where(same, 3 * maxim / 2, maxim)
+    mean = (minim + maxim) / 2
+    std = (maxim - minim) / 4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (free_time[group] - mean) / std
+    probab = get_zscore_probab(z)
+
+    # rating addition: unweighted probabilities
+    rated = rating_n > 0
+    rated_group = group[rated]
+    weighted = probab[rated] * rating_n[rated]
+    sums = np.bincount(rated_group, weights=weighted, minlength=n_groups)
+
+    no_stop = no_stop_probability(duration, np.asarray(tracking_interval, dtype=np.float64) / 60)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if add_no_stop:
+            total = sums + no_stop
+            normal = weighted / total[rated_group]
+            weighed_no_stop = no_stop / total
+        else: # no_stop doesn't participate in propotion
+            normal = weighted / sums[rated_group] * (1 - no_stop[rated_group])
+            weighed_no_stop = no_stop
+
+    return {'mean': mean, 'std': std, 'zscore': z, 'probab': probab, 'rated': rated, 'weighted': weighted,
+            'normal_prob': normal, 'no_stop_prob': no_stop, 'weighed_no_stop': weighed_no_stop,
+            'direction_entropy': group_entropy(normal, rated_group, n_groups)}
+
+
+def split_by_group(values, group, n_groups):
+    """split values of sorted groups to list of arrays, one for each group"""
+
+    counts = np.bincount(group, minlength=n_groups)
+
+    return np.split(values, np.cumsum(counts)[:-1])
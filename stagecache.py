@@ -0,0 +1,209 @@
+"""Content-addressed cache of stage results for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+A stage result is saved under a hash of the stage name and version, its input and its parameters
+(and the navigation provider for stages that request it), so a stage that gets the same input again
+is loaded from disk instead of being recomputed. Input is pickled straight into the hash, arrays are
+hashed over their buffers, so hashing doesn't copy the input in memory.
+
+License: MIT
+"""
+
+import instrument
+import provider
+
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+
+
+class StageCache:
+    """pickled stage results in 'directory', least recently used results are removed
+    when the size of the directory exceeds 'max_bytes'"""
+
+    def __init__(self, directory='temp/cache', max_bytes=1024**3, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, stage, args=(), kwargs=None, salt=''):
+        """hash of the stage name, input and parameters
+            salt: version of the stage and other settings that change its result"""
+
+        digest = hashlib.sha256(stage.encode('utf-8'))
+        digest.update(b'\0' + salt.encode('utf-8'))
+        for arg in args:
+            update_digest(digest, arg)
+        for name in sorted(kwargs or {}):
+            digest.update(name.encode('utf-8'))
+            update_digest(digest, kwargs[name])
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.temp')
+
+    def get(self, key):
+        """return (True, result) if the result is cached, (False, None) otherwise"""
+
+        try:
+            with open(self.path(key), 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except Exception as err: # corrupt or incompatible entry is a miss
+            print("WARNING! Cached result {} is not readable and is removed: {!r}".format(key, err))
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            self.misses += 1
+            return False, None
+        try:
+            os.utime(self.path(key)) # mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+
+        return True, value
+
+    def put(self, key, value):
+        """save the result atomically and keep the cache in disk budget"""
+
+        write_atomic(value, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """remove least recently used results until the cache fits to max_bytes"""
+
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.temp') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError: # removed by another process
+                pass
+            total -= size
+
+    def clear(self):
+        """remove all cached results"""
+
+        if not os.path.exists(self.directory):
+            return
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.temp'):
+                    os.remove(entry.path)
+
+
+class HashWriter:
+    """file object that passes written bytes to the hash"""
+
+    def __init__(self, digest):
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return len(data)
+
+
+class HashPickler(pickle.Pickler):
+    """pickler of stage input into a hash: buffers of arrays are hashed in place (out-of-band),
+    objects that have get_cache_key() (e.g. poitable.POITable) are hashed by the key"""
+
+    def __init__(self, digest):
+        super().__init__(HashWriter(digest), protocol=5, buffer_callback=self.add_buffer)
+        self.digest = digest
+
+    def add_buffer(self, buffer):
+        self.digest.update(buffer.raw())
+
+    def reducer_override(self, value):
+        get_cache_key = getattr(value, 'get_cache_key', None)
+        if get_cache_key is None or isinstance(value, type):
+            return NotImplemented
+        return str, ('{}:{}'.format(type(value).__name__, get_cache_key()),)
+
+
+def update_digest(digest, value):
+    """add stage input to the hash, existing files are identified by path, size and modification time"""
+
+    if isinstance(value, str) and os.path.isfile(value):
+        stat = os.stat(value)
+        value = (value, stat.st_size, stat.st_mtime_ns)
+    HashPickler(digest).dump(value)
+
+
+def write_atomic(data, path):
+    """pickle data to a temporary file and move it to path, so readers never see a partial file"""
+
+    directory = os.path.dirname(path) or '.'
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, protocol=4)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+default_cache = StageCache()
+
+
+def configure(directory=None, max_bytes=None, enabled=None):
+    """change settings of the cache used by @cached stages"""
+
+    if directory is not None:
+        default_cache.directory = directory
+    if max_bytes is not None:
+        default_cache.max_bytes = max_bytes
+    if enabled is not None:
+        default_cache.enabled = enabled
+
+    return default_cache
+
+
+def cached(stage, version=1, uses_provider=False):
+    """return stage result from the cache if the stage was already run with the same input and parameters
+        version: increase it when the code of the stage changes its result
+        uses_provider: the stage requests the navigation provider, results are kept per provider (Provider.get_namespace())"""
+
+    def decorator(inner_func):
+        @functools.wraps(inner_func)
+        def wrapper_cache(*args, **kwargs):
+            if not default_cache.enabled:
+                return inner_func(*args, **kwargs)
+            salt = str(version)
+            if uses_provider:
+                salt += '\0' + provider.get_provider().get_namespace()
+            key = default_cache.key(stage, args, kwargs, salt)
+            hit, value = default_cache.get(key)
+            if hit:
+                instrument.count('stage_cache_hits')
+                print("Result of {!r} stage is loaded from cache".format(stage))
+                return value
+            instrument.count('stage_cache_misses')
+            value = inner_func(*args, **kwargs)
+            default_cache.put(key, value)
+            return value
+
+        return wrapper_cache
+
+    return decorator
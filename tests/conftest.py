@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import poiindex
+import provider
+import stagecache
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """run in an empty directory with the offline provider, without stage cache and with an empty POI index"""
+
+    monkeypatch.chdir(tmp_path)
+    previous = provider.get_provider()
+    provider.set_provider(provider.LocalProvider(), cache=False)
+    enabled = stagecache.default_cache.enabled
+    stagecache.configure(enabled=False)
+    monkeypatch.setattr(poiindex, 'default_index', poiindex.POIIndex())
+    yield tmp_path
+    stagecache.configure(enabled=enabled)
+    provider.set_provider(previous, cache=False)
@@ -0,0 +1,22 @@
+import benchmark
+
+
+def get_report(seconds):
+    return {'5x500': {'points': 2500, 'routes': 10,
+                      'stages': {name: {'seconds': value, 'points_per_second': 2500 / value, 'peak_bytes': 0, 'items': 0}
+                                 for name, value in seconds.items()}}}
+
+
+def test_slower_stage_is_a_regression():
+    baseline = get_report({'parse_trace': 1.0, 'segmentation': 2.0})
+    report = get_report({'parse_trace': 1.3, 'segmentation': 2.1})
+
+    assert benchmark.compare(report, baseline, tolerance=0.2) == [('5x500', 'parse_trace', 1.0, 1.3)]
+
+
+def test_stages_within_tolerance_or_without_baseline_pass():
+    baseline = get_report({'parse_trace': 1.0})
+    report = get_report({'parse_trace': 1.15, 'new_stage': 100.0})
+
+    assert benchmark.compare(report, baseline, tolerance=0.2) == []
+    assert benchmark.compare(get_report({'parse_trace': 0.5}), {}, tolerance=0.0) == []
@@ -0,0 +1,128 @@
+import numpy as np
+
+import benchmark
+import dsparse
+
+
+def get_old_windows(times, time_interval):
+    """paths of the old get_coor_between() time_gap loop as index lists, the last path included"""
+
+    paths = []
+    path = [0]
+    last_time = times[0]
+    time_gap = 1
+    for i, time in enumerate(times):
+        if time - last_time > time_interval*time_gap:
+            if time - last_time < time_interval*(time_gap+1):
+                if time_gap >= 61:
+                    time_gap = 1
+                    last_time = time
+                    paths.append(path)
+                    path = [i]
+                    continue
+                path.append(i)
+                time_gap += 1
+            elif time - last_time > time_interval*(time_gap+1):
+                time_gap = 1
+                last_time = time
+                paths.append(path)
+                path = [i]
+    paths.append(path)
+
+    return paths
+
+
+def get_old_busy_paths(data):
+    """paths of the old get_busy_directions() loop"""
+
+    paths = []
+    path = []
+    last_busy = '0'
+    for line in data:
+        if line['busy'] == '1':
+            last_busy = '1'
+            path.append(line)
+        elif last_busy == '1':
+            paths.append(path)
+            path = []
+            last_busy = '0'
+
+    return paths
+
+
+def get_old_runs(data):
+    """paths of the old get_all_directions() loop with split_by=0"""
+
+    paths = []
+    path = []
+    last_busy = '0'
+    for line in data:
+        if line['busy'] != last_busy:
+            paths.append(path)
+            path = []
+            last_busy = line['busy']
+        path.append(line)
+
+    return [path for path in paths if path] # the old loop added an empty path when the data starts busy
+
+
+def get_trace(busy):
+    n = len(busy)
+    return dsparse.Trace(37.7 + np.arange(n) / 1000, -122.4 - np.arange(n) / 1000, np.array(busy, dtype=bool),
+                         1211018404 + 60 * np.arange(n, dtype=np.int64), 'new_abc')
+
+
+def test_trips_equal_the_old_loops():
+    rng = np.random.default_rng(0)
+    for busy in ([], [1], [0, 1], [1, 1, 0], [0, 1, 0, 1, 1], [1, 0, 1, 0, 0, 1]) + tuple(
+            rng.integers(0, 2, rng.integers(2, 60)).tolist() for _ in range(50)):
+        trace = get_trace(busy)
+        rows = trace.rows()
+        for data in (trace, rows):
+            busy_paths = [path['path'] for path in dsparse.get_paths(data, dsparse.segment_trace(data, busy_only=True))]
+            assert busy_paths == get_old_busy_paths(rows)
+            paths = [path['path'] for path in dsparse.get_paths(data, dsparse.segment_trace(data))]
+            assert paths == get_old_runs(rows)
+
+
+def test_split_by_cuts_paths_without_gaps():
+    trace = get_trace([0, 1] * 25)
+    for split_by in (1, 3, 7, 50, 51):
+        ranges = dsparse.segment_trace(trace, split_by=split_by)
+        # paths of split_by points follow each other, the last incomplete path is not returned
+        assert ranges.tolist() == [[k * split_by, (k + 1) * split_by] for k in range(len(trace) // split_by)]
+
+
+def test_trace_rows_equal_sort_file_rows(workdir):
+    benchmark.generate_trace('new_abc.txt', points=500)
+    with open('new_abc.txt', 'a') as file_object: # points with the same time keep the order of the file
+        file_object.write('37.75000 -122.39000 1 1211030000\n37.75001 -122.39001 0 1211030000\n')
+
+    rows = dsparse.sort_file('new_abc.txt')
+    trace = dsparse.load_trace('new_abc.txt')
+
+    assert len(trace) == len(rows) == 502
+    assert [(row['busy'], row['time']) for row in trace] == [(row['busy'], row['time']) for row in rows]
+    # lat and lon are the shortest repr of the parsed float, trailing zeros of the file are not kept
+    assert [(float(row['lat']), float(row['lon'])) for row in trace] == [(float(row['lat']), float(row['lon'])) for row in rows]
+    assert [row.keys() for row in trace] == [row.keys() for row in rows]
+    assert trace[0]['filename'] == rows[0]['filename'] == 'new_abc'
+
+
+def test_time_windows_equal_the_old_loop():
+    rng = np.random.default_rng(0)
+    for time_interval in (30, 60, 90):
+        steps = rng.choice([0, 10, 30, 60, 61, 90, 120, 180, 400], size=3000) # multiples of the interval hit the boundaries
+        times = (1211018404 + np.cumsum(steps)).astype(np.int64)
+        got = [window.tolist() for window in dsparse.get_time_windows(times, time_interval)]
+        assert got == get_old_windows(times.tolist(), time_interval)
+
+
+def test_time_windows_boundaries_and_max_points():
+    # points at exactly 60 and 3*60 are skipped, the point after the empty window (120, 180) starts a new path
+    times = [0, 30, 60, 90, 180, 200, 270]
+    assert [window.tolist() for window in dsparse.get_time_windows(times, 60)] == get_old_windows(times, 60) == [[0, 3], [5, 6]]
+    times = np.arange(300) * 59 # a point in each window: the path is split after 61 points
+    windows = dsparse.get_time_windows(times, 60)
+    assert [len(window) for window in windows] == [61, 61, 61, 61, 47]
+    assert [window.tolist() for window in windows] == get_old_windows(times.tolist(), 60)
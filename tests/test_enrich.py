@@ -0,0 +1,49 @@
+import enrich
+
+
+class CountingBackend(enrich.FakeBackend):
+    def __init__(self):
+        super().__init__(latency=0)
+        self.place_ids = []
+
+    async def get(self, place_id):
+        self.place_ids.append(place_id)
+        return await super().get(place_id)
+
+
+def get_places(*place_ids):
+    return [{'place_id': place_id} for place_id in place_ids]
+
+
+def test_each_place_is_requested_once_per_run():
+    backend = CountingBackend()
+    with enrich.run_memo():
+        enrich.enrich_places(get_places('a', 'b', 'a'), backend)
+        places = enrich.enrich_places(get_places('b', 'c'), backend)
+
+    assert sorted(backend.place_ids) == ['a', 'b', 'c']
+    assert all('rating' in place for place in places)
+
+
+def test_memo_is_not_kept_after_the_run():
+    backend = CountingBackend()
+    with enrich.run_memo():
+        enrich.enrich_places(get_places('a'), backend)
+    enrich.enrich_places(get_places('a'), backend)
+    enrich.enrich_places(get_places('a'), backend)
+
+    assert backend.place_ids == ['a', 'a', 'a']
+
+
+def test_memo_is_bounded():
+    backend = CountingBackend()
+    memo = enrich.Memo(max_size=2)
+    places = enrich.enrich_places(get_places('a', 'b', 'c'), backend, memo=memo)
+
+    assert len(memo) == 2 and 'a' not in memo
+    assert all('time_spent' in place for place in places)
+
+
+def test_time_spent_is_converted_to_seconds():
+    assert enrich.get_fields({'time_spent': [10, 25]})['time_spent'] == [600, 1500]
+    assert enrich.get_fields({})['time_spent'] == -1
@@ -0,0 +1,30 @@
+import json
+
+import export
+
+
+def read_js(path):
+    name, value = path.read_text().split('=', 1)
+    return name[len('var '):], json.loads(value.rstrip(';\n'))
+
+
+def test_write_js_streams_rows(tmp_path):
+    rows = (['a"\\', 'b'] for _ in range(3))
+
+    count = export.write_js(rows, 'direct600', str(tmp_path), plain_name='direct_600')
+
+    assert count == 3
+    assert read_js(tmp_path / 'direct600.json') == ('direct600', [['a"\\', 'b']] * 3)
+    assert json.loads((tmp_path / 'direct_600.json').read_text()) == [['a"\\', 'b']] * 3
+    assert not list(tmp_path.glob('*.part'))
+
+
+def test_shards_of_each_cab(tmp_path):
+    groups = [('cab a', [([10, 20], ['r1']), ([30, 40], ['r2']), ([50, 60], ['r3'])]), ('cab-b', [(None, ['r4'])])]
+
+    index = export.write_shards(groups, 'direct600', str(tmp_path), chunk_size=2)
+
+    assert [(item['cab'], item['count'], item['time_range']) for item in index] == \
+        [('cab a', 2, [10, 40]), ('cab a', 1, [50, 60]), ('cab-b', 1, None)]
+    assert read_js(tmp_path / 'direct600' / index[0]['file']) == (index[0]['var'], [['r1'], ['r2']])
+    assert read_js(tmp_path / 'direct600' / 'direct600_index.json') == ('direct600_index', index)
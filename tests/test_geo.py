@@ -0,0 +1,87 @@
+import copy
+
+import numpy as np
+
+import geo
+import main
+
+
+ORIGIN = '37.7749,-122.4194'
+
+
+def get_kept(directions):
+    return [sorted(destination['place_id'] for destination in direction.get('all_destinations', []))
+            for direction in directions]
+
+
+def get_place(name, lat, lon, time_spent):
+    return {'place_id': 'local_{:.5f}_{:.5f}'.format(lat, lon), 'name': name, 'types': ['cafe'],
+            'time_spent': time_spent, 'rating_n': 10, 'populartimes': -1, 'geometry': {'location': {'lat': lat, 'lng': lon}}}
+
+
+def test_poi_inside_max_radius_is_pruned(workdir):
+    directions = main.decode_polylines(main.in_time_directions(main.get_directions(ORIGIN, '37.7749,-122.4080'), 600))
+    time_spent = directions[0]['overview_free_time'] - 5 # 5 seconds are left to drive: ~1.9 km at geo.MAX_SPEED
+    near = get_place('near', 37.7758, -122.4137, [time_spent, time_spent + 60])
+    far = get_place('far', 37.7830, -122.4137, [time_spent, time_spent + 60])
+    assert geo.haversine(37.7749, -122.4137, 37.7830, -122.4137) < 1000 # within max_radius of the route
+    directions[0]['polyline_coor_POI'] = [[(37.7749, -122.4137), [near, far]]]
+    events = dict(main.instrument.recorder.events)
+
+    directions = main.get_waypoints_for_poi(directions)
+
+    assert [waypoint[0] for waypoint in directions[0]['dest_wayp_list'][2]] == ['place_id:' + near['place_id']]
+    assert main.instrument.recorder.events['ellipse_pruned'] - events.get('ellipse_pruned', 0) == 1
+    assert main.instrument.recorder.events['ellipse_candidates'] - events.get('ellipse_candidates', 0) == 2
+
+
+def test_ellipse_prunes_pois_outside_the_bound(workdir):
+    directions = main.get_directions(ORIGIN, '37.7849,-122.4094') + main.get_directions(ORIGIN, '37.7549,-122.4294')
+    directions = main.decode_polylines(main.in_time_directions(directions, 900))
+    directions = main.get_near_poi_polylines(directions, 1000, place_type=['cafe', 'store'])
+    max_speed = 6.0
+
+    unpruned = main.get_waypoints_for_poi(copy.deepcopy(directions), max_speed=None)
+    got = main.get_waypoints_for_poi(copy.deepcopy(directions), max_speed=max_speed)
+
+    expected = []
+    for direction in unpruned:
+        origin = geo.parse_location(direction['legs'][0]['start_location'])
+        destination = geo.parse_location(direction['legs'][-1]['end_location'])
+        locations = {'place_id:' + place['place_id']: (place['geometry']['location']['lat'], place['geometry']['location']['lng'])
+                     for _point, places in direction['polyline_coor_POI'] for place in places}
+        expected.append(sorted(route['place_id'] for route in direction.get('all_destinations', [])
+                               if geo.detour_length(origin, destination, [locations[route['place_id']]])[0] <=
+                               max_speed * (direction['min_duration'] + direction['overview_free_time'] - route['time_spent'][0])))
+    assert get_kept(got) == expected
+    assert sum(map(len, expected)) < sum(map(len, get_kept(unpruned)))
+    assert any(expected)
+
+
+def test_sweep_applies_the_ellipse_for_each_interval(workdir):
+    directions = main.get_directions(ORIGIN, '37.7849,-122.4094') + main.get_directions(ORIGIN, '37.7549,-122.4294')
+    intervals = [600, 900, 1200]
+    max_speed = 6.0 # the ellipse of each interval prunes POIs the longest one keeps
+    table = main.sweep_tracking_intervals(copy.deepcopy(directions), intervals, place_type=['cafe', 'store'],
+                                          max_speed=max_speed)
+
+    for interval in intervals:
+        expected = main.decode_polylines(main.in_time_directions(copy.deepcopy(directions), interval))
+        expected = main.get_near_poi_polylines(expected, 1000, place_type=['cafe', 'store'])
+        expected = main.potential_visit_poi(main.get_waypoints_for_poi(expected, max_speed=max_speed), interval)
+        rows = table[interval]
+        assert [row['candidates'] for row in rows] == [len(direction.get('all_destinations', [])) for direction in expected]
+        assert np.allclose([row['direction_entropy'] for row in rows], [direction['direction_entropy'] for direction in expected])
+    assert len({sum(row['candidates'] for row in table[interval]) for interval in intervals}) > 1
+
+
+def test_sample_route_interpolates_long_segments():
+    coordinates = [(37.70, -122.40), (37.75, -122.40)] # one segment of ~5.6 km
+    length = geo.haversine(37.70, -122.40, 37.75, -122.40)
+    points = geo.sample_route(coordinates, 1000)
+
+    assert len(points) == int(length // 1000) + 2
+    assert points[0].tolist() == [37.70, -122.40] and points[-1].tolist() == [37.75, -122.40]
+    steps = geo.haversine(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+    assert np.allclose(steps[:-1], 1000, atol=0.2) and steps[-1] <= 1000
+    assert (points[:, 1] == -122.40).all()
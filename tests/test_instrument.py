@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import instrument
+import provider
+
+
+def test_stage_records_calls_items_and_self_time():
+    @instrument.stage('inner')
+    def inner():
+        return [1, 2, 3]
+
+    @instrument.stage('outer')
+    def outer():
+        return inner() + inner()
+
+    with instrument.recording() as recorder:
+        outer()
+    stages = recorder.summary()['stages']
+
+    assert stages['inner']['calls'] == 2 and stages['inner']['items'] == 6
+    assert stages['outer']['self_seconds'] <= stages['outer']['total_seconds']
+
+
+def test_nested_profiled_stages():
+    @instrument.stage('profiled_inner')
+    def inner():
+        return sum(range(1000))
+
+    @instrument.stage('profiled_outer')
+    def outer():
+        return inner() + inner()
+
+    with instrument.recording() as recorder:
+        instrument.profile_stage('profiled_inner')
+        instrument.profile_stage('profiled_outer')
+        assert outer() == 2 * sum(range(1000))
+        assert inner() == sum(range(1000))
+
+    assert set(recorder.profiles) == {'profiled_outer', 'profiled_inner'}
+
+
+def test_events_of_threads_are_counted_in_their_stage():
+    async def fetch_all():
+        await asyncio.gather(*(asyncio.to_thread(instrument.count, 'thread_event') for _ in range(4)))
+
+    @instrument.stage('threaded')
+    def threaded():
+        asyncio.run(fetch_all())
+
+    with instrument.recording() as recorder:
+        threaded()
+
+    assert recorder.summary()['stages']['threaded']['events'] == {'thread_event': 4}
+
+
+def test_provider_calls_are_counted_without_cache():
+    previous = provider.get_provider()
+    try:
+        with instrument.recording() as recorder:
+            provider.set_provider(provider.LocalProvider(), cache=False)
+            provider.get_provider().directions('37.77,-122.42', '37.79,-122.40')
+            stats = provider.get_stats()
+    finally:
+        provider.set_provider(previous, cache=False)
+
+    assert recorder.events['provider_calls'] == 1
+    assert stats['requests'] == 1
+
+
+def test_prometheus_export():
+    with instrument.recording() as recorder:
+        instrument.count('some_event', 3)
+        text = instrument.to_prometheus(recorder.summary())
+
+    assert 'some_event' in text and '3' in text
+
+
+def test_concurrent_nested_stages_are_counted_once_in_self_time():
+    @instrument.stage('concurrent_child')
+    def child():
+        time.sleep(0.05)
+
+    async def run_children():
+        await asyncio.gather(*(asyncio.to_thread(child) for _ in range(4)))
+
+    @instrument.stage('concurrent_parent')
+    def parent():
+        asyncio.run(run_children())
+
+    with instrument.recording() as recorder:
+        parent()
+    stages = recorder.summary()['stages']
+
+    assert stages['concurrent_child']['total_seconds'] > stages['concurrent_parent']['total_seconds']
+    assert 0.0 <= stages['concurrent_parent']['self_seconds'] < 0.5 * stages['concurrent_parent']['total_seconds']
+
+
+def test_prometheus_run_and_stage_events_are_separate_metrics():
+    @instrument.stage('counting')
+    def counting():
+        instrument.count('some_event', 2)
+
+    with instrument.recording() as recorder:
+        counting()
+        text = instrument.to_prometheus(recorder.summary())
+
+    assert 'csprivacy_events_total{event="some_event"} 2' in text.splitlines()
+    assert 'csprivacy_stage_events_total{stage="counting",event="some_event"} 2' in text.splitlines()
+    assert not [line for line in text.splitlines() if line.startswith('csprivacy_events_total{stage=')]
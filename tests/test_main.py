@@ -0,0 +1,56 @@
+import json
+import os
+
+import benchmark
+import main
+
+
+def test_dsparse_run_offline_in_parallel(workdir):
+    benchmark.generate_dataset('data/cabspottingdata', cabs=2, points=400)
+    with open('data/cabspottingdata/new_bad.txt', 'w') as bad_file:
+        bad_file.write('garbage line\n')
+
+    directions = main.dsparse_run(1800, workers=2)
+
+    assert len(directions) > 0
+    assert (workdir / 'output' / 'direct1800.json').exists()
+    assert main.instrument.recorder.events.get('failed_files', 0) >= 1
+
+
+def test_incremental_run_processes_only_new_files(workdir):
+    files = benchmark.generate_dataset('data/cabspottingdata', cabs=2, points=400)
+    first = main.dsparse_run(1800, incremental=True)
+    part = main.get_part_path(files[0], 1800)
+    mtime = os.stat(part).st_mtime_ns
+
+    benchmark.generate_trace('data/cabspottingdata/new_cab0002.txt', points=400, seed=5)
+    second = main.dsparse_run(1800, incremental=True)
+
+    assert os.stat(part).st_mtime_ns == mtime
+    assert len(second) > len(first) and second[:len(first)] == first
+    assert main.manifest.Manifest().get_pending(files, 'direct_1800') == []
+
+
+def test_shards_have_time_ranges(workdir):
+    benchmark.generate_dataset('data/cabspottingdata', cabs=2, points=400)
+
+    rows = main.dsparse_run(1800, shards=3)
+
+    text = (workdir / 'output' / 'direct1800' / 'direct1800_index.json').read_text()
+    index = json.loads(text.split('=', 1)[1].rstrip(';\n'))
+    assert sum(item['count'] for item in index) == len(rows) > 0
+    assert all(item['time_range'][0] <= item['time_range'][1] for item in index)
+
+
+def test_incremental_run_with_store_parses_only_new_files(workdir, monkeypatch):
+    benchmark.generate_dataset('data/cabspottingdata', cabs=2, points=400)
+    first = main.dsparse_run(1800, store='temp/traces', incremental=True)
+    parsed = []
+    parse_trace = main.dsparse.parse_trace
+    monkeypatch.setattr(main.dsparse, 'parse_trace', lambda filename: parsed.append(filename) or parse_trace(filename))
+
+    benchmark.generate_trace('data/cabspottingdata/new_cab0002.txt', points=400, seed=5)
+    second = main.dsparse_run(1800, store='temp/traces', incremental=True)
+
+    assert parsed == ['data/cabspottingdata/new_cab0002.txt']
+    assert len(second) > len(first) and second[:len(first)] == first
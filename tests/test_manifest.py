@@ -0,0 +1,43 @@
+import os
+
+import manifest
+
+
+def test_new_changed_and_touched_files(tmp_path):
+    path = tmp_path / 'new_a.txt'
+    path.write_text('1\n')
+    files_manifest = manifest.Manifest(str(tmp_path / 'manifest.json'))
+    assert files_manifest.get_pending([str(path)], 'stage') == [str(path)]
+    files_manifest.mark(str(path), 'stage')
+    files_manifest.save()
+
+    files_manifest = manifest.Manifest(str(tmp_path / 'manifest.json'))
+    assert files_manifest.get_pending([str(path)], 'stage') == []
+    os.utime(path, ns=(1, 1)) # touched, the same content
+    assert files_manifest.get_pending([str(path)], 'stage') == []
+    assert files_manifest.get_pending([str(path)], 'other_stage') == [str(path)]
+    path.write_text('2\n')
+    assert files_manifest.get_pending([str(path)], 'stage') == [str(path)]
+
+
+def test_file_that_grows_during_the_run_stays_pending(tmp_path):
+    path = tmp_path / 'new_a.txt'
+    path.write_text('1\n')
+    files_manifest = manifest.Manifest(str(tmp_path / 'manifest.json'))
+    assert files_manifest.get_pending([str(path)], 'stage') == [str(path)]
+
+    with open(path, 'a') as trace_file: # rows are appended while the stage runs
+        trace_file.write('2\n')
+    files_manifest.mark(str(path), 'stage')
+
+    assert files_manifest.get_pending([str(path)], 'stage') == [str(path)]
+
+
+def test_missing_files_are_forgotten(tmp_path):
+    path = tmp_path / 'new_a.txt'
+    path.write_text('1\n')
+    files_manifest = manifest.Manifest(str(tmp_path / 'manifest.json'))
+    files_manifest.mark(str(path), 'stage')
+
+    assert files_manifest.remove_missing([]) == [str(path)]
+    assert files_manifest.files == {}
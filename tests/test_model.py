@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+
+import main
+import model
+import poitable
+
+
+def get_polyline_poi(n, types, seed=0):
+    rng = random.Random(seed)
+    places = [{'place_id': 'p{}'.format(i), 'name': 'n{}'.format(i), 'types': rng.sample(types, 2),
+               'time_spent': [60, 120] if i % 3 else -1, 'rating_n': i, 'populartimes': -1,
+               'geometry': {'location': {'lat': 37.0 + i / 1000, 'lng': -122.0}}} for i in range(n)]
+    return [[(37.0, -122.0), places[i:i + 10]] for i in range(0, n, 10)]
+
+
+def test_direction_dict_round_trip():
+    rows = [{'lat': '37.75', 'lon': '-122.39', 'busy': '0', 'time': '1211018404', 'filename': 'new_abc.txt'},
+            {'lat': '37.7512', 'lon': '-122.3901', 'busy': '1', 'time': '1211018465'}]
+    direction = {'path': rows, 'original_polyline': {'points': 'abc'}, 'overview_polyline': {'points': 'def'}}
+
+    got = model.Direction.from_dict(direction)
+
+    assert got.to_dict() == direction
+    assert (got.origin(), got.destination()) == ('37.75,-122.39', '37.7512,-122.3901')
+    assert model.Direction.from_dict({'path': rows}).to_dict() == {'path': rows}
+
+
+def test_type_index_masks_wider_than_a_word():
+    names = ['type{}'.format(i) for i in range(100)]
+    index = model.TypeIndex(names)
+    bits = index.get_bits([names[:2], names[63:66], names[99:], []])
+    assert bits.shape == (4, 2)
+    assert index.get_bits([names[63:66]]).tolist() == bits[1:2].tolist()
+    masks = [(bits & index.get_filter(poi_type, 2)).any(axis=1).tolist()
+             for poi_type in (['type1'], ['type64'], ['type99', 'type0'], ['unknown'])]
+    assert masks == [[True, False, False, False], [False, True, False, False],
+                     [True, False, True, False], [False, False, False, False]]
+
+
+def test_has_type_equals_get_poi_by_type():
+    types = ['type{}'.format(i) for i in range(70)]
+    polyline_poi = get_polyline_poi(300, types)
+    candidates = model.Candidates.from_polyline_poi(polyline_poi)
+    places = [place for _point, point_places in polyline_poi for place in point_places]
+    assert candidates.type_index is model.default_types
+    for poi_type in ([], ['type3'], ['type69', 'type1'], ['missing'], ['type5']):
+        expected = [bool(main.get_poi_by_type(place['types'], poi_type)) for place in places]
+        assert candidates.has_type(poi_type).tolist() == expected
+
+
+def test_from_table_equals_from_polyline_poi():
+    polyline_poi = get_polyline_poi(50, ['cafe', 'store', 'bar', 'bank'], seed=1)
+    places = [place for _point, point_places in polyline_poi for place in point_places]
+    table = poitable.POITable.create(places)
+    try:
+        expected = model.Candidates.from_polyline_poi(polyline_poi)
+        got = model.Candidates.from_table(table, [[point, [place['place_id'] for place in point_places]]
+                                                  for point, point_places in polyline_poi])
+        mask = np.ones(len(expected), dtype=bool)
+        assert got.to_waypoints(mask) == expected.to_waypoints(mask)
+        assert got.point.tolist() == expected.point.tolist()
+        assert np.array_equal(got.location, expected.location)
+        for poi_type in (['cafe'], ['bar', 'bank'], ['missing']):
+            assert got.has_type(poi_type).tolist() == expected.has_type(poi_type).tolist()
+    finally:
+        table.close()
+        table.unlink()
@@ -0,0 +1,34 @@
+import pytest
+
+import benchmark
+import enrich
+import pipeline
+import poiindex
+
+
+def test_run_streams_files_to_entropy(workdir):
+    files = benchmark.generate_dataset('data/cabspottingdata', cabs=2, points=300)
+
+    count = pipeline.run(files, 1800, summary='summary')
+
+    assert count > 0
+    assert (workdir / 'output' / 'summary.csv').read_text().count('\n') == count + 1
+    assert not (workdir / 'temp').exists() # nothing is persisted without checkpoints
+    assert enrich.default_memo is None and not poiindex.default_index.places
+
+
+def test_summary_is_saved_when_the_stream_fails(workdir, monkeypatch):
+    files = benchmark.generate_dataset('data/cabspottingdata', cabs=2, points=300)
+    stream_entropy = pipeline.stream_entropy
+
+    def failing(*args, **kwargs):
+        for routes in stream_entropy(*args, **kwargs):
+            yield routes
+            raise RuntimeError('stream failed')
+
+    monkeypatch.setattr(pipeline, 'stream_entropy', failing)
+    with pytest.raises(RuntimeError):
+        pipeline.run(files, 1800, summary='summary')
+
+    assert (workdir / 'output' / 'summary.csv').read_text().count('\n') > 1
+    assert (workdir / 'output' / 'summary.npz').exists()
@@ -0,0 +1,71 @@
+import poiindex
+import provider
+
+
+def test_covered_query_equals_provider_response():
+    local = provider.LocalProvider()
+    index = poiindex.POIIndex()
+    index.get_near_poi('37.7749,-122.4194', 600, None, local.near_places)
+
+    result = index.get_near_poi('37.7752,-122.4190', 300, None, local.near_places)
+
+    assert index.hits == 1
+    expected = local.near_places('37.7752,-122.4190', 300)['results']
+    assert sorted(place['place_id'] for place in result['results']) == sorted(place['place_id'] for place in expected)
+
+
+def test_truncated_response_does_not_cover_cells():
+    calls = []
+
+    def fetch(location, radius, place_type):
+        calls.append(location)
+        return {'results': [{'place_id': 'p{}'.format(len(calls)), 'types': [],
+                             'geometry': {'location': {'lat': 37.7749, 'lng': -122.4194}}}],
+                'next_page_token': 'more', 'status': 'OK'}
+
+    index = poiindex.POIIndex()
+    index.get_near_poi('37.7749,-122.4194', 500, None, fetch)
+    index.get_near_poi('37.7749,-122.4194', 200, None, fetch)
+
+    assert len(calls) == 2
+
+
+def test_result_cap_is_treated_as_truncated():
+    index = poiindex.POIIndex(max_results=2)
+
+    assert not index.is_complete({'results': [{}, {}], 'status': 'OK'})
+    assert index.is_complete({'results': [{}], 'status': 'OK'})
+    assert not index.is_complete({'results': [], 'status': 'OVER_QUERY_LIMIT'})
+
+
+def test_places_without_location_are_returned_on_hits():
+    def fetch(location, radius, place_type):
+        return {'results': [{'place_id': 'no_location', 'types': ['cafe']}], 'status': 'OK'}
+
+    index = poiindex.POIIndex()
+    index.get_near_poi('37.7749,-122.4194', 500, None, fetch)
+    result = index.get_near_poi('37.7749,-122.4194', 200, 'cafe', fetch)
+
+    assert index.hits == 1
+    assert [place['place_id'] for place in result['results']] == ['no_location']
+
+
+def test_index_is_bounded():
+    local = provider.LocalProvider()
+    index = poiindex.POIIndex(max_places=30)
+    for i in range(5):
+        index.get_near_poi('37.77,{}'.format(-122.42 + i * 0.02), 500, None, local.near_places)
+
+    assert 0 < len(index.places) <= 30
+    assert index.queries == 5
+
+
+def test_run_index_is_dropped_after_the_run():
+    local = provider.LocalProvider()
+    default_index = poiindex.default_index
+    with poiindex.run_index() as index:
+        assert poiindex.default_index is index
+        index.get_near_poi('37.7749,-122.4194', 300, None, local.near_places)
+
+    assert poiindex.default_index is default_index
+    assert index.places and not default_index.places
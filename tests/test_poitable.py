@@ -0,0 +1,77 @@
+import copy
+import pickle
+
+import main
+import poitable
+import stagecache
+
+
+def get_cab_directions(destinations):
+    cab_directions = []
+    for destination in destinations:
+        directions = main.get_directions('37.7749,-122.4194', destination) + main.get_directions('37.7649,-122.4294', destination)
+        directions = main.decode_polylines(main.in_time_directions(directions, 1800))
+        cab_directions.append(main.get_near_poi_polylines(directions, 500, place_type=['cafe', 'store']))
+    return cab_directions
+
+
+def get_places(cab_directions):
+    return [place for directions in cab_directions for direction in directions
+            for _point, places in direction['polyline_coor_POI'] for place in places]
+
+
+def test_places_round_trip(workdir):
+    places = get_places(get_cab_directions(['37.7849,-122.4094']))
+    table = poitable.POITable.create(places)
+    try:
+        for place in places:
+            row = table.find([place['place_id']])[0]
+            assert table.get_place(row) == {key: place[key] for key in table.get_place(row)}
+        assert table.find(['missing']).tolist() == [-1]
+        copied = pickle.loads(pickle.dumps(table))
+        assert copied.get_place(0) == table.get_place(0)
+        copied.close()
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_cache_key_is_the_content(workdir):
+    places = get_places(get_cab_directions(['37.7849,-122.4094']))
+    first, second = poitable.POITable.create(places), poitable.POITable.create([place for place in places if place['place_id'] != places[0]['place_id']])
+    third = poitable.POITable.create(places)
+    try:
+        key = stagecache.default_cache.key('stage', (first,))
+        assert key == stagecache.default_cache.key('stage', (third,))
+        assert key != stagecache.default_cache.key('stage', (second,))
+    finally:
+        for table in (first, second, third):
+            table.close()
+            table.unlink()
+
+
+def test_score_cabs_equals_sequential_scoring(workdir):
+    cab_directions = get_cab_directions(['37.7849,-122.4094', '37.7949,-122.4194', '37.7549,-122.4094'])
+    expected = [main.potential_visit_poi(main.get_waypoints_for_poi(copy.deepcopy(directions)), 1800)
+                for directions in cab_directions]
+
+    sequential = main.score_cabs(copy.deepcopy(cab_directions), 1800, workers=1)
+    parallel = main.score_cabs(copy.deepcopy(cab_directions), 1800, workers=2)
+
+    assert sequential == expected
+    assert parallel == expected
+    assert any(direction.get('all_destinations') for directions in expected for direction in directions)
+
+
+def test_worker_closes_the_unpickled_table(workdir):
+    directions = get_cab_directions(['37.7849,-122.4094'])[0]
+    table = poitable.POITable.create(get_places([directions]))
+    try:
+        copied = pickle.loads(pickle.dumps(table))
+        main.score_cab_worker(poitable.strip_places(directions), 1800, copied)
+        main.score_cab_worker(poitable.strip_places(directions), 1800, table)
+        assert copied.columns == {} and copied.memory.buf is None
+        assert len(table) == len(table.columns['place_id']) # the creator keeps its table open
+    finally:
+        table.close()
+        table.unlink()
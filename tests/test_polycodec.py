@@ -0,0 +1,31 @@
+import numpy as np
+import polyline
+import pytest
+
+import polycodec
+
+
+@pytest.fixture
+def paths():
+    rng = np.random.default_rng(0)
+    paths = [np.cumsum(rng.normal(0, 0.01, (n, 2)), axis=0) + (37.77, -122.42) for n in (1, 2, 17, 300)]
+    paths.append(np.array([[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]))
+    paths.append(np.array([[-89.99999, 179.99999], [89.99999, -179.99999]]))
+    return paths
+
+
+def test_encode_is_identical_to_polyline_library(paths):
+    assert polycodec.encode_many(paths) == [polyline.encode([tuple(point) for point in path], 5) for path in paths]
+
+
+def test_decode_is_identical_to_polyline_library(paths):
+    expressions = [polyline.encode([tuple(point) for point in path], 5) for path in paths]
+
+    for decoded, expression in zip(polycodec.decode_many(expressions), expressions):
+        assert decoded.tolist() == [list(point) for point in polyline.decode(expression, 5)]
+
+
+def test_empty_input():
+    assert polycodec.decode_many([]) == []
+    assert polycodec.encode_many([]) == []
+    assert [path.shape for path in polycodec.decode_many(['', '_p~iF~ps|U'])] == [(0, 2), (1, 2)]
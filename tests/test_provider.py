@@ -0,0 +1,57 @@
+import provider
+
+
+def test_local_provider_is_deterministic():
+    local = provider.LocalProvider()
+
+    assert local.directions('37.77,-122.42', '37.79,-122.40') == local.directions('37.77,-122.42', '37.79,-122.40')
+    assert local.near_places('37.77,-122.42', 300) == local.near_places('37.77,-122.42', 300)
+
+
+def test_cached_provider_reuses_responses(tmp_path):
+    cache = provider.ResponseCache(str(tmp_path / 'cache.sqlite'))
+    cached = provider.CachedProvider(provider.LocalProvider(), cache)
+
+    first = cached.directions('37.77,-122.42', '37.79,-122.40')
+    second = cached.directions(' 37.7700000001,-122.42 ', '37.79,-122.40')
+
+    assert first == second
+    assert cached.stats['hits'] == 1 and cached.stats['misses'] == 1
+
+
+def test_cache_is_kept_per_provider_parameters(tmp_path):
+    cache = provider.ResponseCache(str(tmp_path / 'cache.sqlite'))
+    slow = provider.CachedProvider(provider.LocalProvider(speed=5.0), cache)
+    fast = provider.CachedProvider(provider.LocalProvider(speed=20.0), cache)
+
+    slow_route = slow.directions('37.77,-122.42', '37.79,-122.40')
+    fast_route = fast.directions('37.77,-122.42', '37.79,-122.40')
+
+    assert fast.stats['misses'] == 1
+    assert fast_route[0]['legs'][0]['duration']['value'] < slow_route[0]['legs'][0]['duration']['value']
+
+
+def test_cache_size_is_kept_by_triggers_and_evicts_least_recently_used(tmp_path):
+    cache = provider.ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=None, max_bytes=1000)
+    connection = cache.connect()
+
+    for i in range(10):
+        cache.put('key{}'.format(i), 'x' * 100, 0.0)
+        assert cache.get('key0')[0] # key0 is used recently, it is kept
+    cache.put('key9', 'y' * 50, 0.0)
+    total = connection.execute('SELECT SUM(size) FROM responses').fetchone()[0]
+
+    assert cache.get_size() == total <= 1000
+    assert cache.get('key0')[0] and not cache.get('key1')[0]
+    plan = connection.execute('EXPLAIN QUERY PLAN SELECT key, size FROM responses ORDER BY accessed LIMIT 256').fetchall()
+    assert 'responses_accessed' in str(plan)
+
+
+def test_cache_size_of_an_existing_table_is_counted(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = provider.ResponseCache(path)
+    cache.put('key', [1, 2, 3], 0.0)
+    cache.connect().execute('DROP TABLE meta')
+    cache.connection.commit()
+
+    assert provider.ResponseCache(path).get_size() == len('[1, 2, 3]')
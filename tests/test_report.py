@@ -0,0 +1,40 @@
+import csv
+
+import numpy as np
+
+import main
+import report
+
+
+def get_scored_directions():
+    directions = main.get_directions('37.7749,-122.4194', '37.7849,-122.4094')
+    directions = main.decode_polylines(main.in_time_directions(directions, 900))
+    directions = main.get_near_poi_polylines(directions, 1000, place_type=['cafe', 'store'])
+    return main.potential_visit_poi(main.get_waypoints_for_poi(directions), 900)
+
+
+def test_report_has_a_section_for_each_direction(workdir):
+    directions = get_scored_directions()
+    path = report.write_report(directions, filename='route')
+
+    assert any('all_destinations' in direction for direction in directions)
+    text = (workdir / 'output' / 'route.txt').read_text(encoding='utf-8')
+    assert path.endswith('route.txt')
+    assert text.startswith("Route has {} directions".format(len(directions)))
+    assert text.count("Amount of potential POIs") == sum('all_destinations' in direction for direction in directions)
+
+
+def test_summary_csv_and_npz_have_the_same_rows(workdir):
+    directions = get_scored_directions()
+    with report.Summary('summary') as summary:
+        summary.add(directions, cab='new_abc')
+        summary.add_rows([{'tracking_interval': 600, 'direction': 0, 'candidates': 3}], cab='new_xyz')
+
+    with open(workdir / 'output' / 'summary.csv', newline='', encoding='utf-8') as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    columns = np.load(workdir / 'output' / 'summary.npz')
+    assert len(rows) == len(directions) + 1
+    assert [row['cab'] for row in rows] == columns['cab'].tolist() == ['new_abc'] * len(directions) + ['new_xyz']
+    assert [int(row['candidates']) for row in rows] == columns['candidates'].tolist()
+    assert np.allclose([float(row['direction_entropy']) for row in rows], columns['direction_entropy'])
+    assert rows[0]['tracking_interval'] == '900' and rows[-1]['tracking_interval'] == '600'
@@ -0,0 +1,31 @@
+import provider
+import routing
+
+
+def test_unique_requests_are_sent_once(workdir):
+    planner = routing.RoutePlanner(concurrency=4)
+    for origin in ('37.77,-122.42', '37.78,-122.42'):
+        for waypoint in ('place_id:local_37.77500_-122.41000', 'place_id:local_37.78500_-122.41000'):
+            planner.add(origin, '37.79,-122.40', waypoint)
+            planner.add(origin, '37.79,-122.40', waypoint)
+    planner.run()
+
+    assert provider.get_provider().stats['requests'] == 4
+    first = planner.get('37.77,-122.42', '37.79,-122.40', 'place_id:local_37.77500_-122.41000')
+    first[0]['name'] = 'changed'
+    second = planner.get('37.77,-122.42', '37.79,-122.40', 'place_id:local_37.77500_-122.41000')
+    assert 'name' not in second[0]
+    assert second == provider.LocalProvider().directions('37.77,-122.42', '37.79,-122.40',
+                                                         waypoints='place_id:local_37.77500_-122.41000')
+
+
+def test_failed_request_has_no_routes(workdir, monkeypatch):
+    def directions(origin, destination, waypoints=None):
+        raise RuntimeError('not available')
+
+    monkeypatch.setattr(provider.get_provider(), 'directions', directions)
+    planner = routing.RoutePlanner()
+    planner.add('37.77,-122.42', '37.79,-122.40', 'place_id:local_37.77500_-122.41000')
+    planner.run()
+
+    assert planner.get('37.77,-122.42', '37.79,-122.40', 'place_id:local_37.77500_-122.41000') == []
@@ -0,0 +1,94 @@
+import copy
+
+import numpy as np
+from scipy import stats
+
+import main
+import scoring
+
+
+def test_no_stop_probability_equals_lognormal_survival():
+    rng = np.random.default_rng(0)
+    duration = rng.uniform(1, 120, 10000)
+    tracking_interval = rng.uniform(1, 120, 10000)
+    expected = stats.lognorm.sf(tracking_interval, s=scoring.STD_LN, scale=duration)
+
+    assert np.allclose(scoring.no_stop_probability(duration, tracking_interval), expected, rtol=1e-12, atol=0)
+    assert np.isclose(scoring.no_stop_probability(30.0, 20.0), stats.lognorm(s=scoring.STD_LN, scale=30.0).sf(20.0))
+
+
+def test_min_duration_is_truncated_lower_three_sigma():
+    duration = np.array([1, 60, 617, 3600, 86400])
+    expected = [int(np.exp(np.log(value) - 3 * scoring.STD_LN)) for value in duration.tolist()]
+
+    assert scoring.get_min_duration(duration).tolist() == expected
+    assert int(scoring.get_min_duration(617)) == expected[2]
+
+
+def get_old_scores(directions, tracking_interval, add_no_stop):
+    """probabilities and entropy of each direction by the old per-direction loop of main.potential_visit_poi()"""
+
+    tracking_interval = tracking_interval/60
+    for direction in directions:
+        all_probab = []
+        duration = direction['duration']/60
+        nostop_probab = stats.lognorm(scale=duration, s=0.41).sf(tracking_interval)
+        if 'all_destinations' not in direction:
+            n_prob = []
+            all_probab.append(nostop_probab)
+        else:
+            direction['all_destinations'] = main.in_time_directions(direction['all_destinations'], tracking_interval*60)
+            for destination in direction['all_destinations']:
+                minim = abs(destination['time_spent'][0]/60)
+                maxim = abs(destination['time_spent'][1]/60)
+                if minim == maxim:
+                    minim = minim/2
+                    maxim = 3*maxim/2
+                mean = np.mean([minim, maxim])
+                std = (maxim-minim)/4
+                z = (direction['overview_free_time']/60-mean)/std
+                if -1<=z<=1:
+                    probab = 0.341
+                elif -2<=z<-1 or 2>=z>1:
+                    probab = 0.136
+                elif -3<=z<-2 or 3>=z>2:
+                    probab = 0.021
+                else:
+                    probab = 0.0013
+                destination['dist_data'] = {'mean': mean, 'std': std, 'zscore': z, 'probab': probab}
+                if destination['rating_n'] > 0:
+                    all_probab.append(probab * destination['rating_n'])
+            if add_no_stop:
+                all_probab.append(nostop_probab)
+                n_prob = [prob/sum(all_probab) for prob in all_probab[:-1]]
+            else:
+                n_prob = [prob/sum(all_probab) * (1-nostop_probab) for prob in all_probab]
+        direction.update({'probabilities': all_probab, 'normal_prob': n_prob, 'direction_entropy': stats.entropy(n_prob, base=2),
+                          'no_stop_prob': nostop_probab})
+
+    return directions
+
+
+def test_potential_visit_poi_equals_the_old_loop(workdir):
+    directions = main.get_directions('37.7749,-122.4194', '37.7849,-122.4094') + \
+        main.get_directions('37.7749,-122.4194', '37.7549,-122.4294')
+    directions = main.decode_polylines(main.in_time_directions(directions, 900))
+    directions = main.get_waypoints_for_poi(main.get_near_poi_polylines(directions, 1000, place_type=['cafe', 'store']))
+    assert any('all_destinations' in direction for direction in directions)
+    directions[0].pop('all_destinations', None) # a route without destinations
+    directions[-1]['all_destinations'] = directions[-1]['all_destinations'][:1] + [
+        dict(route, rating_n=0) for route in directions[-1]['all_destinations'][1:3]] # unrated places are not scored
+
+    for add_no_stop in (False, True):
+        for tracking_interval in (600, 900):
+            got = main.potential_visit_poi(copy.deepcopy(directions), tracking_interval, add_no_stop=add_no_stop)
+            expected = get_old_scores(copy.deepcopy(directions), tracking_interval, add_no_stop)
+            for new, old in zip(got, expected):
+                assert [route['place_id'] for route in new.get('all_destinations', [])] == \
+                       [route['place_id'] for route in old.get('all_destinations', [])]
+                for key in ('probabilities', 'normal_prob', 'direction_entropy', 'no_stop_prob'):
+                    assert np.shape(new[key]) == np.shape(old[key]) and np.allclose(new[key], old[key], rtol=1e-12, atol=0), key
+                for new_route, old_route in zip(new.get('all_destinations', []), old.get('all_destinations', [])):
+                    assert np.allclose([new_route['dist_data'][key] for key in ('mean', 'std', 'zscore', 'probab')],
+                                       [old_route['dist_data'][key] for key in ('mean', 'std', 'zscore', 'probab')],
+                                       rtol=1e-12, atol=0)
@@ -0,0 +1,67 @@
+import numpy as np
+
+import provider
+import stagecache
+
+
+def test_key_depends_on_input_and_salt():
+    cache = stagecache.StageCache()
+    key = cache.key('stage', ([1, 2], np.arange(10)), {'interval': 600})
+
+    assert key == cache.key('stage', ([1, 2], np.arange(10)), {'interval': 600})
+    assert key != cache.key('stage', ([1, 2], np.arange(1, 11)), {'interval': 600})
+    assert key != cache.key('stage', ([1, 2], np.arange(10)), {'interval': 900})
+    assert key != cache.key('stage', ([1, 2], np.arange(10)), {'interval': 600}, salt='2')
+
+
+def test_files_are_keyed_by_size_and_mtime(tmp_path):
+    path = tmp_path / 'new_cab.txt'
+    path.write_text('37.7 -122.4 1 1211018404\n')
+    cache = stagecache.StageCache()
+    key = cache.key('load', (str(path),))
+
+    path.write_text('37.7 -122.4 1 1211018404\n37.8 -122.4 0 1211018464\n')
+
+    assert key != cache.key('load', (str(path),))
+
+
+def test_cached_stage_is_kept_per_provider(tmp_path):
+    directory, enabled = stagecache.default_cache.directory, stagecache.default_cache.enabled
+    stagecache.configure(directory=str(tmp_path), enabled=True)
+    previous = provider.get_provider()
+    calls = []
+
+    @stagecache.cached('test_stage', uses_provider=True)
+    def stage(value):
+        calls.append(value)
+        return value * 2
+
+    try:
+        provider.set_provider(provider.LocalProvider(speed=5.0), cache=False)
+        assert stage(2) == 4 and stage(2) == 4
+        provider.set_provider(provider.LocalProvider(speed=20.0), cache=False)
+        assert stage(2) == 4
+    finally:
+        provider.set_provider(previous, cache=False)
+        stagecache.configure(directory=directory, enabled=enabled)
+
+    assert len(calls) == 2
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = stagecache.StageCache(str(tmp_path))
+    key = cache.key('stage', (1,))
+    cache.put(key, {'value': 1})
+    with open(cache.path(key), 'wb') as cache_file:
+        cache_file.write(b'\x80\x04\x95garbage')
+
+    assert cache.get(key) == (False, None)
+    assert cache.get(key) == (False, None)
+
+
+def test_lru_eviction_keeps_disk_budget(tmp_path):
+    cache = stagecache.StageCache(str(tmp_path), max_bytes=3000)
+    for i in range(10):
+        cache.put(cache.key('stage', (i,)), bytes(1000))
+
+    assert sum(path.stat().st_size for path in tmp_path.glob('*.temp')) <= 3000
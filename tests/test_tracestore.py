@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+import benchmark
+import dsparse
+import tracestore
+
+
+def test_store_traces_equal_parsed_traces(tmp_path):
+    files = benchmark.generate_dataset(str(tmp_path / 'data'), cabs=3, points=200)
+    store = tracestore.open_store(files, str(tmp_path / 'traces'))
+
+    for filename in files:
+        parsed = dsparse.parse_trace(filename)
+        stored = store.get(tracestore.get_cab(filename))
+        for column in ('lat', 'lon', 'busy', 'time'):
+            assert np.array_equal(getattr(parsed, column), getattr(stored, column))
+
+
+def test_load_uses_rebuilt_store(tmp_path, monkeypatch):
+    files = benchmark.generate_dataset(str(tmp_path / 'data'), cabs=2, points=100)
+    directory = str(tmp_path / 'traces')
+    tracestore.open_store(files, directory)
+    assert len(tracestore.load(files[0], directory)) == 100
+
+    benchmark.generate_trace(files[0], points=150, seed=7)
+    tracestore.open_store(files, directory)
+    parsed = []
+    monkeypatch.setattr(dsparse, 'load_trace', lambda filename: parsed.append(filename))
+
+    trace = tracestore.load(files[0], directory)
+
+    assert len(trace) == 150 and not parsed
+
+
+def test_traces_are_views_of_the_data_file(tmp_path):
+    files = benchmark.generate_dataset(str(tmp_path / 'data'), cabs=2, points=100)
+    store = tracestore.open_store(files, str(tmp_path / 'traces'))
+
+    window = store.get_window('new_cab0001', 0, 2**62)[10:20]
+
+    for column in ('lat', 'lon', 'busy', 'time'):
+        assert isinstance(getattr(window, column), np.memmap)
+        assert not getattr(window, column).flags.owndata
+
+
+def test_changed_file_is_not_fresh(tmp_path, monkeypatch):
+    files = benchmark.generate_dataset(str(tmp_path / 'data'), cabs=2, points=100)
+    directory = str(tmp_path / 'traces')
+    store = tracestore.open_store(files, directory)
+    assert store.is_fresh(files[0]) and store.is_fresh(files[1])
+
+    benchmark.generate_trace(files[0], points=120, seed=3)
+    parsed = []
+    monkeypatch.setattr(dsparse, 'load_trace', lambda filename: parsed.append(filename) or dsparse.parse_trace(filename))
+
+    assert not store.is_fresh(files[0]) and store.is_fresh(files[1])
+    assert len(tracestore.load(files[0], directory)) == 120 and parsed == [files[0]]
+    assert len(tracestore.load(files[1], directory)) == 100 and parsed == [files[0]]
+
+
+def test_same_cab_name_in_two_directories_is_rejected(tmp_path):
+    files = (benchmark.generate_dataset(str(tmp_path / 'one'), cabs=1, points=50) +
+             benchmark.generate_dataset(str(tmp_path / 'two'), cabs=1, points=60, seed=1))
+
+    with pytest.raises(ValueError):
+        tracestore.open_store(files, str(tmp_path / 'traces'))
+
+
+def count_parsed(monkeypatch):
+    parsed = []
+    parse_trace = dsparse.parse_trace
+    monkeypatch.setattr(dsparse, 'parse_trace', lambda filename: parsed.append(filename) or parse_trace(filename))
+    return parsed
+
+
+def test_only_new_and_changed_files_are_parsed(tmp_path, monkeypatch):
+    files = benchmark.generate_dataset(str(tmp_path / 'data'), cabs=4, points=100)
+    directory = str(tmp_path / 'traces')
+    tracestore.open_store(files[:3], directory)
+    parsed = count_parsed(monkeypatch)
+
+    store = tracestore.open_store(files, directory)
+    assert parsed == [files[3]]
+    benchmark.generate_trace(files[1], points=150, seed=5)
+    store = tracestore.open_store(files, directory)
+    assert parsed == [files[3], files[1]]
+    tracestore.open_store(files, directory)
+    assert parsed == [files[3], files[1]]
+
+    for filename in files:
+        expected = dsparse.parse_trace(filename)
+        assert np.array_equal(store.get(tracestore.get_cab(filename)).time, expected.time)
+        assert np.array_equal(store.get(tracestore.get_cab(filename)).lat, expected.lat)
+
+
+def test_replaced_traces_are_compacted(tmp_path, monkeypatch):
+    files = benchmark.generate_dataset(str(tmp_path / 'data'), cabs=3, points=100)
+    directory = str(tmp_path / 'traces')
+    tracestore.open_store(files, directory)
+    parsed = count_parsed(monkeypatch)
+
+    for seed in range(2 * tracestore.MAX_SEGMENTS):
+        benchmark.generate_trace(files[seed % 2], points=100 + seed, seed=seed)
+        store = tracestore.open_store(files, directory)
+
+    assert len(parsed) == 2 * tracestore.MAX_SEGMENTS # kept traces are copied, not parsed
+    assert len(store.segments) < tracestore.MAX_SEGMENTS
+    assert sorted(os.listdir(directory)) == sorted(list(store.segments) + [tracestore.INDEX_NAME])
+    stored = sum(segment['points'] for segment in store.index['segments'].values())
+    assert stored <= 2 * sum(len(store.get(cab)) for cab in store.cabs())
+    for filename in files:
+        assert np.array_equal(store.get(tracestore.get_cab(filename)).lon, dsparse.parse_trace(filename).lon)
@@ -0,0 +1,243 @@
+"""Memory-mapped binary store of cabspotting traces for CSPrivacy application
+https://github.com/ashxz47/CSPrivacy/.
+
+Trace files are parsed and sorted once and saved as binary data files of columns
+(time, lat, lon, busy of cabs one after another) and a JSON index with the data file, offsets
+and time ranges of each cab and path/size/mtime of source files. Later runs open the columns with np.memmap,
+so traces are sliced without parsing and copying, and worker processes share the same pages.
+Files that are new or changed are parsed and appended as a new data file, other cabs are not touched,
+data files are rewritten into one (without parsing) when most of their points belong to replaced traces.
+A cab is named by its file name without extension, files with the same name in different directories are rejected.
+
+Usage:
+    store = tracestore.open_store(iowork.read_all_files(), 'temp/traces')  # built on the first run, updated later
+    trace = store.get('new_abc')                                       # dsparse.Trace of memory-mapped columns
+    window = store.get_window('new_abc', 1211018404, 1211022004)
+
+License: MIT
+"""
+
+import dsparse
+
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+
+INDEX_NAME = 'index.json'
+COLUMNS = (('time', np.int64), ('lat', np.float64), ('lon', np.float64), ('busy', np.bool_))
+MAX_SEGMENTS = 16 # data files of the store, more are rewritten into one
+
+
+class TraceStore:
+    """read-only traces of the store in 'directory'"""
+
+    def __init__(self, directory='temp/traces'):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_NAME), 'r') as index_file:
+            self.index = json.load(index_file)
+        self.segments = {} # data file name -> {column name: memory-mapped column}
+        for data_name, segment in self.index['segments'].items():
+            path = os.path.join(directory, data_name)
+            self.segments[data_name] = {name: np.memmap(path, dtype=dtype, mode='r', offset=segment['columns'][name],
+                                                        shape=(segment['points'],))
+                                        if segment['points'] else np.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
+
+    def __len__(self):
+        return len(self.index['cabs'])
+
+    def __contains__(self, cab):
+        return cab in self.index['cabs']
+
+    def cabs(self):
+        return list(self.index['cabs'])
+
+    def get(self, cab):
+        """Trace of the cab, columns are views of the memory-mapped file"""
+
+        entry = self.index['cabs'][cab]
+        columns = self.segments[entry['data']]
+        start, end = entry['range']
+
+        return dsparse.Trace(columns['lat'][start:end], columns['lon'][start:end],
+                             columns['busy'][start:end], columns['time'][start:end], cab)
+
+    def get_window(self, cab, start_time, end_time):
+        """Trace of the cab points with start_time <= time < end_time"""
+
+        trace = self.get(cab)
+        start, end = np.searchsorted(trace.time, [start_time, end_time], side='left')
+
+        return trace[int(start):int(end)]
+
+    def is_fresh(self, filename):
+        """True if the store has the file and the file was not changed after the store was built"""
+
+        return get_cab(filename) in self.index['cabs'] and self.is_known(filename)
+
+    def is_known(self, filename):
+        """True if the file was not changed after the store was built, files that could not be parsed are known too"""
+
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return False
+
+        return self.index['sources'].get(get_cab(filename)) == get_source(filename, stat)
+
+
+def get_cab(filename):
+    """cab name of the trace file: file name without extension"""
+
+    return os.path.basename(filename).rsplit('.', 1)[0]
+
+
+def get_source(filename, stat):
+    """[absolute path, size, mtime] of the trace file as it is saved in the index"""
+
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+def check_cabs(files):
+    """raise ValueError if two files have the same cab name, the store keeps one trace for each cab name"""
+
+    paths = {}
+    for filename in files:
+        cab = get_cab(filename)
+        path = os.path.abspath(filename)
+        if paths.setdefault(cab, path) != path:
+            raise ValueError("Trace files {} and {} have the same cab name '{}'".format(paths[cab], path, cab))
+
+
+def build(files, directory='temp/traces'):
+    """parse and sort all files, save their columns and the index, return the opened store"""
+
+    return update(files, directory, rebuild=True)
+
+
+def update(files, directory='temp/traces', rebuild=False):
+    """parse files that are new or changed since the store was saved and append their columns to the store
+    as a new data file, traces of other cabs are kept where they are, return the opened store
+        rebuild: parse all files, traces of cabs that are not in files are dropped"""
+
+    start_time = time.time()
+    files = sorted(files)
+    check_cabs(files)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    store = None
+    if not rebuild:
+        try:
+            store = TraceStore(directory)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+    if store is None:
+        index = {'segments': {}, 'cabs': {}, 'sources': {}}
+    else:
+        index = store.index
+    changed = [filename for filename in files if store is None or not store.is_known(filename)]
+
+    traces = {}
+    for filename in changed:
+        cab = get_cab(filename)
+        index['sources'][cab] = get_source(filename, os.stat(filename))
+        index['cabs'].pop(cab, None) # the previous trace of the file is dropped also if the file can't be parsed now
+        try:
+            traces[cab] = dsparse.parse_trace(filename)
+        except ValueError as err:
+            print("WARNING! {} is not added to the trace store: {}".format(filename, err))
+
+    # data files of earlier updates are rewritten into one only when most of their points are dropped
+    # or there are too many of them, kept traces are copied from the mapped columns without parsing
+    kept = sum(entry['range'][1] - entry['range'][0] for entry in index['cabs'].values())
+    stored = sum(segment['points'] for segment in index['segments'].values())
+    if stored > 2 * kept or len(index['segments']) >= MAX_SEGMENTS:
+        traces.update((cab, store.get(cab)) for cab in index['cabs'])
+        index['cabs'] = {}
+    if traces:
+        data_name, segment, ranges = write_segment(directory, [traces[cab] for cab in sorted(traces)])
+        index['segments'][data_name] = segment
+        for cab, points in zip(sorted(traces), ranges):
+            trace = traces[cab]
+            index['cabs'][cab] = {'data': data_name, 'range': points,
+                                  'time_range': [int(trace.time[0]), int(trace.time[-1])] if len(trace) else [0, 0]}
+    used = {entry['data'] for entry in index['cabs'].values()}
+    index['segments'] = {data_name: segment for data_name, segment in index['segments'].items() if data_name in used}
+
+    index_path = os.path.join(directory, INDEX_NAME)
+    with open(index_path + '.part', 'w') as index_file:
+        json.dump(index, index_file)
+    os.replace(index_path + '.part', index_path) # the index is switched to the new data files atomically
+    for key in [key for key in _opened if key[0] == directory]: # stores opened by load() map the old index
+        del _opened[key]
+    store = None
+    for entry in os.listdir(directory): # data files that are not used by the index
+        if entry.startswith('traces_') and entry.endswith('.bin') and entry not in index['segments']:
+            # on POSIX other processes that mapped the old file keep reading it until they close it,
+            # on Windows a mapped file can't be removed, it is removed by a later update
+            try:
+                os.remove(os.path.join(directory, entry))
+            except OSError as err:
+                print("WARNING! Old data file of the trace store is not removed: {!r}".format(err))
+    print("Trace store of {} cabs updated in {:.2f} seconds, {} of {} files parsed".format(
+        len(index['cabs']), time.time() - start_time, len(changed), len(files)))
+
+    return TraceStore(directory)
+
+
+def write_segment(directory, traces):
+    """save columns of traces one after another to a new data file,
+    return its name, {'points': n, 'columns': offsets} and [start, end] of each trace"""
+
+    data_name = 'traces_{}.bin'.format(uuid.uuid4().hex[:12])
+    offsets = {}
+    with open(os.path.join(directory, data_name), 'wb') as data_file:
+        for name, dtype in COLUMNS:
+            offsets[name] = data_file.tell()
+            for trace in traces:
+                np.ascontiguousarray(getattr(trace, name), dtype=dtype).tofile(data_file)
+            data_file.write(b'\0' * (-data_file.tell() % 8)) # keep the next column aligned
+    bounds = np.cumsum([0] + [len(trace) for trace in traces]).tolist()
+
+    return data_name, {'points': bounds[-1], 'columns': offsets}, [list(pair) for pair in zip(bounds[:-1], bounds[1:])]
+
+
+def open_store(files=None, directory='temp/traces'):
+    """open the store, files that are new or changed are parsed and added to it (see update())"""
+
+    try:
+        store = TraceStore(directory)
+    except (FileNotFoundError, ValueError, KeyError):
+        store = None
+    if files is None:
+        if store is None:
+            raise FileNotFoundError("No trace store in '{}'".format(directory))
+        return store
+    files = list(files)
+    if store is None or not all(store.is_known(filename) for filename in files):
+        store = update(files, directory)
+
+    return store
+
+
+_opened = {} # (directory, pid) -> TraceStore, each process maps the store once
+
+
+def load(filename, directory=None):
+    """Trace of the file from the store in 'directory' if it is fresh there, otherwise parsed by dsparse.load_trace()"""
+
+    if directory is not None:
+        key = (directory, os.getpid())
+        if key not in _opened:
+            try:
+                _opened[key] = TraceStore(directory)
+            except (FileNotFoundError, ValueError, KeyError):
+                _opened[key] = None
+        store = _opened[key]
+        if store is not None and store.is_fresh(filename):
+            return store.get(get_cab(filename))
+
+    return dsparse.load_trace(filename)